@@ -20,7 +20,43 @@ REMEMBER_COOKIE_DOMAIN = '127.0.0.1'
 
 ZODB_STORAGE = 'zeo://localhost:9100'
 
+# ZODB connections kept open per process, and the objects (and bytes) each
+# one caches
+ZODB_POOL_SIZE = 7
+ZODB_CACHE_SIZE = 10000
+ZODB_CACHE_SIZE_BYTES = '128MB'
+
+# Size of the ZEO client cache, shared by the connections of a process.
+ZEO_CACHE_SIZE = '64MB'
+# Kept in memory: a persistent cache file (ZEO_CLIENT, in ZEO_CACHE_DIR)
+# can only be opened by one process at a time, and scripts share this config
+ZEO_CLIENT = None
+
+# Root entries whose objects are loaded when a server process starts (see
+# server.wsgi), up to ZODB_WARM_LIMIT objects
+ZODB_WARM_ROOTS = ('worlds', 'players', 'grid')
+ZODB_WARM_LIMIT = 10000
+
+JOB_RUNNER = 'process'
+
 REDIS_HOST = 'localhost'
 #REDIS_PASSWORD = 'password'
 REDIS_PORT = 6379
 REDIS_DATABASE = 0
+
+# Where rate limit hits are counted. See server/ratelimit.py
+RATE_LIMIT_STORE = 'memory'
+
+# IDs each process reserves at once from a uid counter, so that creating
+# things doesn't conflict on it. See equanimity/db.py
+AUTO_ID_BLOCK_SIZE = 100
+
+# Retries of an RPC whose transaction conflicts, waiting from
+# TRANSACTION_BACKOFF up to TRANSACTION_MAX_BACKOFF seconds between them.
+# Beyond TRANSACTION_RETRY_RESERVE, only TRANSACTION_RETRY_RATIO retries per
+# call are allowed. See server/transactions.py
+TRANSACTION_RETRIES = 3
+TRANSACTION_BACKOFF = 0.01
+TRANSACTION_MAX_BACKOFF = 0.5
+TRANSACTION_RETRY_RATIO = 0.2
+TRANSACTION_RETRY_RESERVE = 20
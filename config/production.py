@@ -17,3 +17,42 @@ BCRYPT_LOG_ROUNDS = 12
 REMEMBER_COOKIE_DOMAIN = SESSION_COOKIE_DOMAIN
 
 ZODB_STORAGE = 'zeo://localhost:9100'
+
+# ZODB connections kept open per process, and the objects (and bytes) each
+# one caches
+ZODB_POOL_SIZE = 7
+ZODB_CACHE_SIZE = 10000
+ZODB_CACHE_SIZE_BYTES = '256MB'
+
+# Size of the ZEO client cache, shared by the connections of a process.
+# It is kept in a file per uwsgi worker, named ZEO_CLIENT-<worker id>, in
+# ZEO_CACHE_DIR, so that it survives restarts. Jobs forked from a worker
+# keep theirs in memory
+ZEO_CACHE_SIZE = '512MB'
+ZEO_CACHE_DIR = '/var/www/zeo/cache'
+ZEO_CLIENT = 'equanimity'
+
+# Root entries whose objects are loaded when a server process starts (see
+# server.wsgi), up to ZODB_WARM_LIMIT objects
+ZODB_WARM_ROOTS = ('worlds', 'players', 'grid')
+ZODB_WARM_LIMIT = 50000
+
+JOB_RUNNER = 'process'
+
+# Count rate limit hits in a cache shared by the uwsgi workers, which uwsgi
+# must be started with: --cache2 name=ratelimit,items=10000,bitmap=1
+RATE_LIMIT_STORE = 'uwsgi'
+
+# IDs each process reserves at once from a uid counter, so that creating
+# things doesn't conflict on it. See equanimity/db.py
+AUTO_ID_BLOCK_SIZE = 100
+
+# Retries of an RPC whose transaction conflicts, waiting from
+# TRANSACTION_BACKOFF up to TRANSACTION_MAX_BACKOFF seconds between them.
+# Beyond TRANSACTION_RETRY_RESERVE, only TRANSACTION_RETRY_RATIO retries per
+# call are allowed. See server/transactions.py
+TRANSACTION_RETRIES = 3
+TRANSACTION_BACKOFF = 0.01
+TRANSACTION_MAX_BACKOFF = 0.5
+TRANSACTION_RETRY_RATIO = 0.2
+TRANSACTION_RETRY_RESERVE = 20
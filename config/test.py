@@ -18,3 +18,13 @@ REDIS_PORT = 6379
 REDIS_DATABASE = 7
 
 DEBUG_LOGGING = False
+
+# Build worlds in the request that starts them
+JOB_RUNNER = 'inline'
+
+# Hand out sequential IDs
+AUTO_ID_BLOCK_SIZE = 1
+
+# Retry conflicting RPCs without waiting
+TRANSACTION_RETRIES = 3
+TRANSACTION_BACKOFF = 0
@@ -0,0 +1,222 @@
+"""
+balance.py
+
+Monte Carlo balance sweeps. Plays many simulated battles between generated
+squads over a process pool, appends one row per battle to a columnar store
+on disk, and aggregates win rates by element, weapon type and squad value.
+"""
+import os
+import json
+from array import array
+from functools import partial
+from itertools import izip
+from multiprocessing import Pool
+from const import ELEMENTS, WEP_LIST
+from simulator import Simulator
+from unit_container import rand_squad, max_squad_by_value
+from weapons import rand_weapon
+from helpers import rng
+
+
+SIDES = ('atk', 'def')
+
+# Winner column values
+ATTACKER, DEFENDER, DRAW = 1, 0, -1
+
+
+def max_squad(owner=None, min_value=16, max_value=255):
+    """ Returns a max_squad_by_value squad of a random value, with each
+    unit equipped with a random weapon of its element """
+    squad = max_squad_by_value(rng().randint(min_value, max_value))
+    for unit in squad:
+        unit.equip(rand_weapon(element=unit.element,
+                               max_value=unit.value // 2))
+    squad.owner = owner
+    return squad
+
+
+def make_squad_factory(kind, size=4, max_value=255):
+    """ Returns a squad factory for the simulator. max squads always have
+    one unit of each element, whatever the size. """
+    if kind == 'rand':
+        return partial(rand_squad, size=size, equip=True, max_value=max_value)
+    elif kind == 'max':
+        return partial(max_squad, max_value=max_value)
+    raise ValueError('Unknown squad kind {0}'.format(kind))
+
+
+def get_columns():
+    """ Returns (name, typecode) for each column of the store """
+    columns = [('seed', 'l'), ('winner', 'b'), ('actions', 'l')]
+    for side in SIDES:
+        columns.append(('{0}_value'.format(side), 'l'))
+        for name in ELEMENTS + WEP_LIST:
+            columns.append(('{0}_{1}'.format(side, name.lower()), 'B'))
+    return columns
+
+
+COLUMNS = get_columns()
+
+
+def result_row(result):
+    """ Flattens a BattleResult into a row of column values """
+    winner = DRAW
+    if result.winner == 'attacker':
+        winner = ATTACKER
+    elif result.winner == 'defender':
+        winner = DEFENDER
+    row = [result.seed, winner, result.actions]
+    for squad in (result.attacker, result.defender):
+        row.append(squad['value'])
+        row.extend(squad['elements'].count(e) for e in ELEMENTS)
+        row.extend(squad['weapons'].count(w) for w in WEP_LIST)
+    return row
+
+
+class ColumnStore(object):
+
+    """ A directory holding one binary array file per column, plus the
+    parameters of the sweep that wrote it. Rows are appended in seed
+    order; a partially written row is dropped when the store is opened. """
+
+    meta_name = 'meta.json'
+
+    def __init__(self, path, meta=None):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        meta_path = os.path.join(path, self.meta_name)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                stored = json.load(f)
+            if meta is not None and stored != meta:
+                msg = 'Store {0} was written with different parameters'
+                raise ValueError(msg.format(path))
+            meta = stored
+        elif meta is not None:
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f, sort_keys=True)
+        self.meta = meta
+        self.rows = self._truncate()
+
+    def _column_path(self, name):
+        return os.path.join(self.path, name + '.col')
+
+    def _truncate(self):
+        """ Cuts every column down to the number of complete rows, and
+        returns that number """
+        sizes = []
+        for name, code in COLUMNS:
+            p = self._column_path(name)
+            size = 0
+            if os.path.exists(p):
+                size = os.path.getsize(p) // array(code).itemsize
+            sizes.append(size)
+        rows = min(sizes)
+        for name, code in COLUMNS:
+            with open(self._column_path(name), 'ab') as f:
+                f.truncate(rows * array(code).itemsize)
+        return rows
+
+    def append(self, rows):
+        """ Appends rows, given as sequences in COLUMNS order """
+        if not rows:
+            return
+        for i, (name, code) in enumerate(COLUMNS):
+            with open(self._column_path(name), 'ab') as f:
+                array(code, (row[i] for row in rows)).tofile(f)
+        self.rows += len(rows)
+
+    def column(self, name):
+        code = dict(COLUMNS)[name]
+        data = array(code)
+        with open(self._column_path(name), 'rb') as f:
+            data.fromfile(f, self.rows)
+        return data
+
+    def summarize(self, bracket=64):
+        """ Returns win rates as {group: {key: (wins, battles)}}, where a
+        unit counts towards its element and weapon, and a squad towards its
+        value bracket. Draws count as battles without a win. """
+        winner = self.column('winner')
+        groups = dict(element={}, weapon={}, value={}, side={})
+        for side, won in zip(SIDES, (ATTACKER, DEFENDER)):
+            wins = [w == won for w in winner]
+            for group, names in (('element', ELEMENTS),
+                                 ('weapon', WEP_LIST)):
+                for name in names:
+                    col = self.column('{0}_{1}'.format(side, name.lower()))
+                    self._add(groups[group], name, col, wins)
+            values = self.column('{0}_value'.format(side))
+            for value, w in izip(values, wins):
+                key = (value // bracket) * bracket
+                total = groups['value'].get(key, (0, 0))
+                groups['value'][key] = (total[0] + w, total[1] + 1)
+            groups['side'][side] = (sum(wins), self.rows)
+        return groups
+
+    def _add(self, group, key, counts, wins):
+        won = sum(c for c, w in izip(counts, wins) if w)
+        total = group.get(key, (0, 0))
+        group[key] = (total[0] + won, total[1] + sum(counts))
+
+
+_simulator = None
+
+
+def _init_worker(meta):
+    global _simulator
+    _simulator = make_simulator(meta)
+
+
+def _run_chunk((start, stop)):
+    return [result_row(r) for r in _simulator.run(xrange(start, stop))]
+
+
+def make_simulator(meta):
+    """ Creates the Simulator described by the sweep parameters """
+    return Simulator(
+        attacker=make_squad_factory(meta['attacker'], size=meta['size'],
+                                    max_value=meta['max_value']),
+        defender=make_squad_factory(meta['defender'], size=meta['size'],
+                                    max_value=meta['max_value']),
+        grid_radius=meta['grid_radius'], max_actions=meta['max_actions'])
+
+
+def sweep_meta(attacker='rand', defender='rand', size=4, max_value=255,
+               grid_radius=8, max_actions=2000, seed=0):
+    """ Returns the sweep parameters stored with the results """
+    for kind in (attacker, defender):
+        make_squad_factory(kind)
+    return dict(attacker=attacker, defender=defender, size=size,
+                max_value=max_value, grid_radius=grid_radius,
+                max_actions=max_actions, seed=seed)
+
+
+def run_sweep(path, battles, processes=None, chunk_size=100, **kwargs):
+    """ Plays battles until the store at path holds the requested number,
+    resuming after the rows already written. Returns the store. """
+    meta = sweep_meta(**kwargs)
+    store = ColumnStore(path, meta=meta)
+    start = meta['seed'] + store.rows
+    stop = meta['seed'] + battles
+    chunks = [(i, min(i + chunk_size, stop))
+              for i in xrange(start, stop, chunk_size)]
+    if not chunks:
+        return store
+    if processes == 1:
+        _init_worker(meta)
+        for chunk in chunks:
+            store.append(_run_chunk(chunk))
+        return store
+    pool = Pool(processes=processes, initializer=_init_worker,
+                initargs=(meta,))
+    try:
+        # imap keeps the chunks in seed order, so the store can be resumed
+        # from its row count
+        for rows in pool.imap(_run_chunk, chunks):
+            store.append(rows)
+    finally:
+        pool.terminate()
+        pool.join()
+    return store
@@ -14,6 +14,7 @@ from datetime import timedelta
 from persistent import Persistent
 from persistent.list import PersistentList
 from persistent.mapping import PersistentMapping
+from BTrees.IOBTree import IOBTree
 from operator import attrgetter
 from functools import partial
 
@@ -124,7 +125,7 @@ class Log(PersistentKwargs):
         self.messages = PersistentList()
         self.start_time = now()
         self.owners = None
-        self.states = PersistentList()  # Does this really need to be here?
+        self.states = StateLog()
         self.winner = None
         self.world_coords = None  # set by battle_server
         self.owners = self.get_owners()
@@ -194,6 +195,105 @@ class Log(PersistentKwargs):
         return (action.when - start > PLY_TIME)
 
 
+class StateLog(Persistent):
+
+    """History of the battle's states, keyed by action number.
+    An entry only stores the hps, locs and queued damage that changed since
+    the previous entry, plus a full keyframe every keyframe_interval
+    entries."""
+
+    keyframe_interval = 16
+    counters = ('pass_count', 'hp_count', 'old_defsquad_hp', 'game_over',
+                'whose_action')
+    mappings = ('hps', 'locs', 'queued')
+
+    def __init__(self):
+        super(StateLog, self).__init__()
+        self.entries = IOBTree()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def append(self, state):
+        full = self._encode(state)
+        last = self._last()
+        if (last is None or state.num <= last[0] or
+                last[2] + 1 >= self.keyframe_interval):
+            entry = dict(keyframe=True, changed=full[1], removed={})
+            since = 0
+        else:
+            entry = self._diff(last[1][1], full[1])
+            since = last[2] + 1
+        entry['counters'] = full[0]
+        self.entries[state.num] = entry
+        self._v_last = (state.num, full, since)
+
+    def get(self, num):
+        """Returns the state recorded at action num, or the last one
+        recorded before it, as a dict of State's attributes.
+        Returns None if nothing was recorded by then."""
+        found = self._rebuild(num)
+        if found is None:
+            return
+        num, (counters, mappings), _ = found
+        data = dict(counters, num=num)
+        data.update(mappings)
+        return data
+
+    def _encode(self, state):
+        counters = dict((k, getattr(state, k)) for k in self.counters)
+        mappings = dict(hps=dict(state.hps), locs=dict(state.locs))
+        # Queued damage ticks are mutated in place by the battlefield
+        mappings['queued'] = dict((k, [list(d) for d in v])
+                                  for k, v in state.queued.iteritems())
+        return counters, mappings
+
+    def _diff(self, old, new):
+        changed = {}
+        removed = {}
+        for m in self.mappings:
+            o = old[m]
+            n = new[m]
+            c = dict((k, v) for k, v in n.iteritems()
+                     if k not in o or o[k] != v)
+            if c:
+                changed[m] = c
+            r = [k for k in o if k not in n]
+            if r:
+                removed[m] = r
+        return dict(keyframe=False, changed=changed, removed=removed)
+
+    def _last(self):
+        last = getattr(self, '_v_last', None)
+        if last is None and self.entries:
+            last = self._v_last = self._rebuild(self.entries.maxKey())
+        return last
+
+    def _rebuild(self, num):
+        """Returns (num, (counters, mappings), entries since keyframe) for
+        the last entry at or before num, or None"""
+        try:
+            found = key = self.entries.maxKey(num)
+        except ValueError:
+            return
+        # Walk back to the closest keyframe
+        chain = [self.entries[key]]
+        while not chain[-1]['keyframe']:
+            key = self.entries.maxKey(key - 1)
+            chain.append(self.entries[key])
+        mappings = dict((m, {}) for m in self.mappings)
+        for entry in reversed(chain):
+            for m, changed in entry['changed'].iteritems():
+                mappings[m].update(changed)
+            for m, removed in entry['removed'].iteritems():
+                for k in removed:
+                    del mappings[m][k]
+        mappings['queued'] = dict((k, [list(d) for d in v])
+                                  for k, v in mappings['queued'].iteritems())
+        counters = dict(chain[0]['counters'])
+        return found, (counters, mappings), len(chain) - 1
+
+
 class State(PersistentKwargs):
 
     """A dictionary containing the current battle state."""
@@ -229,6 +329,16 @@ class State(PersistentKwargs):
             game_over=self.game_over,
         )
 
+    @classmethod
+    def restore(cls, battle, whose_action=None, **kwargs):
+        """ Recreates a recorded state, e.g. from StateLog.get """
+        s = cls.__new__(cls)
+        for k in StateLog.mappings:
+            kwargs[k] = PersistentMapping(kwargs[k])
+        super(State, s).__init__(battle=battle, whose_action=whose_action,
+                                 **kwargs)
+        return s
+
     def snapshot(self, battle):
         """ Creates a copy of self and battle and returns as a new state """
         # TODO -- need to copy battle and all of its descendants?
@@ -238,8 +348,15 @@ class State(PersistentKwargs):
     def check(self, battle):
         """Checks for battle ending conditions.
         (Assumes two players and no ActionQueue.)"""
+        last_type = battle.log.actions[self.num - 1].type
+        if self.count_action(battle, last_type):
+            return
+        self.record(battle)
+
+    def count_action(self, battle, last_type):
+        """Updates the counters for the action of type last_type at self.num.
+        Returns True if the battle ended."""
         num = self.num
-        last_type = battle.log.actions[num - 1].type
         if last_type == 'pass' or last_type == 'timed_out':
             self.pass_count += 1
         else:
@@ -256,28 +373,34 @@ class State(PersistentKwargs):
             # battle over check:
             if self.hp_count == 4:
                 battle.winner = battle.defender
-                return battle.end("Attacker failed to deal sufficent damage.")
+                battle.end("Attacker failed to deal sufficent damage.")
+                return True
             else:
                 self.old_defsquad_hp = defsquad_hp
 
         # check if battle is over.
         if battle.battlefield.defsquad.hp() == 0:
             battle.winner = battle.attacker
-            return battle.end("Defender's squad is dead")
+            battle.end("Defender's squad is dead")
+            return True
 
         if battle.battlefield.atksquad.hp() == 0:
             battle.winner = battle.defender
-            return battle.end("Attacker's squad is dead")
+            battle.end("Attacker's squad is dead")
+            return True
 
         if self.pass_count >= 8:
             battle.winner = battle.defender
-            return battle.end("Both sides passed")
+            battle.end("Both sides passed")
+            return True
+        return False
 
+    def record(self, battle):
+        """Stores a snapshot of the state and moves on to the next action."""
         self.queued = battle.map_queue()
         self.hps, self.locs = battle.update_unit_info()
 
-        new_state = self.snapshot(battle)
-        battle.log.states.append(new_state)
+        battle.log.states.append(self)
 
         # battle is not over, state is stored, update state.
         self.num += 1
@@ -296,6 +419,7 @@ class Battle(Persistent):
         self.attacker = attacker.owner
         self.battlefield = Battlefield(field.grid, field.element,
                                        field.stronghold.defenders, attacker)
+        self.battlefield.battle = self
         units = {unit.uid: unit for unit in self.battlefield.units}
         self.map = bidict(units)
         self.units = bidict(inverted(self.map))
@@ -397,6 +521,12 @@ class Battle(Persistent):
             action.unit = action.unit.uid
         return action
 
+    def state_at(self, num):
+        """ Returns the state as of action num, rebuilt from the log """
+        data = self.log.states.get(num)
+        if data is not None:
+            return State.restore(self, **data)
+
     def get_time_remaining_for_action(self):
         self._fill_timed_out_actions()
         return self.log.get_time_remaining_for_action()
@@ -404,16 +534,43 @@ class Battle(Persistent):
     def _fill_timed_out_actions(self):
         # Fills the action log with any needed timed_out actions since our
         # last check. It does not time out the current action we are checking
+        if self.state.game_over:
+            return
         when = self.log.get_last_terminating_action_time()
         # Compute how many timed out plies there should be
         diff = now() - when
-        missed_plies = diff.seconds / PLY_TIME.seconds
-        # Fill in 2 actions per missing ply
-        for i in xrange(missed_plies):
-            for j in xrange(2):
-                then = when + (i + 1) * PLY_TIME
-                act = Action(type='timed_out', when=then)
-                self._process_action(act)
+        missed_plies = int(diff.total_seconds()) / PLY_TIME.seconds
+        # Negative if when is ahead of the clock
+        if missed_plies > 0:
+            self._process_timeouts(when, missed_plies)
+
+    def _process_timeouts(self, when, plies):
+        """Records 2 timed_out actions per missed ply, the first ply
+        ending at when + PLY_TIME.
+        Timeouts count as passes, so the battle ends after at most 8 of them
+        and any remaining plies are dropped. Each action only updates the
+        state's counters (and ticks queued damage at the end of a turn);
+        the run is logged with one message and one state snapshot."""
+        state = self.state
+        total = 2 * plies
+        applied = []
+        for i in xrange(total):
+            num = state.num
+            then = when + (i / 2 + 1) * PLY_TIME
+            self.log.actions.append(Action(type='timed_out', when=then,
+                                           num=num))
+            if state.count_action(self, 'timed_out'):
+                break
+            if i == total - 1:
+                state.record(self)
+            else:
+                state.num += 1
+            if not num % 4:
+                applied.extend(self.battlefield.apply_queued())
+        self.log.messages.append(Message(num, [["Failed to act."]]))
+        if applied:
+            self.log.applied.append(Message(state.num,
+                                            self.map_result(applied)))
 
     def _process_action(self, action):
         num = self.state.num
@@ -646,5 +803,10 @@ class ActionQueue(object):
 
     @classmethod
     def _get_unit_queue(cls, battlefield):
-        return sorted(battlefield.living_units,
-                      key=partial(cls._get_unit_key, battlefield))
+        version = battlefield.turn_order_version
+        cached = battlefield.turn_order
+        if cached is None or cached[0] != version:
+            cached = battlefield.turn_order = (version, tuple(sorted(
+                battlefield.living_units,
+                key=partial(cls._get_unit_key, battlefield))))
+        return cached[1]
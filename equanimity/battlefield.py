@@ -7,9 +7,14 @@ Copyright (c) 2013 A. Frederick Dudley. All rights reserved.
 """contains battlefield objects"""
 from datetime import datetime
 from bidict import inverted
-from stone import Stone, Composition
+from stone import Stone
 from units import Scient, Nescient, Part
 from grid import Hex, HexCube
+from const import ELEMENTS
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 """
 Refactoring notes:
@@ -20,6 +25,14 @@ Replace ValueError with a custom exception
 
 class Battlefield(object):
     """contains grid, units and the logic for unit damage and movement."""
+
+    # The Battle whose record holds this battlefield, if any
+    battle = None
+
+    # Bumped whenever the turn order changes. It is stored with the battle,
+    # so the cached turn_order of other connections is dropped on reload.
+    turn_order_version = 0
+
     def __init__(self, grid, element, defsquad, atksquad):
         self.grid = grid
         self.graveyard = []
@@ -35,6 +48,21 @@ class Battlefield(object):
                     'Pyrocumulus')
         self.AOE = ('Wand', 'Avalanche', 'Icestorm', 'Blizzard', 'Permafrost')
         self.Full = ('Sword', 'Magma', 'Avalanche', 'Forestfire', 'Permafrost')
+        # (turn_order_version, living units in turn order), maintained by
+        # ActionQueue
+        self.turn_order = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['turn_order'] = None
+        return state
+
+    def invalidate_turn_order(self):
+        """ Must be called when a unit dies or its composition changes """
+        self.turn_order_version += 1
+        self.turn_order = None
+        if self.battle is not None:
+            self.battle._p_changed = True
 
     def get_units(self):
         """looks in squads, returns all units in squads."""
@@ -184,9 +212,7 @@ class Battlefield(object):
         xpos, ypos = location
         if weapon.type in self.ranged or weapon.type in self.AOE:
             move = 4
-            no_hit = self.grid.tiles_in_range(location, move)
-            hit = self.grid.tiles_in_range(location, 2 * move)
-            return hit - no_hit
+            return self.grid.tiles_in_range(location, 2 * move, exclude=move)
         else:
             return self.grid.get_adjacent(location)
 
@@ -242,35 +268,42 @@ class Battlefield(object):
 
     def dmg(self, atkr, defdr):
         """Calculates the damage of an attack"""
-        dloc = defdr.location
-        damage_dealt = Composition(0)
-        if not self.grid.in_bounds(dloc):
-            raise ValueError("Defender is off grid")
-
-        if atkr.weapon.kind == 'p':
-            for element in damage_dealt:
-                dmg = ((atkr.p + atkr.patk + (2 * atkr.comp[element]) +
-                        atkr.weapon.comp[element]) -
-                       (defdr.p + defdr.pdef + (2 * defdr.comp[element]) +
-                        self.grid.get(dloc).comp[element]))
-                dmg = max(dmg, 0)
-                damage_dealt[element] = dmg
-            damage = sum(damage_dealt.values())
-            return damage
+        return self.dmg_many(atkr, [defdr])[0]
+
+    def dmg_many(self, atkr, defdrs):
+        """Calculates the damage of an attack against each of defdrs.
+        Returns the damages in the same order as defdrs. Batches are
+        computed with numpy, when it is available."""
+        physical = (atkr.weapon.kind == 'p')
+        if physical:
+            base = atkr.p + atkr.patk
         else:
-            for element in damage_dealt:
-                dmg = ((atkr.m + atkr.matk + (2 * atkr.comp[element]) +
-                        atkr.weapon.comp[element]) -
-                       (defdr.m + defdr.mdef + (2 * defdr.comp[element]) +
-                        self.grid.get(dloc).comp[element]))
-                dmg = max(dmg, 0)
-                damage_dealt[element] = dmg
-
-            damage = sum(damage_dealt.values())
-            if atkr.element == defdr.element:
-                return -damage
+            base = atkr.m + atkr.matk
+        atk = [base + (2 * atkr.comp[e]) + atkr.weapon.comp[e]
+               for e in ELEMENTS]
+        defs = []
+        signs = []
+        for defdr in defdrs:
+            dloc = defdr.location
+            if not self.grid.in_bounds(dloc):
+                raise ValueError("Defender is off grid")
+            tile = self.grid.get(dloc).comp
+            if physical:
+                base = defdr.p + defdr.pdef
             else:
-                return damage
+                base = defdr.m + defdr.mdef
+            defs.append([base + (2 * defdr.comp[e]) + tile[e]
+                         for e in ELEMENTS])
+            # Magic heals units of the attacker's element
+            same = (not physical and atkr.element == defdr.element)
+            signs.append(-1 if same else 1)
+
+        if numpy is None or len(defs) < 2:
+            return [sign * sum(max(a - d, 0) for a, d in zip(atk, row))
+                    for row, sign in zip(defs, signs)]
+        damage = numpy.maximum(numpy.array(atk) - numpy.array(defs), 0)
+        damage = damage.sum(axis=1) * numpy.array(signs)
+        return [int(d) for d in damage]
 
     def calc_aoe(self, atkr, target):
         """Returns the AOE of a spell.
@@ -333,11 +366,10 @@ class Battlefield(object):
         # calculate how many units will be damaged.
         if weapon.type in self.AOE:
             pat = self.calc_aoe(atkr, target_loc)
-            targets = list(set(self.grid.occupied_coords()) & set(pat))
+            targets = self.grid.occupied_in(pat)
+            defdrs = [self.grid.get(t).contents for t in targets]
             area = len(pat)
-            for t in targets:
-                defdr = self.grid.get(t).contents
-                temp_dmg = self.dmg(atkr, defdr)
+            for defdr, temp_dmg in zip(defdrs, self.dmg_many(atkr, defdrs)):
                 # currently the only non-full, non-DOT AOE weapon
                 if weapon.type == 'Wand':
                     temp_dmg /= area
@@ -370,6 +402,7 @@ class Battlefield(object):
         unit.location = Hex.null
         del self.dmg_queue[unit]
         self.graveyard.append(unit)
+        self.invalidate_turn_order()
 
     def attack(self, atkr, target):
         """calls calc_damage, applies result, Handles death."""
@@ -394,7 +427,7 @@ class Battlefield(object):
     def apply_queued(self):
         """applies damage to targets stored in dmg_queue"""
         defdr_HPs = []
-        for unit, dmgs in self.dmg_queue.iteritems():
+        for unit, dmgs in self.dmg_queue.items():
             total = 0
             for n, dmg_tick in enumerate(dmgs):
                 total += dmg_tick[0]
@@ -402,6 +435,7 @@ class Battlefield(object):
             # Apply all damage we encountered this turn
             if total:
                 defdr_HPs.append([unit, self.apply_dmg(unit, total)])
-            # Filter out decayed DOT damage
-            self.dmg_queue[unit] = [x for x in dmgs if x[1] > 0]
+            # Filter out decayed DOT damage, unless the unit was buried
+            if unit in self.dmg_queue:
+                self.dmg_queue[unit] = [x for x in dmgs if x[1] > 0]
         return defdr_HPs
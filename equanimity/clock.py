@@ -5,6 +5,7 @@ Created by AFD on 2013-08-05.
 Copyright (c) 2013 A. Frederick Dudley. All rights reserved.
 """
 from persistent import Persistent
+from BTrees.OOBTree import OOBTree, OOTreeSet
 from helpers import now, timestamp
 from const import CLOCK, ELEMENTS, E, FIELD_PRODUCE, FIELD_YIELD
 
@@ -21,15 +22,70 @@ Field clock:
 """
 
 
+# Caps on the missed game days replayed by one catch up (a real day's
+# worth) and in each of its transactions
+CATCH_UP_MAX_DAYS = 360
+CATCH_UP_BATCH_DAYS = 30
+
+
+class FieldSchedule(Persistent):
+
+    """ Priority queue of the fields with pending work, ordered by the game
+    day the work is due. A field is queued at most once, at its earliest
+    due day. """
+
+    def __init__(self):
+        super(FieldSchedule, self).__init__()
+        # (day, coord) entries, in due order
+        self._queue = OOTreeSet()
+        # maps coord -> day
+        self._due = OOBTree()
+
+    def add(self, coord, day):
+        coord = tuple(coord)
+        prev = self._due.get(coord)
+        if prev is not None:
+            if prev <= day:
+                return
+            self._queue.remove((prev, coord))
+        self._due[coord] = day
+        self._queue.insert((day, coord))
+
+    def pop_due(self, day):
+        """ Removes and returns the coords due by day, earliest first """
+        # (day + 1,) sorts before every (day + 1, coord)
+        due = list(self._queue.keys(max=(day + 1,), excludemax=True))
+        for entry in due:
+            self._queue.remove(entry)
+            del self._due[entry[1]]
+        return [coord for d, coord in due]
+
+    def get(self, coord):
+        """ Returns the day the coord is due, or None """
+        return self._due.get(tuple(coord))
+
+    def __len__(self):
+        return len(self._due)
+
+    def __contains__(self, coord):
+        return tuple(coord) in self._due
+
+
 class WorldClock(Persistent):
 
+    # Clocks stored before the schedule existed process every field each
+    # day
+    schedule = None
+
     def __init__(self):
         self.dob = now()
         self._current = self.get_current_state()
+        self.schedule = FieldSchedule()
 
     def api_view(self):
         return dict(dob=timestamp(self.dob),
                     elapsed=self.elapsed,
+                    behind=self.behind,
                     state=self.get_current_state())
 
     @property
@@ -46,40 +102,80 @@ class WorldClock(Persistent):
         """ Returns the current computed clock interval values since dob """
         return {k: getattr(self, k) for k in CLOCK}
 
-    def tick(self, fields):
+    @property
+    def behind(self):
+        """ Number of game days that have passed without being processed """
+        return max(0, self.day - self._current['day'])
+
+    def tick(self, fields, max_days=None):
         """ Updates the clock state, and does necessary actions if the
         day or season changes.
         Call this at least once per game day (4 minutes).
 
         When this function is called, it will advance clocks if enough time
-        has elapsed.  Otherwise no action occurs
+        has elapsed.  Otherwise no action occurs. Days and seasons missed
+        since the last tick are replayed in order, at most max_days of them.
         """
-
-        '''
-        TODO -- this assumes the tick() will not skip any days
-        i.e. the process that calls this on time is not down, and there is
-        not a recurrent Exception being raised in this function's call stack
-
-        How should we handle that failure?
-            -- Consider the game paused
-            -- Fill in any missing days with default actions
-                (Might cause unpredictable results from a player's pov)
-        '''
+        for step in self.catch_up(fields, max_days=max_days, batch_days=None):
+            pass
+
+    def catch_up(self, fields, max_days=CATCH_UP_MAX_DAYS,
+                 batch_days=CATCH_UP_BATCH_DAYS):
+        """ Replays the day and season changes since the last tick in order,
+        at most max_days of them; the rest are left for the next call.
+        Yields (done, behind) after every batch_days days and at the end,
+        so that the caller can commit in between. """
         next = self.get_current_state()
-        if next['day'] > self._current['day']:
-            self.change_day(fields)
-        if next['season'] > self._current['season']:
-            self.change_season(fields)
-        self._current = next
-
-    def change_day(self, fields):
-        for field in fields.values():
+        first = self._current['day'] + 1
+        last = next['day']
+        if max_days is not None:
+            last = min(last, first + max_days - 1)
+        done = 0
+        for day in xrange(first, last + 1):
+            state = next
+            if day < next['day']:
+                state = self._get_state_at_day(day)
+            prev = self._current
+            # Fields processed today are rescheduled for the next day
+            self._current = state
+            self.change_day(fields, day)
+            if state['season'] > prev['season']:
+                self.change_season(fields)
+            done += 1
+            if batch_days and not done % batch_days and day < last:
+                yield done, self.behind
+        if last == next['day']:
+            self._current = next
+        yield done, self.behind
+
+    def schedule_field(self, coord):
+        """ Has the field at coord processed at the next day change """
+        if self.schedule is not None:
+            self.schedule.add(coord, self._current['day'] + 1)
+
+    def change_day(self, fields, day=None):
+        """ Processes the fields with work due by day, which defaults to the
+        current day """
+        if day is None:
+            day = self.day
+        if self.schedule is None:
+            due = fields.values()
+        else:
+            due = self.schedule.pop_due(day)
+            due = [fields[c] for c in due if c in fields]
+        for field in due:
             field.clock.change_day(field)
 
     def change_season(self, fields):
         for field in fields.values():
             field.clock.change_season()
 
+    def _get_state_at_day(self, day):
+        """ Returns the clock interval values at the start of a day """
+        elapsed = (day - 1) * int(CLOCK['day'].total_seconds())
+        return {k: 1 + (elapsed // int(v.total_seconds()))
+                for k, v in CLOCK.iteritems()}
+
     def _get_interval_value(self, interval):
         return 1 + (self.elapsed // int(CLOCK[interval].total_seconds()))
 
@@ -120,6 +216,9 @@ class FieldClock(Persistent):
         field.process_battle_and_movement()
         # Revert to the WorldPlayer if left empty
         field.check_ungarrisoned()
+        if not field.in_battle and field.queue.queue:
+            # More squads are waiting
+            field.schedule()
 
     def change_season(self):
         """ Move to the next season """
@@ -1,15 +1,236 @@
+import os
+import transaction
+from collections import deque
+from itertools import islice
+from threading import Lock
 from persistent import Persistent
+from ZODB.POSException import ConflictError
+from ZODB.ConflictResolution import PersistentReference
+from ZODB.broken import find_global as _find_global
+from stone import _reconstructor
+
+
+_missing = object()
+
+
+# Globals named by old pickles, and what to load in their place
+LEGACY_GLOBALS = {
+    # ZODB3 pickles with protocol 1, which saved the Compositions of when
+    # Composition was a dict as copy_reg._reconstructor(Composition, dict,
+    # values)
+    ('copy_reg', '_reconstructor'): _reconstructor,
+}
+
+
+def find_global(modulename, globalname):
+    """ Looks up a global named by a pickle, loading LEGACY_GLOBALS in place
+    of the ones they replace """
+    legacy = LEGACY_GLOBALS.get((modulename, globalname))
+    if legacy is not None:
+        return legacy
+    return _find_global(modulename, globalname)
+
+
+def class_factory(connection, modulename, globalname):
+    """ A DB.classFactory that loads old pickles, see find_global. Set on
+    every DB that opens the game's storage. """
+    return find_global(modulename, globalname)
+
+
+def _same(a, b):
+    """ Compares values of conflicting states. A persistent reference is
+    only the same as itself. """
+    if a is b:
+        return True
+    if (isinstance(a, PersistentReference) or
+            isinstance(b, PersistentReference)):
+        return False
+    return a == b
+
+
+def merge_values(old, committed, new):
+    """ Three-way merge of a value of the old, committed and new states of
+    an object in conflict. Raises ConflictError if both changed it. """
+    if _same(new, old):
+        return committed
+    if _same(committed, old) or _same(committed, new):
+        return new
+    raise ConflictError()
+
+
+def merge_dicts(old, committed, new):
+    """ Three-way merge of a dict of the old, committed and new states of
+    an object in conflict. Raises ConflictError if both changed the same
+    key. The result has the type of committed, and its order followed by
+    the keys added by new. """
+    merged = committed.__class__()
+    for k, c in committed.iteritems():
+        v = merge_values(old.get(k, _missing), c, new.get(k, _missing))
+        if v is not _missing:
+            merged[k] = v
+    for k, n in new.iteritems():
+        if k not in committed:
+            v = merge_values(old.get(k, _missing), _missing, n)
+            if v is not _missing:
+                merged[k] = v
+    return merged
+
+
+def resolve_state(old, committed, new, dicts=(), resolvers=None):
+    """ Merges the old, committed and new states of an object in conflict,
+    for _p_resolveConflict. The attributes named in dicts are merged with
+    merge_dicts, those in resolvers with resolvers[name](old, committed,
+    new), and the rest with merge_values. """
+    if resolvers is None:
+        resolvers = {}
+    merged = {}
+    for k in set(old) | set(committed) | set(new):
+        args = [s.get(k, _missing) for s in (old, committed, new)]
+        present = not any(a is _missing for a in args)
+        if k in dicts and present:
+            v = merge_dicts(*args)
+        elif k in resolvers and present:
+            v = resolvers[k](*args)
+        else:
+            v = merge_values(*args)
+        if v is not _missing:
+            merged[k] = v
+    return merged
 
 
 class AutoID(Persistent):
+
+    """ Persistent ID counter. uid is the highest ID handed out or reserved.
+
+    If the database it is stored in has an id_block_size above 1, IDs are
+    handed out from blocks of that many, reserved by this process in
+    transactions of their own (see IDLease). Transactions that create
+    things then don't write to, and conflict on, the counter. """
+
     def __init__(self, name=''):
         super(AutoID, self).__init__()
         self.name = name
         self.uid = 0
 
     def get_next_id(self):
+        jar = self._p_jar
+        if jar is not None and self._p_oid is not None:
+            block_size = getattr(jar.db(), 'id_block_size', 1)
+            if block_size > 1:
+                return IDLease.get(self).next_id(block_size)
         self.uid += 1
         return self.uid
 
+    def reserve(self, count):
+        """ Reserves the next count IDs, returning the first of them """
+        start = self.uid + 1
+        self.uid += count
+        return start
+
     def __str__(self):
         return u'<AutoID {name} [{uid}]>'.format(name=self.name, uid=self.uid)
+
+
+class IDLease(object):
+
+    """ A block of IDs reserved from an AutoID by this process """
+
+    # Attempts at reserving a block before a ConflictError is raised
+    retries = 10
+
+    # maps (pid, oid) -> IDLease
+    _leases = {}
+    _lock = Lock()
+
+    @classmethod
+    def get(cls, autoid):
+        """ Returns this process' lease on a stored AutoID """
+        database = autoid._p_jar.db()
+        # Forked processes must not share the blocks of their parent
+        key = (os.getpid(), autoid._p_oid)
+        with cls._lock:
+            lease = cls._leases.get(key)
+            if lease is None or lease.database is not database:
+                lease = cls._leases[key] = cls(database, autoid._p_oid)
+        return lease
+
+    def __init__(self, database, oid):
+        self.database = database
+        self.oid = oid
+        self.lock = Lock()
+        self.next = self.stop = 0
+
+    def next_id(self, block_size):
+        with self.lock:
+            if self.next >= self.stop:
+                self.next = self._reserve(block_size)
+                self.stop = self.next + block_size
+            uid = self.next
+            self.next += 1
+            return uid
+
+    def _reserve(self, count):
+        """ Reserves count IDs in a transaction on a connection of its own,
+        so that it commits whatever the caller's transaction does """
+        tm = transaction.TransactionManager()
+        conn = self.database.open(transaction_manager=tm)
+        try:
+            for attempt in xrange(self.retries):
+                try:
+                    tm.begin()
+                    start = conn.get(self.oid).reserve(count)
+                    tm.commit()
+                    return start
+                except ConflictError:
+                    tm.abort()
+                    if attempt == self.retries - 1:
+                        raise
+        finally:
+            tm.abort()
+            conn.close()
+
+
+def _persistent_in(value):
+    """ Yields the persistent objects in value, looking into plain
+    containers """
+    if isinstance(value, Persistent):
+        yield value
+    elif isinstance(value, dict):
+        for v in value.itervalues():
+            for p in _persistent_in(v):
+                yield p
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for v in value:
+            for p in _persistent_in(v):
+                yield p
+
+
+def _referenced(obj):
+    """ Yields the persistent objects obj refers to: the values of a
+    mapping or BTree, or else the attribute values """
+    if hasattr(obj, 'itervalues'):
+        values = obj.itervalues()
+    else:
+        values = getattr(obj, '__dict__', {}).itervalues()
+    for v in values:
+        for p in _persistent_in(v):
+            yield p
+
+
+def warm_cache(conn, names, limit=10000):
+    """ Loads the root entries named, and the objects they refer to,
+    breadth first, into the caches of conn and its storage, until limit
+    objects are loaded. Returns the number loaded. """
+    root = conn.root()
+    queue = deque(root[name] for name in names if name in root)
+    seen = set()
+    loaded = 0
+    while queue and loaded < limit:
+        obj = queue.popleft()
+        if not isinstance(obj, Persistent) or obj._p_oid in seen:
+            continue
+        seen.add(obj._p_oid)
+        obj._p_activate()
+        loaded += 1
+        queue.extend(islice(_referenced(obj), limit - loaded))
+    return loaded
@@ -57,19 +57,17 @@ class Stable(Factory):
         nescient_list = []
         sexes = [unit.sex for unit in self.data]
         if len(self.data) > 1:  # It takes two to tango, baby.
-            for unit in self.data:
-                if unit.element == season:
-                    if OPPSEX[unit.sex] in sexes:
-                        if not self.produced[unit.id]:
-                            c = {k: v / 8 for k, v in unit.comp.iteritems()}
-                            stone = silo.get(c)
-                            nescient = Nescient(unit.element, stone)
-                            nescient_list.append(nescient)
-                            self.produced[unit.id] = True
-                        else:
-                            pass  # unit has already had a kid this year.
-                    else:
-                        pass  # need one of each sex.
+            # need one of each sex, and one kid a year.
+            parents = [unit for unit in self.data
+                       if unit.element == season and
+                       OPPSEX[unit.sex] in sexes and
+                       not self.produced[unit.id]]
+            comps = [{k: v / 8 for k, v in unit.comp.iteritems()}
+                     for unit in parents]
+            for unit, stone in zip(parents, silo.get_many(comps)):
+                nescient = Nescient(unit.element, stone)
+                nescient_list.append(nescient)
+                self.produced[unit.id] = True
             return nescient_list
 
 
@@ -120,18 +118,16 @@ class Home(Factory):
         scient_list = []
         sexes = [unit.sex for unit in self.data]
         if len(self.data) > 1:  # It takes two to tango, baby.
-            for unit in self.data:
-                if OPPSEX[unit.sex] in sexes:
-                    if not self.produced[unit.id]:
-                        c = {k: v / 8 for k, v in unit.comp.iteritems()}
-                        stone = silo.get(c)
-                        scient = Scient(unit.element, stone)
-                        scient_list.append(scient)
-                        self.produced[unit.id] = True
-                    else:
-                        pass  # unit has already had a kid this year.
-                else:
-                    pass  # need one of each sex.
+            # need one of each sex, and one kid a year.
+            parents = [unit for unit in self.data
+                       if OPPSEX[unit.sex] in sexes and
+                       not self.produced[unit.id]]
+            comps = [{k: v / 8 for k, v in unit.comp.iteritems()}
+                     for unit in parents]
+            for unit, stone in zip(parents, silo.get_many(comps)):
+                scient = Scient(unit.element, stone)
+                scient_list.append(scient)
+                self.produced[unit.id] = True
             return scient_list
 
 
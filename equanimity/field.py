@@ -4,7 +4,6 @@ field.py
 Created by AFD on 2013-08-05.
 Copyright (c) 2013 A. Frederick Dudley. All rights reserved.
 """
-import random
 from persistent import Persistent
 from collections import OrderedDict
 from operator import attrgetter
@@ -17,6 +16,8 @@ from battle import Battle
 from stronghold import Stronghold
 from clock import FieldClock
 from unit_container import Squad
+from db import resolve_state
+from helpers import rng
 from const import FIELD_BATTLE
 
 
@@ -42,6 +43,7 @@ class FieldQueue(Persistent):
             raise ValueError('Queue slot is taken')
         self.queue[slot] = squad
         squad.queue_at(field)
+        field.schedule()
         self._p_changed = 1
 
     def pop(self):
@@ -56,6 +58,10 @@ class FieldQueue(Persistent):
         return [dict(squad=sq.api_view(), slot=k)
                 for k, sq in self.queue.iteritems()]
 
+    def _p_resolveConflict(self, old, committed, new):
+        # Squads queueing at different slots at the same time
+        return resolve_state(old, committed, new, dicts=('queue',))
+
 
 class Field(Persistent):
 
@@ -115,11 +121,15 @@ class Field(Persistent):
 
     @owner.setter
     def owner(self, owner):
+        old_owner = self._owner
         self._owner = owner
         for s in self.stronghold.squads:
             s.owner = owner
         for u in self.stronghold.free:
             u.owner = owner
+        update_index = getattr(self.world, '_field_owner_changed', None)
+        if update_index is not None:
+            update_index(self, old_owner)
 
     def get_adjacent(self, direction):
         """ Returns the field adjacent to this one in a given direction.
@@ -128,6 +138,13 @@ class Field(Persistent):
         if t:
             return self.world.fields.get(tuple(tuple(t)[0]))
 
+    def schedule(self):
+        """ Has the world clock process this field at the next day change
+        """
+        clock = getattr(self.world, 'clock', None)
+        if clock is not None:
+            clock.schedule_field(self.world_coord)
+
     def process_battle_and_movement(self):
         """ Starts a battle if an attacker is available, otherwise moves
         a friendly squad into the stronghold if available """
@@ -162,7 +179,7 @@ class Field(Persistent):
         if self.stronghold.garrisoned:
             return False
         self.owner = atkr.owner
-        self.stronghold.move_squad_in(self.battlefield.atksquad)
+        self.stronghold.move_squad_in(atkr)
         return True
 
     def place_scient(self, unit, location):
@@ -194,7 +211,7 @@ class Field(Persistent):
         taken = set([u.chosen_location for u in unit.container
                      if not u.chosen_location.is_null()])
         available = available - taken
-        return self.place_scient(unit, random.choice(available))
+        return self.place_scient(unit, rng().choice(available))
 
     def rand_place_squad(self, squad):
         """place the units in a squad randomly on the battlefield"""
@@ -202,7 +219,7 @@ class Field(Persistent):
         for u in squad:
             u.chosen_location = Hex.null
         available = set(self.grid.placement_coords())
-        positions = random.sample(available, len(squad))
+        positions = rng().sample(available, len(squad))
         for unit, pos in zip(squad, positions):
             self.place_scient(unit, pos)
 
@@ -274,6 +291,8 @@ class Field(Persistent):
                     break
         # Allow the world to take over if the defender is vacant
         self.check_ungarrisoned()
+        # Start the next battle or movement at the next day change
+        self.schedule()
 
     """ Special """
 
@@ -4,18 +4,29 @@ grid.py
 Created by AFD on 2013-08-05.
 Copyright (c) 2013 A. Frederick Dudley. All rights reserved.
 """
-import random
 from bidict import bidict, inverted
 from collections import namedtuple
 from itertools import product, ifilter
 
-from stone import Stone
+from stone import Stone, Composition
 from helpers import classproperty
+from const import ELEMENTS, ORTH, OPP
+
+
+def iter_bits(mask):
+    """ Yields the positions of the set bits in mask, lowest first """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
 
 
 class Tile(Stone):
 
-    """Tiles contain units or stones and are used to make battlefields."""
+    """Tiles contain units or stones and are used to make battlefields.
+    Tiles that belong to a Grid are views onto the grid's arrays: their
+    composition and contents are read from and written to the grid.
+    """
 
     def __init__(self, location=None, comp=None, contents=None):
         super(Tile, self).__init__(comp=comp)
@@ -23,10 +34,37 @@ class Tile(Stone):
             self.location = Hex.null
         else:
             self.location = Hex._make(location)
-        self.contents = None
+        self._grid = None
+        self._index = None
+        self._contents = None
         if contents is not None:
             self.set_contents(contents)
 
+    @classmethod
+    def _bind(cls, grid, index):
+        """ Returns a tile that views the slot at index in grid """
+        tile = cls.__new__(cls)
+        Stone.__init__(tile)
+        tile.comp = TileComposition(grid, index)
+        tile.location = grid.layout.coords[index]
+        tile._grid = grid
+        tile._index = index
+        tile._contents = None
+        return tile
+
+    @property
+    def contents(self):
+        if self._grid is None:
+            return self._contents
+        return self._grid._contents[self._index]
+
+    @contents.setter
+    def contents(self, value):
+        if self._grid is None:
+            self._contents = value
+        else:
+            self._grid._set_contents(self._index, value)
+
     def __eq__(self, other):
         if not isinstance(other, Tile):
             return False
@@ -60,6 +98,33 @@ class Tile(Stone):
         return (self.contents is not None)
 
 
+class TileComposition(Composition):
+
+    """ Composition of a tile that writes through to its grid's array. It
+    pickles as a plain Composition; the grid arrays are the real storage """
+
+    __slots__ = ('_grid', '_index')
+
+    def __init__(self, grid, index):
+        for e, v in zip(ELEMENTS, grid._get_comp(index)):
+            setattr(self, e, v)
+        self._grid = grid
+        self._index = index
+
+    def __setitem__(self, key, value):
+        grid = getattr(self, '_grid', None)
+        if grid is not None:
+            grid._set_comp_value(self._index, key, value)
+        super(TileComposition, self).__setitem__(key, value)
+
+    def set_opp(self, element, val):
+        self[OPP[element]] = val
+
+    def set_orth(self, element, val):
+        for el in ORTH[element]:
+            self[el] = val
+
+
 class Hex(namedtuple('Hex', 'q r')):
     __slots__ = ()
 
@@ -115,13 +180,89 @@ class HexCube(namedtuple('HexCube', 'x y z')):
         return cls(h.q, -h.q - h.r, h.r)
 
 
+class GridIndex(object):
+
+    """ Fixed mapping between the axial coordinates of a hex grid of some
+    radius and the linear indices that address its tile arrays, along with
+    adjacency and range tables for the grid.
+    Instances are immutable and shared by all grids of the same radius.
+    """
+
+    _layouts = {}
+
+    def __init__(self, radius):
+        self.radius = radius
+        span = xrange(-radius, radius + 1)
+        self.coords = tuple(Hex(q, r) for q, r in product(span, span)
+                            if -radius <= q + r <= radius)
+        self.index = dict((c, i) for i, c in enumerate(self.coords))
+        self.size = len(self.coords)
+        self.mask = (1 << self.size) - 1
+        vectors = Grid.inverted_vectors.keys()
+        neighbors = []
+        for c in self.coords:
+            adjacent = [c + v for v in vectors]
+            neighbors.append(frozenset(n for n in adjacent
+                                       if n in self.index))
+        self.neighbors = tuple(neighbors)
+        self._rings = {}
+        self._ranges = {}
+
+    def mask_of(self, coords):
+        """ Returns the bitmask of the in bounds coords """
+        mask = 0
+        for c in coords:
+            i = self.index.get(c)
+            if i is not None:
+                mask |= 1 << i
+        return mask
+
+    @staticmethod
+    def distance((q, r), (p, s)):
+        dq = q - p
+        dr = r - s
+        return (abs(dq) + abs(dr) + abs(dq + dr)) / 2
+
+    def rings(self, center):
+        """ Returns a tuple of frozensets of the in bounds coords, grouped by
+        their distance from center """
+        rings = self._rings.get(center)
+        if rings is None:
+            buckets = {}
+            for c in self.coords:
+                buckets.setdefault(self.distance(center, c), []).append(c)
+            rings = tuple(frozenset(buckets.get(d, ()))
+                          for d in xrange(max(buckets) + 1))
+            if center in self.index:
+                self._rings[Hex._make(center)] = rings
+        return rings
+
+    def in_range(self, center, distance, exclude=0):
+        """ Returns the in bounds coords further than exclude and no further
+        than distance from center """
+        key = (center, distance, exclude)
+        tiles = self._ranges.get(key)
+        if tiles is None:
+            tiles = frozenset().union(
+                *self.rings(center)[exclude + 1:distance + 1])
+            if center in self.index:
+                self._ranges[key] = tiles
+        return tiles
+
+    @classmethod
+    def get(cls, radius):
+        layout = cls._layouts.get(radius)
+        if layout is None:
+            layout = cls._layouts[radius] = cls(radius)
+        return layout
+
+
 class Grid(Stone):
 
     """ Grid that uses axial/trapezoidal coordinate system outlined
     here: http://www.redblobgames.com/grids/hexagons/
     """
 
-    _coords_cache = {}
     _inverted_vectors = None
 
     directions = bidict({
@@ -157,6 +298,7 @@ class Grid(Stone):
         return (q - r) in cls.inverted_vectors
 
     def __init__(self, comp=None, radius=8, tiles=None):
+        """ A grid made from a comp has empty tiles, see TODO """
         if radius <= 0:
             raise ValueError('Invalid hex grid radius {0}'.format(radius))
         self.size = self.compute_size(radius)
@@ -168,16 +310,43 @@ class Grid(Stone):
             comp = Stone(comp)
         super(Grid, self).__init__(comp)
         self.radius = radius
-        if comp.value:
-            self._setup_tiles(comp)
-        else:
+        # Tile compositions, len(ELEMENTS) bytes per tile in layout order
+        self._comps = bytearray(len(ELEMENTS) * self.size)
+        # Tile contents, in layout order
+        self._contents = [None] * self.size
+        # Bit i is set when self._contents[i] is not None
+        self._occupied = 0
+        if not comp.value:
             self._setup_fresh_tiles(tiles=tiles)
-        self._update_comp_value()
+
+    def __setstate__(self, state):
+        super(Grid, self).__setstate__(state)
+        # Grids saved before the tile arrays hold a nested dict of Tiles
+        tiles = self.__dict__.pop('tiles', None)
+        if tiles is not None:
+            self._load_legacy_tiles(tiles)
+
+    @property
+    def layout(self):
+        return GridIndex.get(self.radius)
+
+    @property
+    def tiles(self):
+        """ Nested dict view of the tiles, tiles[q][r] """
+        tiles = getattr(self, '_v_tile_map', None)
+        if tiles is None:
+            tiles = {}
+            for tile in self.iter_tiles():
+                q, r = tile.location
+                tiles.setdefault(q, {})[r] = tile
+            self._v_tile_map = tiles
+        return tiles
 
     def get(self, (q, r)):
-        if not self.in_bounds((q, r)):
+        index = self.layout.index.get((q, r))
+        if index is None:
             raise ValueError('{0} is out of bounds'.format((q, r)))
-        return self.tiles[q][r]
+        return self._get_tile(index)
 
     def get_direction(self, src, dest):
         """ Returns the direction the unit should face to aim at the unit.
@@ -216,13 +385,17 @@ class Grid(Stone):
     def get_adjacent(self, (q, r), direction='all', filtered=True):
         h = Hex(q, r)
         if direction == 'all':
+            if filtered:
+                index = self.layout.index.get(h)
+                if index is not None:
+                    return self.layout.neighbors[index]
             tiles = [h + v for v in self.inverted_vectors]
         else:
             tiles = [h + self.vectors[direction]]
         if filtered:
             return self.filter_tiles(tiles)
         else:
-            return set(tiles)
+            return frozenset(tiles)
 
     def get_triangulating_vectors(self, direction):
         """ Returns the vector for direction, and the vector for the direction
@@ -232,24 +405,16 @@ class Grid(Stone):
         rightdir = self.directions[(dirnum + 1) % len(self.directions)]
         return (self.vectors[direction], self.vectors[rightdir])
 
-    def tiles_in_range(self, location, distance):
-        """generates a list of tiles within distance of location."""
-        home = set([location])
-        tilesets = [home]
-        tiles = home
-        union = lambda x, y: x | y
-        for i in xrange(distance):
-            adj = [self.get_adjacent(t, filtered=False) for t in tilesets[-1]]
-            adj = reduce(union, adj)
-            adj -= tiles
-            tilesets.append(adj)
-        return self.filter_tiles(reduce(union, tilesets[1:]))
+    def tiles_in_range(self, location, distance, exclude=0):
+        """ Returns the coords within distance of location, leaving out
+        location and anything within exclude of it. """
+        return self.layout.in_range(tuple(location), distance, exclude)
 
     def filter_tiles(self, tiles):
-        return set(filter(self.in_bounds, tiles))
+        return frozenset(filter(self.in_bounds, tiles))
 
     def full(self):
-        return (not list(self.unoccupied_coords()))
+        return (self._occupied == self.layout.mask)
 
     def in_bounds(self, (q, r)):
         vals = [q, r, q + r]
@@ -261,26 +426,29 @@ class Grid(Stone):
         Conceptually, it generates a square grid and discards the corner
         coordinates, leaving a hex map.
         """
-        if self.radius not in self._coords_cache:
-            span = xrange(-self.radius, self.radius + 1)
-            self._coords_cache[self.radius] = filter(self.in_bounds,
-                                                     product(span, span))
-        return iter(self._coords_cache[self.radius])
+        return iter(self.layout.coords)
 
     def placement_coords(self):
         """ Returns coords for one side of the field """
         return ifilter(lambda x: x[0] > 0, self.iter_coords())
 
     def occupied_coords(self):
-        return (t.location for t in self.iter_tiles() if t.occupied())
+        coords = self.layout.coords
+        return (coords[i] for i in iter_bits(self._occupied))
 
     def unoccupied_coords(self):
-        return (t.location for t in self.iter_tiles() if not t.occupied())
+        coords = self.layout.coords
+        return (coords[i] for i in iter_bits(self.layout.mask &
+                                             ~self._occupied))
+
+    def occupied_in(self, coords):
+        """ Returns the occupied coords among coords """
+        mask = self.layout.mask_of(coords) & self._occupied
+        return [self.layout.coords[i] for i in iter_bits(mask)]
 
     def iter_tiles(self):
-        for axis in self.tiles.itervalues():
-            for tile in axis.itervalues():
-                yield tile
+        for i in xrange(self.size):
+            yield self._get_tile(i)
 
     def __contains__(self, thing):
         loc = getattr(thing, 'location', thing)
@@ -294,7 +462,7 @@ class Grid(Stone):
         return self.tiles[key]
 
     def __setitem__(self, key, value):
-        self.tiles[key] = value
+        raise UserWarning('__setitem__ not supported on Grid')
 
     def __delitem__(self, key):
         raise UserWarning('__delitem__ not supported on Grid')
@@ -327,47 +495,73 @@ class Grid(Stone):
         """
         return cls._triangulate(radius) * 6 + 1
 
-    def _setup_fresh_tiles(self, tiles=None):
+    def _get_tile(self, index):
+        tiles = getattr(self, '_v_tiles', None)
         if tiles is None:
-            tiles = {}
-            for i, j in self.iter_coords():
-                tiles.setdefault(i, {})[j] = Tile(Hex(i, j))
+            tiles = self._v_tiles = [None] * self.size
+        tile = tiles[index]
+        if tile is None:
+            tile = tiles[index] = Tile._bind(self, index)
+        return tile
+
+    def _get_comp(self, index):
+        n = len(ELEMENTS)
+        return self._comps[index * n:(index + 1) * n]
+
+    def _set_comp(self, index, comp):
+        n = len(ELEMENTS)
+        self._comps[index * n:(index + 1) * n] = bytearray(
+            comp[e] for e in ELEMENTS)
+        self._p_changed = True
+
+    def _set_comp_value(self, index, element, value):
+        self._comps[index * len(ELEMENTS) + ELEMENTS.index(element)] = value
+        self._p_changed = True
+
+    def _set_contents(self, index, contents):
+        self._contents[index] = contents
+        if contents is None:
+            self._occupied &= ~(1 << index)
         else:
-            if self._count_tiles(tiles) != self.size:
-                msg = 'Need {0} tiles, only provided {1}'
-                raise ValueError(msg.format(self.size, len(tiles)))
-            for i, j in self.iter_coords():
-                for suit, value in tiles[i][j].iteritems():
-                    self.comp[suit] += value
-            for suit in self.comp:
-                self.comp[suit] /= self.size
-        self.tiles = tiles
-
-    def _setup_tiles(self, comp, stddev=64):
-        '''
-        Creates tiles with gaussian random values
-        '''
-        def random_tile(loc, stddev):
-            s = Stone()
-            for e, v in comp.iteritems():
-                val = int(random.gauss(v, stddev))
-                val = min(s.limit[e], s[e])
-                val = max(0, s[e])
-                s[e] = val
-            return Tile(loc, comp=s)
-
-        self.tiles = {}
-        for i, j in self.iter_coords():
-            self.tiles.setdefault(i, {})[j] = random_tile((i, j), stddev)
-
-    def _update_comp_value(self):
-        """ Sets self.comp to average of tiles' comps """
-        c = Stone()
-        for t in self.iter_tiles():
-            for e, v in t.comp.iteritems():
-                c[e] = v
-        for e, v in c.iteritems():
-            self.comp[e] = v / self.size
+            self._occupied |= 1 << index
+        self._p_changed = True
+
+    def _setup_fresh_tiles(self, tiles=None):
+        if tiles is None:
+            return
+        if self._count_tiles(tiles) != self.size:
+            msg = 'Need {0} tiles, only provided {1}'
+            raise ValueError(msg.format(self.size, len(tiles)))
+        # The provided tiles become views onto this grid's arrays
+        views = self._v_tiles = [None] * self.size
+        for i, (q, r) in enumerate(self.iter_coords()):
+            tile = tiles[q][r]
+            self._set_comp(i, tile.comp)
+            self._set_contents(i, tile._contents)
+            tile._grid = self
+            tile._index = i
+            tile._contents = None
+            tile.comp = TileComposition(self, i)
+            views[i] = tile
+        self._v_tile_map = tiles
+
+    def _load_legacy_tiles(self, tiles):
+        """ Fills the tile arrays from the tiles[q][r] dict of a grid saved
+        before them """
+        n = len(ELEMENTS)
+        self._comps = bytearray(n * self.size)
+        self._contents = [None] * self.size
+        self._occupied = 0
+        for i, (q, r) in enumerate(self.iter_coords()):
+            tile = tiles[q][r]
+            tile._p_activate()
+            self._comps[i * n:(i + 1) * n] = bytearray(
+                tile.comp[e] for e in ELEMENTS)
+            # Tile.contents was a plain attribute
+            contents = tile.__dict__.get('contents')
+            if contents is not None:
+                self._contents[i] = contents
+                self._occupied |= 1 << i
 
     def _count_tiles(self, tiles):
         return sum([len(row) for row in tiles.itervalues()])
@@ -9,24 +9,47 @@ import random
 import string
 from persistent import Persistent
 from functools import wraps
-from threading import Lock
+from threading import Lock, local
+from contextlib import contextmanager
+from collections import OrderedDict
 from const import ELEMENTS
 from calendar import timegm
 from datetime import datetime
 
 
+_random = local()
+
+
+def rng():
+    """ Returns what game code draws random numbers from: the random.Random
+    swapped in by use_random() in this thread, or else the random module """
+    return getattr(_random, 'source', None) or random
+
+
+@contextmanager
+def use_random(source):
+    """ Draws random numbers from source, a random.Random, within the
+    block, in this thread only """
+    prev = getattr(_random, 'source', None)
+    _random.source = source
+    try:
+        yield source
+    finally:
+        _random.source = prev
+
+
 def validate_length(seq, **limits):
     if not limits['min'] <= len(seq) <= limits['max']:
         raise ValueError('Invalid sequence length {0}'.format(len(seq)))
 
 
 def rand_string(len=8):
-    return ''.join(random.choice(string.letters) for i in xrange(len))
+    return ''.join(rng().choice(string.letters) for i in xrange(len))
 
 
 def rand_element():
     """Reuturns a random element"""
-    return random.choice(ELEMENTS)
+    return rng().choice(ELEMENTS)
 
 
 def now():
@@ -60,6 +83,51 @@ class classproperty(object):
         return self._getter(owner)
 
 
+class LRUCache(object):
+
+    """ Mapping of at most maxsize items, which drops the least recently used
+    item to make room for a new one """
+
+    def __init__(self, maxsize=128):
+        if maxsize <= 0:
+            raise ValueError('Invalid cache size {0}'.format(maxsize))
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+
 class PersistentKwargs(Persistent):
 
     """ Allows initializing of Persistent with kwargs """
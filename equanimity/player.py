@@ -4,7 +4,6 @@ player.py
 Created by AFD on 2013-08-05.
 Copyright (c) 2013 A. Frederick Dudley. All rights reserved.
 """
-import operator
 from collections import OrderedDict
 from itertools import chain
 from persistent import Persistent
@@ -13,6 +12,7 @@ from flask.ext.login import UserMixin
 from flask import current_app
 from const import WORLD_UID
 from worldtools import get_world
+from db import resolve_state, merge_values
 from server import bcrypt, db
 
 
@@ -77,16 +77,10 @@ class Player(Persistent, UserMixin):
                     squad=squad.combatant_view())
 
     def get_fields(self, world):
-        w = get_world(world)
-        return {c: f for c, f in w.fields.iteritems() if f.owner == self}
+        return get_world(world).get_owned_fields(self)
 
     def get_visible_fields(self, world):
-        w = get_world(world)
-        g = w.grid
-        fields = (set((c,)) | g.get_adjacent(c)
-                  for c in self.get_fields(world))
-        fields = reduce(operator.or_, fields, set())
-        return fields
+        return get_world(world).get_visible_fields(self)
 
     def get_squads(self, world):
         squads = (f.stronghold.squads.items.values()
@@ -253,3 +247,15 @@ class PlayerGroup(Persistent):
 
     def __iter__(self):
         return self.players.itervalues()
+
+    def _p_resolveConflict(self, old, committed, new):
+        # Players joining or leaving at the same time
+        return resolve_state(old, committed, new, dicts=('players',),
+                             resolvers=dict(_leader=_merge_leader))
+
+
+def _merge_leader(old, committed, new):
+    if old is None and committed is not None and new is not None:
+        # Both added a first player. The committed one was added first.
+        return committed
+    return merge_values(old, committed, new)
@@ -5,7 +5,8 @@ Created by AFD on 2013-03-06.
 Copyright (c) 2013 A. Frederick Dudley. All rights reserved.
 """
 
-from stone import Stone
+from const import ELEMENTS
+from stone import Composition, Stone
 from transmuter import Transmuter
 
 
@@ -20,6 +21,36 @@ class Silo(Stone):
         attempts transmuation if split fails."""
         return self.split(Transmuter(self.comp, comp).get_cost())
 
+    def reserve(self, comps):
+        """Returns the comps that get_many would split from the silo for
+        each of comps, without splitting them. Raises ValueError if the
+        silo cannot provide all of them."""
+        comps = [Composition.create(c) for c in comps]
+        left = Composition.create(self.comp)
+        # Nothing needs transmuting if the silo holds the whole batch
+        if all(sum(c[e] for c in comps) <= left[e] for e in ELEMENTS):
+            return comps
+        costs = []
+        for comp in comps:
+            cost = Transmuter(left, comp).get_cost().comp
+            for e in ELEMENTS:
+                if cost[e] > left[e]:
+                    raise ValueError("comp[{0}] cannot be greater than "
+                                     "stone[{1}].".format(e, e))
+                left[e] -= cost[e]
+            costs.append(cost)
+        return costs
+
+    def get_many(self, comps):
+        """Splits a stone for each of comps, transmuting as get does.
+        Either every stone is split or, if the silo cannot provide them all,
+        ValueError is raised and the silo is left untouched."""
+        costs = self.reserve(comps)
+        for e in ELEMENTS:
+            self.comp[e] -= sum(c[e] for c in costs)
+        self._p_changed = True
+        return [Stone(c) for c in costs]
+
     def imbue_list(self, los):
         """surplus is destroyed."""
         for stone in los:
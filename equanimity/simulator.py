@@ -0,0 +1,258 @@
+"""
+simulator.py
+
+Headless battle simulator. Plays complete battles between two squads
+without a Flask app or a ZODB connection, for benchmarks and balance runs.
+Every battle gets its own in-memory store and a seeded random.Random, both
+swapped in for the running thread only, so a seed always replays the same
+battle.
+"""
+import random
+from functools import partial
+from itertools import chain
+from collections import namedtuple
+from persistent import Persistent
+from flask.ext.login import UserMixin
+from const import ELEMENTS, OPP
+from grid import Grid, Hex
+from db import AutoID
+from player import Player
+from world import World, root_factories
+from field import Field
+from battle import Action, ActionQueue
+from unit_container import rand_squad
+from helpers import rng, use_random
+from server import db
+
+
+BattleResult = namedtuple('BattleResult', ['seed', 'winner', 'condition',
+                                           'actions', 'attacker', 'defender',
+                                           'hps'])
+
+
+def memory_store(id_factory=AutoID, grid_radius=8, square_grid=False):
+    """ Returns a plain dict laid out like the root made by init_db.
+    id_factory(name) must return an object with a get_next_id() method, and
+    is used for every uid allocator in the store. """
+    root = {}
+    factories = root_factories(grid_radius=grid_radius,
+                               square_grid=square_grid)
+    for k, v in factories.iteritems():
+        if k.endswith('_uid'):
+            root[k] = id_factory(k[:-len('_uid')])
+        else:
+            root[k] = v()
+    return root
+
+
+def squad_summary(squad):
+    """ Describes a squad for reporting, before any of its units die """
+    return dict(value=squad.value, size=len(squad),
+                elements=tuple(u.element for u in squad),
+                weapons=tuple(getattr(u.weapon, 'type', None)
+                              for u in squad))
+
+
+class SimulatedPlayer(Player):
+
+    """ Player without a password or username and email indices """
+
+    def __init__(self, username):
+        Persistent.__init__(self)
+        UserMixin.__init__(self)
+        self.uid = db['player_uid'].get_next_id()
+        self.username = username
+        self.email = ''
+        self._password = ''
+        self._set_defaults()
+
+    def persist(self):
+        db['players'][self.uid] = self
+
+
+class Policy(object):
+
+    """ Chooses the actions of one side of a battle """
+
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
+
+    def act(self, battle, unit, num):
+        """ Returns the Action for unit at action number num """
+        raise NotImplementedError()
+
+    def allowed(self, battle, num):
+        """ Returns the action types that may be used at action num. The
+        second action of a ply must differ from the first. """
+        types = set(['move', 'attack'])
+        if not ActionQueue.get_action_in_ply(num):
+            return types
+        try:
+            prev = battle.log.actions[-1].type
+        except IndexError:
+            return types
+        types.discard(prev)
+        return types
+
+    def targets(self, battle, unit):
+        """ Returns the locations of enemies unit can attack """
+        bf = battle.battlefield
+        if unit.weapon is None:
+            return []
+        in_range = bf.map_to_grid(unit.location, unit.weapon)
+        return sorted(u.location for u in self.enemies(battle, unit)
+                      if u.location in in_range)
+
+    def moves(self, battle, unit):
+        """ Returns the empty locations unit can move to """
+        grid = battle.battlefield.grid
+        loc = unit.location
+        coords = grid.tiles_in_range(loc, unit.move)
+        coords = coords - frozenset(grid.occupied_in(coords))
+        return sorted(c for c in coords if loc.distance(c) <= unit.move)
+
+    def enemies(self, battle, unit):
+        bf = battle.battlefield
+        if unit.container is bf.atksquad:
+            squad = bf.defsquad
+        else:
+            squad = bf.atksquad
+        return [u for u in squad if u.hp > 0]
+
+
+class RandomPolicy(Policy):
+
+    """ Attacks a random enemy in range. Otherwise moves, as close as it can
+    get to a random enemy if advance is set, or to a random tile. """
+
+    def __init__(self, seed=None, advance=True):
+        super(RandomPolicy, self).__init__(seed=seed)
+        self.advance = advance
+
+    def act(self, battle, unit, num):
+        allowed = self.allowed(battle, num)
+        if 'attack' in allowed:
+            targets = self.targets(battle, unit)
+            if targets:
+                return Action(unit=unit, type='attack',
+                              target=self.random.choice(targets))
+        if 'move' in allowed:
+            moves = self.moves(battle, unit)
+            if moves:
+                return Action(unit=unit, type='move',
+                              target=self._choose_move(battle, unit, moves))
+        return Action(unit=unit, type='pass')
+
+    def _choose_move(self, battle, unit, moves):
+        enemies = self.enemies(battle, unit)
+        if not self.advance or not enemies:
+            return self.random.choice(moves)
+        goal = self.random.choice(enemies).location
+        dist = battle.battlefield.grid.layout.distance
+        best = min(dist(m, goal) for m in moves)
+        return self.random.choice([m for m in moves
+                                   if dist(m, goal) == best])
+
+
+class ScriptedPolicy(Policy):
+
+    """ Plays a fixed sequence of (type, target) actions, then passes """
+
+    def __init__(self, script, seed=None):
+        super(ScriptedPolicy, self).__init__(seed=seed)
+        self.script = iter(script)
+
+    def act(self, battle, unit, num):
+        try:
+            kind, target = next(self.script)
+        except StopIteration:
+            kind, target = 'pass', Hex.null
+        return Action(unit=unit, type=kind, target=Hex._make(target))
+
+
+class Simulator(object):
+
+    """ Plays battles between squads made by attacker and defender, which
+    are called with an owner, in a fresh store per battle. The policies are
+    called with the battle's seed to make the Policy for each side. """
+
+    def __init__(self, attacker=None, defender=None,
+                 attacker_policy=RandomPolicy, defender_policy=RandomPolicy,
+                 id_factory=AutoID, grid_radius=8, max_actions=2000):
+        if attacker is None:
+            attacker = partial(rand_squad, size=4, equip=True)
+        if defender is None:
+            defender = partial(rand_squad, size=4, equip=True)
+        self.attacker = attacker
+        self.defender = defender
+        self.attacker_policy = attacker_policy
+        self.defender_policy = defender_policy
+        self.id_factory = id_factory
+        self.grid_radius = grid_radius
+        self.max_actions = max_actions
+
+    def run(self, seeds):
+        """ Yields the BattleResult for each seed """
+        for seed in seeds:
+            yield self.run_battle(seed)
+
+    def run_battle(self, seed):
+        store = memory_store(id_factory=self.id_factory, grid_radius=1)
+        with db.use(store), use_random(random.Random(seed)):
+            battle = self.setup_battle()
+            return self.play(battle, seed)
+
+    def setup_battle(self):
+        """ Creates a world with a field held by the defender, and a field
+        for the attacker to attack from, and starts a battle between them """
+        world = World(create_fields=False)
+        world.persist()
+        atkr = SimulatedPlayer('attacker')
+        defr = SimulatedPlayer('defender')
+        for p in (atkr, defr):
+            p.persist()
+            world.players.add(p)
+        atksquad = self.attacker(owner=atkr)
+        defsquad = self.defender(owner=defr)
+        grid = partial(Grid, radius=self.grid_radius)
+        element = rng().choice(ELEMENTS)
+        field = Field(world, (0, 0), element, owner=defr, grid=grid())
+        home = Field(world, (0, 1), OPP[element], owner=atkr, grid=grid())
+        world.set_fields({field.world_coord: field, home.world_coord: home})
+        field.stronghold._add_squad(defsquad)
+        field.stronghold.defenders = defsquad
+        home.stronghold._add_squad(atksquad)
+        field.rand_place_squad(atksquad)
+        field.rand_place_squad(defsquad)
+        field.start_battle(atksquad)
+        return field.battle
+
+    def play(self, battle, seed):
+        bf = battle.battlefield
+        summaries = dict(attacker=squad_summary(bf.atksquad),
+                         defender=squad_summary(bf.defsquad))
+        units = list(chain(bf.atksquad, bf.defsquad))
+        atk_policy = self.attacker_policy(seed)
+        def_policy = self.defender_policy(seed)
+        actions = 0
+        while not battle.state.game_over and actions < self.max_actions:
+            num = battle.state.num
+            unit = ActionQueue.get_unit_for_action(bf, num)
+            policy = def_policy
+            if unit.container is bf.atksquad:
+                policy = atk_policy
+            action = policy.act(battle, unit, num)
+            # Skip the wall clock timeout checks of process_action
+            battle._process_action(action)
+            actions += 1
+        if battle.state.game_over:
+            winner = 'defender'
+            if battle.winner == battle.attacker:
+                winner = 'attacker'
+            condition = battle.log.condition
+        else:
+            winner = None
+            condition = 'Action limit reached'
+        return BattleResult(seed=seed, winner=winner, condition=condition,
+                            actions=actions, hps=[u.hp for u in units],
+                            **summaries)
@@ -4,39 +4,163 @@ stone.py
 Created by AFD on 2013-08-05.
 Copyright (c) 2013 A. Frederick Dudley. All rights reserved.
 """
-import random
-from collections import Mapping
+import copy_reg
+from collections import Mapping, MutableMapping
 from persistent.mapping import PersistentMapping
 from operator import itemgetter
-from helpers import rand_element
+from helpers import rand_element, rng
 from const import ELEMENTS, ORTH, OPP, KINDS
 
 
-class Composition(dict):
+# The order a dict iterates the elements in, which Composition keeps so that
+# it iterates, prints and serializes as it did when it was a dict
+KEYS = tuple(dict(zip(ELEMENTS, ELEMENTS)))
+
+
+class Composition(object):
+
+    """ The values of the four elements, held in slots rather than a dict
+    but usable as one. A value of -1 means it has not been set. """
+
+    __slots__ = ELEMENTS
 
     def __init__(self, value=None):
         """ All elements are set to value """
         _value = value
         if value is None:
             value = -1
-        super(Composition, self).__init__()
         for e in ELEMENTS:
-            self[e] = value
+            setattr(self, e, value)
         if _value is not None:
             self.sanity_check()
 
+    @classmethod
+    def _make(cls, values):
+        """ Creates from values in ELEMENTS order, unchecked """
+        c = cls.__new__(cls)
+        for e, v in zip(ELEMENTS, values):
+            setattr(c, e, v)
+        return c
+
+    """ dict interface """
+
+    def __getitem__(self, key):
+        if key not in _SLOTS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in _SLOTS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        raise TypeError('Elements cannot be removed from a Composition')
+
+    def __iter__(self):
+        return iter(KEYS)
+
+    def __len__(self):
+        return len(KEYS)
+
+    def __contains__(self, key):
+        return key in _SLOTS
+
+    def __eq__(self, other):
+        if isinstance(other, Composition):
+            return self.tup() == other.tup()
+        if isinstance(other, Mapping):
+            return dict(zip(ELEMENTS, self.tup())) == dict(other)
+        return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def keys(self):
+        return list(KEYS)
+
+    def values(self):
+        return [getattr(self, k) for k in KEYS]
+
+    def items(self):
+        return [(k, getattr(self, k)) for k in KEYS]
+
+    def iterkeys(self):
+        return iter(KEYS)
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def get(self, key, default=None):
+        if key not in _SLOTS:
+            return default
+        return getattr(self, key)
+
+    def setdefault(self, key, default=None):
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for k, v in dict(*args, **kwargs).iteritems():
+            self[k] = v
+
+    def copy(self):
+        return Composition._make(self.tup())
+
+    def __getstate__(self):
+        return self.tup()
+
+    def __setstate__(self, state):
+        # Compositions pickled as dicts are restored by __setitem__ and have
+        # no state
+        if state:
+            for e, v in zip(ELEMENTS, state):
+                setattr(self, e, v)
+
+    def __reduce__(self):
+        return (Composition, (), self.tup())
+
+    def __repr__(self):
+        return repr(dict(zip(ELEMENTS, self.tup())))
+
+    """ Elementwise operations """
+
+    def tup(self):
+        """ Returns the values in ELEMENTS order """
+        return tuple(getattr(self, e) for e in ELEMENTS)
+
+    def __add__(self, other):
+        return Composition._make([getattr(self, e) + other[e]
+                                  for e in ELEMENTS])
+
+    def __sub__(self, other):
+        return Composition._make([getattr(self, e) - other[e]
+                                  for e in ELEMENTS])
+
+    def clamp(self, limit=255):
+        """ Returns a copy with each value between 0 and limit, which is
+        either a number or a mapping of element limits """
+        if not isinstance(limit, Mapping):
+            limit = Composition._make([limit] * len(ELEMENTS))
+        return Composition._make([max(0, min(getattr(self, e), limit[e]))
+                                  for e in ELEMENTS])
+
     def orth(self, element):
-        return [self[k] for k in ORTH[element]]
+        return [getattr(self, k) for k in ORTH[element]]
 
     def opp(self, element):
-        return self[OPP[element]]
+        return getattr(self, OPP[element])
 
     def set_opp(self, element, val):
-        self[OPP[element]] = val
+        setattr(self, OPP[element], val)
 
     def set_orth(self, element, val):
         for el in ORTH[element]:
-            self[el] = val
+            setattr(self, el, val)
 
     @classmethod
     def create(cls, *args, **kwargs):
@@ -56,9 +180,7 @@ class Composition(dict):
             if hasattr(val, 'comp'):
                 val = val.comp
             if isinstance(val, cls):
-                c = Composition()
-                c.update(val)
-                return c
+                return Composition._make(val.tup())
             elif isinstance(val, Mapping):
                 return cls.from_dict(val)
             else:
@@ -99,20 +221,84 @@ class Composition(dict):
 
     def sanity_check(self):
         for e in ELEMENTS:
-            if self[e] < 0 or self[e] > 255:
-                raise ValueError('Element {0} is {1}'.format(e, self[e]))
+            v = getattr(self, e)
+            if v < 0 or v > 255:
+                raise ValueError('Element {0} is {1}'.format(e, v))
 
     @property
     def value(self):
-        return sum(self.values())
+        return sum(self.tup())
 
     def __str__(self):
-        s = ['{0}: {1}'.format(e, self[e]) for e in ELEMENTS]
+        s = ['{0}: {1}'.format(e, getattr(self, e)) for e in ELEMENTS]
         return ', '.join(s)
 
 
+MutableMapping.register(Composition)
+_SLOTS = frozenset(ELEMENTS)
+
+
+def _reconstructor(cls, base, state):
+    """ copy_reg._reconstructor, which pickles made with protocols 0 and 1
+    call to create instances of dict subclasses, for one that can also
+    create the Compositions pickled when Composition was a dict. Loaded in
+    its place by equanimity.db.find_global. """
+    if base is dict and issubclass(cls, Composition):
+        c = cls()
+        c.update(state)
+        return c
+    return copy_reg._reconstructor(cls, base, state)
+
+
+class FrozenComposition(Composition):
+
+    """ A Composition that cannot be changed, so one instance can be shared
+    by every stone that uses it. Get them from frozen_comp. """
+
+    __slots__ = ()
+
+    def __setattr__(self, key, value):
+        raise TypeError('FrozenComposition cannot be changed')
+
+    __setitem__ = __setattr__
+
+    def __hash__(self):
+        return hash(self.tup())
+
+    def __reduce__(self):
+        if self is DEFAULT_LIMIT:
+            # Pickled as a reference to the module global
+            return 'DEFAULT_LIMIT'
+        return (frozen_comp, (self.tup(),))
+
+
+_frozen = {}
+
+
+def frozen_comp(values):
+    """ Returns the shared FrozenComposition of values, which are given in
+    ELEMENTS order or as a mapping """
+    if isinstance(values, Mapping):
+        values = [values[e] for e in ELEMENTS]
+    values = tuple(values)
+    comp = _frozen.get(values)
+    if comp is None:
+        comp = FrozenComposition.__new__(FrozenComposition)
+        for e, v in zip(ELEMENTS, values):
+            object.__setattr__(comp, e, v)
+        comp = _frozen.setdefault(values, comp)
+    return comp
+
+
+# The limit of a Stone created without one
+DEFAULT_LIMIT = frozen_comp((255,) * len(ELEMENTS))
+
+
 class Stone(PersistentMapping):
     # Limit should be overwritten by classes that inherit from Stone.
+    # Stones with the default limit leave it out of their state.
+    limit = DEFAULT_LIMIT
+
     def __init__(self, comp=None, limit=None):
         super(Stone, self).__init__()
         if comp is None:
@@ -122,16 +308,29 @@ class Stone(PersistentMapping):
         else:
             comp = Composition.create(comp)
         self.comp = comp
-        if limit is None:
-            limit = Composition(255)
-        self.limit = limit
+        if limit is not None and limit is not DEFAULT_LIMIT:
+            self.limit = limit
+
+    def __setstate__(self, state):
+        super(Stone, self).__setstate__(state)
+        # Stones saved before limits were shared hold their own copy
+        limit = self.__dict__.get('limit')
+        if limit is DEFAULT_LIMIT or limit == DEFAULT_LIMIT:
+            del self.__dict__['limit']
+        elif (isinstance(limit, Composition) and
+                not isinstance(limit, FrozenComposition)):
+            shared = _frozen.get(limit.tup())
+            if shared is not None:
+                self.__dict__['limit'] = shared
 
     def api_view(self):
         return dict(limit=self.limit, comp=self.comp)
 
     def copy(self):
-        return Stone(comp=Composition.create(self.comp),
-                     limit=Composition.create(self.limit))
+        limit = self.limit
+        if not isinstance(limit, FrozenComposition):
+            limit = Composition.create(limit)
+        return Stone(comp=Composition.create(self.comp), limit=limit)
 
     def imbue(self, stone):
         """adds the values of stone.comp to self.comp up to self.limit.
@@ -252,11 +451,11 @@ def get_element(comp):
     """
     sort = sorted(comp.iteritems(), key=itemgetter(1), reverse=True)
     if sort[0][1] == sort[3][1]:  # they are all equal
-        return random.choice(sort)[0]
+        return rng().choice(sort)[0]
     elif sort[0][1] == sort[2][1]:
-        return random.choice(sort[:3])[0]
+        return rng().choice(sort[:3])[0]
     elif sort[0][1] == sort[1][1]:
-        return random.choice(sort[:2])[0]
+        return rng().choice(sort[:2])[0]
     else:
         return sort[0][0]
 
@@ -307,18 +506,18 @@ def rand_comp(element=None, kind=None, max_value=255):
 
     if kind == 'Stone':
         for element in comp:
-            comp[element] = random.randint(0, max_value)
+            comp[element] = rng().randint(0, max_value)
         return comp
     elif kind == 'Scient':
-        comp[element] = random.randint(1, max_value)
+        comp[element] = rng().randint(1, max_value)
         for picked in ORTH[element]:
             # NOTE: if comp[element] = 1 orths will be 0.
-            comp[picked] = random.randint(0, (comp[element] // 2))
+            comp[picked] = rng().randint(0, (comp[element] // 2))
         return comp
     elif kind == 'Nescient':
-        comp[element] = random.randint(1, max_value)
-        orth = random.choice(ORTH[element])
-        comp[orth] = random.randint(1, comp[element])
+        comp[element] = rng().randint(1, max_value)
+        orth = rng().choice(ORTH[element])
+        comp[orth] = rng().randint(1, comp[element])
         return comp
     elif kind == 'Weapon':
         pass
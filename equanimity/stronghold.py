@@ -12,10 +12,11 @@ from stone import Stone
 from units import Scient
 from unit_container import Squad, rand_squad, MappedContainer
 from weapons import weapons
-from const import ORTH, OPP, WEP_LIST, ELEMENTS
+from const import ORTH, OPP, WEP_LIST, ELEMENTS, CLOCK
 from factory import Stable, Armory, Home, Farm
 from silo import Silo
 from clock import now
+from db import resolve_state
 
 
 class Stronghold(Persistent):
@@ -190,6 +191,7 @@ class Stronghold(Persistent):
         if squad_num == self._defenders:
             self._defenders = None
         squad = self.squads.pop(squad_num)
+        self._check_garrisoned()
         return squad
 
     def disband_squad(self, squad_num):
@@ -206,12 +208,15 @@ class Stronghold(Persistent):
         """Takes a stone from stronghold and turns it into a Scient."""
         if self.occupancy + Scient.size > self.max_occupancy:
             raise ValueError("Not enough room in stronghold to form Scient")
-        comp = self.silo.get(comp)
-        scient = Scient(element, comp, name=name)
-        self.add_free_unit(scient)
+        scient = self._add_scient(element, self.silo.get(comp), name=name)
         self.feed_unit(scient.uid)
         return scient
 
+    def _add_scient(self, element, stone, name=None):
+        scient = Scient(element, stone, name=name)
+        self.add_free_unit(scient)
+        return scient
+
     def unequip_scient(self, unit_id):
         """Moves a weapon from a scient to the stronghold."""
         unit = self.units[unit_id]
@@ -238,6 +243,8 @@ class Stronghold(Persistent):
         stone = self.silo.get(comp)
         unit = self.units[unit_id]
         unit.imbue(stone)
+        if self.field.in_battle:
+            self.field.battle.battlefield.invalidate_turn_order()
         return unit
 
     def add_unit_to_squad(self, squad_num, unit_id):
@@ -262,37 +269,44 @@ class Stronghold(Persistent):
         # every two months from when the unit was born, discount the inventory
         # the unit's value.
         # Two weeks without food a unit dies.
-
-        def feed(unit, lnow):
-            self.silo.get(unit.comp)
-            unit.fed_on = now()
-
         unit = self.units[unit_id]
         lnow = now()
-        if unit.fed_on is None:
-            feed(unit, lnow)
-        else:
-            delta = lnow - unit.fed_on
-            dsecs = delta.total_seconds()
-            if dsecs > (self.field.clock.duration['day'] * 60):
-                if dsecs < (self.field.clock.duration['day'] * 72):
-                    feed(unit, lnow)
-                else:
-                    self.bury_unit(unit_id)
-            else:
-                pass  # unit already fed.
+        hunger = self._hunger(unit, lnow)
+        if hunger == 'hungry':
+            self.silo.get(unit.comp)
+            unit.fed_on = lnow
+        elif hunger == 'starved':
+            self.bury_unit(unit_id)
 
     def feed_units(self):
         """Attempts to feed units. check happens every game day."""
-        # 1. feed scients first.
-        # 2. feed nescients.
         # should not happen when field is embattled.
-        n = now()
-        for unit in self.units:
-            d = n - unit.fed_on
-            dsecs = d.total_seconds()
-            if dsecs > (self.field.clock.duration['day'] * 60):
-                self.feed_unit(unit.uid)
+        # Every hungry unit is fed from one withdrawal, or none are if the
+        # silo cannot feed them all.
+        lnow = now()
+        hungry = []
+        for unit in self.units.values():
+            hunger = self._hunger(unit, lnow)
+            if hunger == 'hungry':
+                hungry.append(unit)
+            elif hunger == 'starved':
+                self.bury_unit(unit.uid)
+        self.silo.get_many([unit.comp for unit in hungry])
+        for unit in hungry:
+            unit.fed_on = lnow
+
+    def _hunger(self, unit, lnow):
+        """ Returns 'hungry' if the unit is due to be fed, 'starved' if it
+        went unfed too long, or None if it was fed recently """
+        if unit.fed_on is None:
+            return 'hungry'
+        dsecs = (lnow - unit.fed_on).total_seconds()
+        day = CLOCK['day'].total_seconds()
+        if dsecs <= day * 60:
+            return None  # unit already fed.
+        elif dsecs < day * 72:
+            return 'hungry'
+        return 'starved'
 
     """ Weapon management """
 
@@ -302,7 +316,10 @@ class Stronghold(Persistent):
             raise ValueError('Invalid weapon type "{0}"'.format(weap_type))
         if element not in ELEMENTS:
             raise ValueError('Invalid element "{0}"'.format(element))
-        weapon = weapons[weap_type](element, self.silo.get(comp))
+        return self._add_weapon(element, self.silo.get(comp), weap_type)
+
+    def _add_weapon(self, element, stone, weap_type):
+        weapon = weapons[weap_type](element, stone)
         self.weapons.append(weapon)
         return weapon
 
@@ -408,6 +425,7 @@ class Stronghold(Persistent):
         if container == self:
             # If the unit is in free units, remove it from the stronghold
             del self.free[unit_id]
+            self._check_garrisoned()
         else:
             # Otherwise, move the unit into the free units
             if container.stronghold != self:
@@ -418,6 +436,12 @@ class Stronghold(Persistent):
             container.remove(unit)
             self.free.append(unit)
 
+    def _check_garrisoned(self):
+        """ Has the field checked for reverting to the WorldPlayer at the
+        next day change, once the stronghold is empty """
+        if not self.garrisoned:
+            self.field.schedule()
+
     def _get_automatic_defenders(self):
         """ Returns the highest valued squad, if one exists. Otherwise
         it forms a squad from the highest valued free units available.
@@ -463,12 +487,19 @@ class Stronghold(Persistent):
         for n in xrange(8):
             self.silo.imbue(s.copy())
         wcomp = Stone().comp
+        size = Scient.size * len(WEP_LIST)
+        if self.occupancy + size > self.max_occupancy:
+            raise ValueError("Not enough room in stronghold to form Scient")
+        # A body, a first meal and a weapon for each unit, in one withdrawal
+        stones = self.silo.get_many([s.comp, s.comp, wcomp] * len(WEP_LIST))
+        kits = zip(*[iter(stones)] * 3)
+        lnow = now()
         units = []
-        for wep in WEP_LIST:
-            unit = self.form_scient(element, s.comp)
+        for wep, (body, meal, wstone) in zip(WEP_LIST, kits):
+            unit = self._add_scient(element, body, name="Ms. " + wep)
+            unit.fed_on = lnow
             units.append(unit)
-            w = self.form_weapon(element, wcomp, wep)
-            self.name_unit(unit.uid, "Ms. " + wep)
+            w = self._add_weapon(element, wstone, wep)
             self.equip_scient(unit.uid, w.stronghold_pos)
         s = self.form_squad(unit_ids=[u.uid for u in units], name=name)
         self.defenders = s
@@ -518,6 +549,12 @@ class SparseList(Persistent):
         self._p_changed = 1
         return self.items.pop(key)
 
+    def _p_resolveConflict(self, old, committed, new):
+        # Changes at different positions merge. Appends at the same position
+        # conflict, since the items know their positions.
+        return resolve_state(old, committed, new, dicts=('items',),
+                             resolvers=dict(index=lambda o, c, n: max(c, n)))
+
 
 class SparseStrongholdList(SparseList):
 
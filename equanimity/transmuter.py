@@ -1,17 +1,21 @@
 import logilab.constraint as lc
+from math import floor
 from equanimity.const import ORTH, OPP, ELEMENTS, LETTERS
 from equanimity.stone import Stone, Composition
+from equanimity.helpers import LRUCache
 
 
 class Transmuter(object):
     """Takes a silo comp and need comp and returns the stone to be split
     from the silo or None."""
 
+    # Solver results, keyed by the clamped silo and need left after the
+    # direct subtraction. A failed search is stored as False.
+    cache = LRUCache(maxsize=4096)
+
     def __init__(self, silo, need):
         self.silo = dict(silo)
         self.need = dict(need)
-        # TODO -- if we want to cache answer, at this point we would lookup
-        # a previous solution based on inputs
         self.solution = None
         self.failed = False
 
@@ -33,14 +37,57 @@ class Transmuter(object):
             # Silo has nothing left in it, be we still need something
             return self._fail()
 
-        # Setup solver
+        # Reuse the answer to an equivalent problem
+        silo = self._clamp(silo, need)
+        key = self._cache_key(silo, need)
+        cost = self.cache.get(key)
+        if cost is False:
+            return self._fail()
+        if cost is not None:
+            self.solution = Composition.from_sequence(cost)
+            return Stone(self.solution)
+
+        variables, subvariables = self._generate_variables(silo, need)
+        solution = ElementSolver(silo, need, variables, subvariables).solve()
+        try:
+            self.solution = self._compute_cost(solution)
+        except ValueError:
+            self.cache[key] = False
+            raise
+        self.cache[key] = tuple(self.solution[e] for e in ELEMENTS)
+        return Stone(self.solution)
+
+    def _clamp(self, silo, need):
+        """ Caps each silo value at the most that could be spent on need.
+        An orthogonal element is spent 2:1 and the opposite element 4:1,
+        with the remainder rounded away, so 2n+1 and 4n+3 are the most that
+        can go towards a need of n. Anything above that cannot change the
+        solution. """
+        clamped = {}
+        for k, v in silo.iteritems():
+            most = 0
+            for n, m in need.iteritems():
+                if n == k:
+                    most += m
+                elif n == OPP[k]:
+                    most += 4 * m + 3
+                else:
+                    most += 2 * m + 1
+            clamped[k] = min(v, most)
+        return clamped
+
+    def _cache_key(self, silo, need):
+        return (tuple(silo.get(e, 0) for e in ELEMENTS),
+                tuple(need.get(e, 0) for e in ELEMENTS))
+
+    def _solve_constraints(self, silo, need):
+        """ Solves with the generic constraint solver. ElementSolver returns
+        the same solution, much faster. """
         variables, subvariables = self._generate_variables(silo, need)
         constraints = self._generate_constraints(silo, need, variables,
                                                  subvariables)
         domains = self._generate_domains(silo, need, variables)
-        solution = self._solve(variables, domains, constraints)
-        self.solution = self._compute_cost(solution)
-        return Stone(self.solution)
+        return self._solve(variables, domains, constraints)
 
     def _filter_zeroes(self, comp):
         return {k: v for k, v in comp.iteritems() if v}
@@ -159,3 +206,245 @@ class Transmuter(object):
         for e in ELEMENTS:
             comp.setdefault(e, 0)
         return comp
+
+
+class Infeasible(Exception):
+    pass
+
+
+class ElementSolver(object):
+
+    """Solves the constraints built by Transmuter._generate_constraints
+    directly on integers, returning the solution logilab.constraint's
+    Solver().solve_one would, or None.
+
+    Each needN must equal the sum of the siloXN meant for it, where an
+    orthogonal element counts at 1/2 and the opposite element at 1/4,
+    rounded down, and each siloX must cover its siloXN. The generic solver
+    narrows these by enumerating every combination of values; here they
+    are narrowed arithmetically. Everything that decides which solution is
+    found first is kept: the order constraints are narrowed in, the
+    constraints it drops as entailed, and the domain splits of its default
+    DichotomyDistributor, made on the same sets so values come out in the
+    same order."""
+
+    def __init__(self, silo, need, variables, subvariables):
+        self.domains = {}
+        self.constraints = []
+        for v in variables:
+            if v.startswith('silo'):
+                m = silo[LETTERS[v[4]]] + 1
+                self.domains[v] = set(range(0, m))
+            else:
+                self.domains[v] = set([need[LETTERS[v[-1]]]])
+        # Same order as _generate_constraints creates them in
+        for ele in subvariables:
+            sup = 'silo' + ele[0]
+            self._add(_Equals(sup, silo[LETTERS[ele[0]]]))
+            subs = [(v, 1) for v in subvariables[ele]]
+            self._add(_Sum(sup, subs, equal=False))
+        for v in variables:
+            if not v.startswith('need'):
+                continue
+            terms = []
+            ele = 'silo' + v[-1] + v[-1]
+            if ele in variables:
+                terms.append((ele, 1))
+            for n in ORTH[LETTERS[v[-1]]]:
+                ele = 'silo' + n[0] + v[-1]
+                if ele in variables:
+                    terms.append((ele, 2))
+            opp = 'silo' + OPP[LETTERS[v[-1]]][0] + v[-1]
+            if opp in variables:
+                terms.append((opp, 4))
+            self._add(_Equals(v, need[LETTERS[v[-1]]]))
+            self._add(_Sum(v, terms, equal=True))
+
+    def _add(self, constraint):
+        # The generic solver breaks ties between equally costly constraints
+        # by comparing the objects, i.e. in the order they were made
+        constraint.order = len(self.constraints)
+        self.constraints.append(constraint)
+
+    def solve(self):
+        return self._search(self.domains, self.constraints)
+
+    def _search(self, domains, constraints):
+        constraints = list(constraints)
+        try:
+            solved = self._consistency(domains, constraints)
+        except Infeasible:
+            return None
+        if solved:
+            return {v: list(d)[0] for v, d in domains.iteritems()}
+        var = min((len(d), v) for v, d in domains.iteritems() if len(d) > 1)[1]
+        replicas = [{v: set(d) for v, d in domains.iteritems()}
+                    for _ in xrange(2)]
+        values = list(replicas[0][var])
+        size = max(1, len(values) * 1. / 2)
+        for i, replica in enumerate(replicas):
+            replica[var].difference_update(values[:int(floor(i * size))])
+            replica[var].difference_update(values[int(floor((i + 1) *
+                                                            size)):])
+        for replica in replicas:
+            solution = self._search(replica, constraints)
+            if solution is not None:
+                return solution
+
+    def _consistency(self, domains, constraints):
+        """ Narrows the domains, returning True if only one value is left
+        in each. Entailed constraints are removed from constraints. """
+        def key(c):
+            return (c.cost(domains), c.order)
+
+        listeners = {}
+        for c in constraints:
+            for v in c.variables:
+                listeners.setdefault(v, []).append(c)
+        queue = sorted(constraints, key=key)
+        affected = set()
+        while True:
+            if not queue:
+                queue = sorted(affected, key=key)
+                if not queue:
+                    break
+                affected.clear()
+            c = queue.pop(0)
+            entailed, changed = c.narrow(domains)
+            for v in changed:
+                for other in listeners[v]:
+                    if other is not c:
+                        affected.add(other)
+            if entailed:
+                constraints.remove(c)
+                for v in c.variables:
+                    listeners[v].remove(c)
+                affected.discard(c)
+        return all(len(d) == 1 for d in domains.itervalues())
+
+
+def _keep(domain, keep):
+    """ Removes the values not in keep from domain, returning True if any
+    were removed """
+    remove = [v for v in domain if v not in keep]
+    if not remove:
+        return False
+    domain.difference_update(remove)
+    if not domain:
+        raise Infeasible()
+    return True
+
+
+def _sums(sets):
+    """ Returns every sum of one value from each of sets """
+    sums = set([0])
+    for values in sets:
+        sums = set(a + b for a in sums for b in values)
+    return sums
+
+
+class _Equals(object):
+
+    """ var == value """
+
+    def __init__(self, var, value):
+        self.var = var
+        self.value = value
+        self.variables = [var]
+
+    def cost(self, domains):
+        return len(domains[self.var])
+
+    def narrow(self, domains):
+        domain = domains[self.var]
+        entailed = (domain == set([self.value]))
+        changed = []
+        if _keep(domain, set([self.value])):
+            changed.append(self.var)
+        return entailed, changed
+
+
+class _Sum(object):
+
+    """ lhs == sum(var / divisor) if equal, else lhs >= sum(var / divisor),
+    with integer division """
+
+    def __init__(self, lhs, terms, equal=True):
+        self.lhs = lhs
+        self.terms = terms
+        self.equal = equal
+        self.variables = [lhs] + [v for v, _ in terms]
+
+    def cost(self, domains):
+        cost = 1
+        for v in self.variables:
+            cost *= len(domains[v])
+        return cost
+
+    def holds(self, values):
+        total = sum(values[v] // d for v, d in self.terms)
+        if self.equal:
+            return values[self.lhs] == total
+        return values[self.lhs] >= total
+
+    def narrow(self, domains):
+        """ Returns whether the constraint is entailed, and the variables
+        whose domains were narrowed """
+        if len(self.variables) > 2:
+            # The generic narrowing of three or more variables skips any
+            # combination of values that have each been seen to satisfy the
+            # constraint, until one fails. So while the first value of each
+            # domain, and each single change to those, all pass, it takes
+            # the constraint as entailed without checking anything else.
+            if self._star_holds(domains):
+                return True, []
+            entailed = False
+        else:
+            entailed = self._all_hold(domains)
+        images = [set(v // d for v in domains[var]) for var, d in self.terms]
+        changed = []
+        if _keep(domains[self.lhs], self._lhs_support(domains, images)):
+            changed.append(self.lhs)
+        for i, (var, d) in enumerate(self.terms):
+            rest = images[:i] + images[i + 1:]
+            keep = self._term_support(domains, var, d, rest)
+            if _keep(domains[var], keep):
+                changed.append(var)
+        return entailed, changed
+
+    def _star_holds(self, domains):
+        first = {v: list(domains[v])[0] for v in self.variables}
+        if not self.holds(first):
+            return False
+        for var in self.variables:
+            values = dict(first)
+            for x in domains[var]:
+                values[var] = x
+                if not self.holds(values):
+                    return False
+        return True
+
+    def _all_hold(self, domains):
+        # Only used with a single term
+        var, d = self.terms[0]
+        low = min(domains[var]) // d
+        high = max(domains[var]) // d
+        lhs = domains[self.lhs]
+        if self.equal:
+            return low == high and lhs == set([low])
+        return min(lhs) >= high
+
+    def _lhs_support(self, domains, images):
+        if self.equal:
+            return _sums(images)
+        low = sum(min(i) for i in images)
+        return set(v for v in domains[self.lhs] if v >= low)
+
+    def _term_support(self, domains, var, d, rest):
+        lhs = domains[self.lhs]
+        if self.equal:
+            sums = _sums(rest)
+            return set(v for v in domains[var]
+                       if any(n - v // d in sums for n in lhs))
+        most = max(lhs) - sum(min(i) for i in rest)
+        return set(v for v in domains[var] if v // d <= most)
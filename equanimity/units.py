@@ -4,17 +4,19 @@ units.py
 Created by AFD on 2013-08-05.
 Copyright (c) 2013 A. Frederick Dudley. All rights reserved.
 """
-import random
 from datetime import datetime
-from stone import Stone, Composition, rand_comp
+from stone import Stone, Composition, rand_comp, frozen_comp
 from const import ELEMENTS, E, F, I, W, ORTH, OPP, UNIT_KINDS
 from grid import Hex
 from server import db
-from helpers import validate_length, rand_string, rand_element
+from helpers import validate_length, rand_string, rand_element, rng
 
 
 UNIT_NAME_LEN = dict(max=64, min=1)
 
+# Limit of a Scient's equip_limit, shared by every Scient
+EQUIP_LIMIT = frozen_comp((256,) * len(ELEMENTS))
+
 
 class Unit(Stone):
     attrs = ['p', 'm', 'atk', 'defe', 'pdef', 'patk', 'mdef', 'matk', 'hp']
@@ -160,9 +162,7 @@ class Scient(Unit):
             self.weapon_bonus = Stone()
         else:
             self.weapon_bonus = weapon_bonus
-        self.equip_limit = Stone({E: 1, F: 1, I: 1, W: 1})
-        for element in ELEMENTS:
-            self.equip_limit.limit[element] = 256
+        self.equip_limit = Stone({E: 1, F: 1, I: 1, W: 1}, limit=EQUIP_LIMIT)
         for i in self.equip_limit:
             self.equip_limit[i] = (self.equip_limit[i] + self.comp[i] +
                                    self.weapon_bonus[i])
@@ -354,7 +354,7 @@ def rand_unit(element=None, kind=None, max_value=255):
     """Returns a random Scient of element. Random element used if none given.
     """
     if kind is None:
-        kind = random.choice(UNIT_KINDS)
+        kind = rng().choice(UNIT_KINDS)
     if kind not in UNIT_KINDS:
         raise ValueError('Unknown unit kind {0}'.format(kind))
 
@@ -1,13 +1,24 @@
+import logging
+import transaction
 from persistent import Persistent
 from world import World, PlayerGroup
 from server import db
 
 
+# Vestibule states
+OPEN, BUILDING, READY, FAILED = 'open', 'building', 'ready', 'failed'
+
+
 class Vestibule(Persistent):
 
     """ A game waiting for players to start
     """
 
+    state = OPEN
+    # (done, total) steps of the world build
+    progress = (0, 0)
+    error = None
+
     @classmethod
     def get(self, uid):
         return db['vestibules'].get(uid)
@@ -30,14 +41,51 @@ class Vestibule(Persistent):
     def persist(self):
         db['vestibules'][self.uid] = self
 
+    def status(self):
+        done, total = self.progress
+        return dict(uid=self.uid, state=self.state, world=self.world,
+                    done=done, total=total, error=self.error)
+
     def start(self):
         """ Create a World for these players """
         w = World.create()
         w.players.add_all(self.players.players.values())
         w.start()
         self.world = w.uid
+        self.state = READY
+        return w
+
+    def begin_build(self):
+        """ Creates an empty World for these players, to be filled in by
+        build() """
+        if self.state != OPEN:
+            raise ValueError('Vestibule is already {0}'.format(self.state))
+        w = World.create(create_fields=False)
+        w.players.add_all(self.players.players.values())
+        self.world = w.uid
+        self.state = BUILDING
         return w
 
+    def build(self, batch_size=32):
+        """ Builds the World made by begin_build, committing after each
+        batch of fields. The vestibule is ready once it is done. """
+        try:
+            for progress in World.get(self.world).build(batch_size):
+                self.progress = progress
+                transaction.commit()
+        except Exception as e:
+            transaction.abort()
+            logging.getLogger(__name__).exception('World build failed')
+            self.fail(e)
+        else:
+            self.state = READY
+        transaction.commit()
+
+    def fail(self, error):
+        """ Marks the world build failed with error """
+        self.state = FAILED
+        self.error = str(error)
+
     def __eq__(self, other):
         if not isinstance(other, self.__class__):
             return False
@@ -4,9 +4,8 @@ weapons.py
 Created by AFD on 2013-08-05.
 Copyright (c) 2013 A. Frederick Dudley. All rights reserved.
 """
-from random import choice
 from stone import Stone
-from helpers import rand_element
+from helpers import rand_element, rng
 from const import ELEMENTS
 from stone import rand_comp
 
@@ -187,7 +186,7 @@ def rand_weapon(element=None, weapon=None, max_value=255):
     if element not in ELEMENTS:
         raise ValueError('Unknown element {0}'.format(element))
     if weapon is None:
-        weapon = choice(weapons.keys())
+        weapon = rng().choice(weapons.keys())
     if weapon not in weapons:
         raise ValueError('Invalid weapon {0}'.format(weapon))
     weapon = weapons[weapon]
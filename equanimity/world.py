@@ -10,46 +10,23 @@ import logging
 logging.basicConfig()
 import transaction
 from persistent import Persistent
-from collections import defaultdict
 from frozendict import frozendict
-from BTrees.OOBTree import OOBTree
+from BTrees.OOBTree import OOBTree, OOTreeSet
 from BTrees.IOBTree import IOBTree
-from random import choice, randrange, sample, shuffle, randint
-from clock import WorldClock
+from BTrees.Length import Length
+from clock import WorldClock, CATCH_UP_MAX_DAYS, CATCH_UP_BATCH_DAYS
 from const import ELEMENTS, ORTH
 from stone import Stone, Composition
 from grid import Grid, SquareGrid
 from player import WorldPlayer, PlayerGroup
 from db import AutoID
+from helpers import rng
 from server import db
 
 
 def init_db(reset=False, verbose=False, grid_radius=8, square_grid=False):
     """ Creates top level datastructures in the ZODB """
-
-    if square_grid:
-        grid = lambda: SquareGrid(radius=grid_radius)
-    else:
-        grid = lambda: Grid(radius=grid_radius)
-    start = dict(player_uid=lambda: AutoID('player'),
-                 # maps uid (int) -> Player
-                 players=lambda: IOBTree(),
-                 # maps username (str) -> Player
-                 player_username=lambda: OOBTree(),
-                 # maps email (str) -> Player
-                 player_email=lambda: OOBTree(),
-                 unit_uid=lambda: AutoID('unit'),
-                 units=lambda: IOBTree(),
-                 world_uid=lambda: AutoID('world'),
-                 worlds=lambda: IOBTree(),
-                 rate_limit=lambda: defaultdict(AutoID),
-                 weapons=lambda: IOBTree(),
-                 battles=lambda: IOBTree(),
-                 battle_uid=lambda: AutoID('battle'),
-                 vestibules=lambda: IOBTree(),
-                 vestibule_uid=lambda: AutoID('vestibule'),
-                 grid=grid)
-
+    start = root_factories(grid_radius=grid_radius, square_grid=square_grid)
     for k, v in start.iteritems():
         if reset:
             db[k] = v()
@@ -61,8 +38,42 @@ def init_db(reset=False, verbose=False, grid_radius=8, square_grid=False):
     transaction.commit()
 
 
+def root_factories(grid_radius=8, square_grid=False):
+    """ Returns a dict mapping each top level key in the ZODB to a callable
+    that creates its initial value """
+    if square_grid:
+        grid = lambda: SquareGrid(radius=grid_radius)
+    else:
+        grid = lambda: Grid(radius=grid_radius)
+    return dict(player_uid=lambda: AutoID('player'),
+                # maps uid (int) -> Player
+                players=lambda: IOBTree(),
+                # maps username (str) -> Player
+                player_username=lambda: OOBTree(),
+                # maps email (str) -> Player
+                player_email=lambda: OOBTree(),
+                unit_uid=lambda: AutoID('unit'),
+                units=lambda: IOBTree(),
+                world_uid=lambda: AutoID('world'),
+                worlds=lambda: IOBTree(),
+                weapons=lambda: IOBTree(),
+                battles=lambda: IOBTree(),
+                battle_uid=lambda: AutoID('battle'),
+                vestibules=lambda: IOBTree(),
+                vestibule_uid=lambda: AutoID('vestibule'),
+                grid=grid)
+
+
 class World(Persistent):
 
+    # Maps player uid -> OOTreeSet of the coordinates of their fields.
+    # None for worlds stored before the index existed; it is rebuilt from
+    # the fields on first use.
+    _owned_fields = None
+    # Counts ownership changes, so that connections can tell when their
+    # cached visibility sets are stale
+    _ownership_version = None
+
     @classmethod
     def get(self, uid):
         return db['worlds'].get(uid)
@@ -84,6 +95,8 @@ class World(Persistent):
         self.clock = WorldClock()
         self.grid = db['grid']
         self.fields = frozendict()
+        self._owned_fields = IOBTree()
+        self._ownership_version = Length()
         if create_fields:
             self._create_fields()
 
@@ -91,17 +104,124 @@ class World(Persistent):
         """ Saves the world to the ZODB """
         db['worlds'][self.uid] = self
 
+    def set_fields(self, fields):
+        """ Makes fields, a dict by coordinate, the world's fields. Their
+        owners were set before they were ours, so they are indexed here. """
+        self.fields = frozendict(fields)
+        self._owned_fields = None
+        self._get_field_index()
+
     def award_field(self, new_owner, coords):
         """Transfers a field from one owner to another."""
         if not self.players.has(new_owner):
             raise ValueError('Not participating')
         self.fields[coords].owner = new_owner
 
+    def get_owned_fields(self, player):
+        """ Returns the fields owned by player, by coordinate """
+        coords = self._get_field_index().get(player.uid, ())
+        return {c: self.fields[c] for c in coords}
+
+    def get_visible_fields(self, player):
+        """ Returns the coordinates of the fields player can see: their own
+        and those adjacent to them. Cached until ownership changes. """
+        index = self._get_field_index()
+        version = self._ownership_version()
+        cache = getattr(self, '_v_visible', None)
+        if cache is None or cache[0] != version:
+            cache = self._v_visible = (version, {})
+        visible = cache[1].get(player.uid)
+        if visible is None:
+            visible = set()
+            for c in index.get(player.uid, ()):
+                visible.add(c)
+                visible |= self.grid.get_adjacent(c)
+            visible = cache[1][player.uid] = frozenset(visible)
+        return visible
+
+    def _field_owner_changed(self, field, old_owner):
+        """ Moves field between players in the ownership index. Called by
+        the Field.owner setter. """
+        coord = field.world_coord
+        if self.fields.get(coord) is not field:
+            # Not one of our fields, or not yet
+            return
+        index = self._get_field_index()
+        if old_owner is not None and old_owner.uid in index:
+            owned = index[old_owner.uid]
+            if coord in owned:
+                owned.remove(coord)
+            if not owned:
+                del index[old_owner.uid]
+        if field.owner is not None:
+            owned = index.get(field.owner.uid)
+            if owned is None:
+                owned = index[field.owner.uid] = OOTreeSet()
+            owned.insert(coord)
+        self._ownership_version.change(1)
+
+    def _get_field_index(self):
+        if self._owned_fields is None:
+            index = IOBTree()
+            for c, f in self.fields.iteritems():
+                owned = index.get(f.owner.uid)
+                if owned is None:
+                    owned = index[f.owner.uid] = OOTreeSet()
+                owned.insert(c)
+            self._owned_fields = index
+            if self._ownership_version is None:
+                self._ownership_version = Length()
+            self._ownership_version.change(1)
+        return self._owned_fields
+
     def start(self):
         """ Starts the game """
         self._distribute_fields_to_players()
         self._populate_fields()
 
+    def tick(self, max_days=CATCH_UP_MAX_DAYS,
+             batch_days=CATCH_UP_BATCH_DAYS):
+        """ Advances the clock, replaying any missed days a batch at a time
+        and committing after each batch. Returns the number of days still
+        behind. """
+        for done, behind in self.clock.catch_up(self.fields,
+                                                max_days=max_days,
+                                                batch_days=batch_days):
+            transaction.commit()
+        if behind:
+            msg = 'World {0} clock is {1} days behind'
+            logging.getLogger(__name__).warning(msg.format(self.uid, behind))
+        return behind
+
+    def build(self, batch_size=32):
+        """ Creates the fields of a world created without them and starts
+        the game, a batch of fields at a time. Yields (done, total) steps
+        after each batch, so that the caller can commit in between. """
+        coords = list(self.grid.iter_coords())
+        total = 2 * len(coords) + 1
+        done = 0
+        fields = dict(self.fields)
+        for i in xrange(0, len(coords), batch_size):
+            batch = coords[i:i + batch_size]
+            for coord in batch:
+                fields[coord] = self._create_field(coord)
+            self.fields = frozendict(fields)
+            for coord in batch:
+                # Indexed now that it is one of ours
+                self._field_owner_changed(fields[coord], None)
+            done += len(batch)
+            yield done, total
+        self._distribute_fields_to_players()
+        done += 1
+        yield done, total
+        fields = self.fields.values()
+        for i in xrange(0, len(fields), batch_size):
+            batch = fields[i:i + batch_size]
+            for f in batch:
+                self._populate_field(f)
+            done += len(batch)
+            yield done, total
+
     def _distribute_fields_to_players(self):
         """ Assigns fields to participating players """
         # Setup a player, field_count list
@@ -110,7 +230,7 @@ class World(Persistent):
         coords = list(self.grid.iter_coords())
         each_get = len(coords) // len(players)
         # Randomize
-        shuffle(coords)
+        rng().shuffle(coords)
         # Get the coordinates of the fields, minus any fields not to be
         # assigned to players (at random)
         extra = len(coords) - (each_get * len(players))
@@ -122,13 +242,13 @@ class World(Persistent):
                     # This player has all their fields
                     continue
                 # Fields should be distributed in clusters of 1-4
-                cluster_size = min(randint(1, 4), each_get - i - 1)
+                cluster_size = min(rng().randint(1, 4), each_get - i - 1)
                 # Get the starting coordinate
-                ours = [coords.pop(randrange(len(coords)))]
+                ours = [coords.pop(rng().randrange(len(coords)))]
                 # Get random available adjacent coordinates for the cluster
                 if cluster_size:
                     adj = self.grid.get_adjacent(ours[0])
-                    extra = sample(adj, min(cluster_size, len(adj)))
+                    extra = rng().sample(adj, min(cluster_size, len(adj)))
                     for x in extra:
                         if x in coords:
                             ours.append(coords.pop(coords.index(x)))
@@ -144,43 +264,49 @@ class World(Persistent):
         and before the game begins.
         """
         for f in self.fields.values():
-            kind = None
-            if f.owner != self.player:
-                kind = 'Scient'
-            f.stronghold.populate(kind=kind, size=1)
+            self._populate_field(f)
+
+    def _populate_field(self, f):
+        kind = None
+        if f.owner != self.player:
+            kind = 'Scient'
+        f.stronghold.populate(kind=kind, size=1)
 
     def _choose_initial_field_element(self, coord):
         """ Decide what element to assign a field based on coordinate """
         # For now, just choose a random element. Later, distribute the
         # elements by a heuristic
-        return choice(ELEMENTS)
+        return rng().choice(ELEMENTS)
 
     def _choose_initial_field_grid(self, element, coord):
         """Decide what stones to populate a grid's tiles with and return
         the grid
         """
         c = Composition()
-        c[element] = randrange(20, 40)
-        c.set_opp(element, randrange(5, 10))
+        c[element] = rng().randrange(20, 40)
+        c.set_opp(element, rng().randrange(5, 10))
         for x in ORTH[element]:
-            c[x] = randrange(10, 20)
+            c[x] = rng().randrange(10, 20)
         return Grid(comp=Stone(c), radius=self.grid.radius)
 
     def _create_fields(self):
         """ Creates all fields used in a game. """
-        from field import Field
         fields = {}
         for coord in self.grid.iter_coords():
-            """
-            Field need to be given:
-              An element
-              Grid needs to filled with values based on a target value,
-                  and the field's element
-              Fully equipped squad in stronghold
-                  (NO, do this when assigning to a player, after game is
-                   started)
-            """
-            e = self._choose_initial_field_element(coord)
-            grid = self._choose_initial_field_grid(e, coord)
-            fields[coord] = Field(self, coord, e, owner=self.player, grid=grid)
-        self.fields = frozendict(fields)
+            fields[coord] = self._create_field(coord)
+        self.set_fields(fields)
+
+    def _create_field(self, coord):
+        """
+        Field need to be given:
+          An element
+          Grid needs to filled with values based on a target value,
+              and the field's element
+          Fully equipped squad in stronghold
+              (NO, do this when assigning to a player, after game is
+               started)
+        """
+        from field import Field
+        e = self._choose_initial_field_element(coord)
+        grid = self._choose_initial_field_grid(e, coord)
+        return Field(self, coord, e, owner=self.player, grid=grid)
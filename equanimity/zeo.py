@@ -8,6 +8,7 @@ from ZEO import ClientStorage
 from ZODB import DB
 import transaction
 from player import Player
+from db import warm_cache, class_factory
 
 #ZODB needs to log stuff
 import logging
@@ -19,11 +20,22 @@ class Zeo(object):
         self.conn = self.db.open()
         self.root = self.conn.root()
 
-    def __init__(self, addr=('localhost', 9100)):
+    def __init__(self, addr=('localhost', 9100), cache_size=64 * 1024 ** 2,
+                 client=None, var=None, pool_size=7, object_cache_size=10000,
+                 warm_roots=()):
+        """ cache_size is the size in bytes of the ZEO client cache, which is
+        kept in the file named client in the directory var if client is
+        given. pool_size and object_cache_size size the connection pool and
+        the object cache of each connection. """
         self.addr = addr
-        self.storage = ClientStorage.ClientStorage(self.addr)
-        self.db = DB(self.storage)
+        self.storage = ClientStorage.ClientStorage(
+            self.addr, cache_size=cache_size, client=client, var=var)
+        self.db = DB(self.storage, pool_size=pool_size,
+                     cache_size=object_cache_size)
+        self.db.classFactory = class_factory
         self.open()
+        if warm_roots:
+            warm_cache(self.conn, warm_roots)
 
     def close(self):
         return self.db.close()
@@ -1,15 +1,142 @@
 import os
 import logging
+import zodburi
+import transaction
+from urllib import urlencode
+from urlparse import parse_qsl
+from ZODB import DB
+from collections import Mapping
+from contextlib import contextmanager
+from threading import local
 from formencode.htmlfill import render as render_form
 from flask.ext.seasurf import SeaSurf
-from flask.ext.zodb import ZODB
+from flask.ext.zodb import ZODB as _ZODB
 from flask.ext.bcrypt import Bcrypt
 from flask.ext.login import LoginManager
 from flask.ext.jsonrpc import JSONRPC
 from flask import Flask, g, Blueprint
+from flask.json import JSONEncoder as _JSONEncoder
 
 
 """ ZODB """
+
+# Maps config values to the query parameters of zodburi storage URIs.
+# The ZEO_* ones only apply to zeo:// URIs
+DB_URI_PARAMS = dict(ZODB_POOL_SIZE='connection_pool_size',
+                     ZODB_CACHE_SIZE='connection_cache_size',
+                     ZODB_CACHE_SIZE_BYTES='connection_cache_size_bytes')
+ZEO_URI_PARAMS = dict(ZEO_CACHE_SIZE='cache_size',
+                      ZEO_CACHE_DIR='var',
+                      ZEO_CLIENT='client')
+
+
+def zeo_client_name(name):
+    """ Returns the name of this process' persistent ZEO cache. The
+    workers of a uwsgi server each need a cache file of their own. """
+    try:
+        import uwsgi
+    except ImportError:
+        return name
+    return '{0}-{1}'.format(name, uwsgi.worker_id())
+
+
+def storage_uri(config):
+    """ Returns the ZODB_STORAGE URI, with the cache and pool config values
+    added to its query. Parameters already in the URI are kept. """
+    uri = config['ZODB_STORAGE']
+    params = DB_URI_PARAMS.copy()
+    if uri.startswith('zeo://'):
+        params.update(ZEO_URI_PARAMS)
+    base, sep, query = uri.partition('?')
+    query = parse_qsl(query)
+    given = set(k for k, v in query)
+    for key, param in sorted(params.iteritems()):
+        value = config.get(key)
+        if value is None or param in given:
+            continue
+        if key == 'ZEO_CLIENT':
+            value = zeo_client_name(value)
+        query.append((param, value))
+    if not query:
+        return base
+    return base + '?' + urlencode(query)
+
+
+class ZODB(_ZODB):
+
+    """ Flask-ZODB extension whose root can be swapped for a plain mapping,
+    so that game code can run without an app or a storage (e.g. in the
+    headless battle simulator). The swap only applies to the thread that
+    made it. """
+
+    _swapped = local()
+
+    @property
+    def root(self):
+        """ The root swapped in by use() in this thread, if any """
+        return getattr(self._swapped, 'root', None)
+
+    @property
+    def data(self):
+        root = self.root
+        if root is not None:
+            return root
+        return _ZODB.data.fget(self)
+
+    def create_db(self, app):
+        from equanimity.db import class_factory
+        storage = app.config.get('ZODB_STORAGE')
+        if isinstance(storage, basestring):
+            factory, dbargs = zodburi.resolve_uri(storage_uri(app.config))
+            database = DB(factory(), **dbargs)
+        else:
+            database = _ZODB.create_db(self, app)
+        database.classFactory = class_factory
+        # AutoIDs stored in it hand out IDs from blocks this large, see
+        # equanimity.db.IDLease
+        database.id_block_size = app.config.get('AUTO_ID_BLOCK_SIZE', 1)
+        return database
+
+    def warm_up(self, app):
+        """ Warms the caches of app's database with the objects under its
+        ZODB_WARM_ROOTS. Called once by each server process when it starts,
+        see server.wsgi. Returns the number of objects loaded """
+        roots = app.config.get('ZODB_WARM_ROOTS')
+        if not roots:
+            return 0
+        loaded = self.warm(app.extensions['zodb'].db, roots,
+                           app.config.get('ZODB_WARM_LIMIT'))
+        app.logger.debug('Warmed %d objects', loaded)
+        return loaded
+
+    def warm(self, database, roots, limit=None):
+        """ Loads the objects under roots into the caches of a pooled
+        connection and of the storage, so that the first requests don't
+        each fetch them from the server """
+        from equanimity.db import warm_cache
+        tm = transaction.TransactionManager()
+        conn = database.open(transaction_manager=tm)
+        try:
+            kwargs = {}
+            if limit is not None:
+                kwargs['limit'] = limit
+            loaded = warm_cache(conn, roots, **kwargs)
+        finally:
+            tm.abort()
+            conn.close()
+        return loaded
+
+    @contextmanager
+    def use(self, root):
+        """ Uses root in place of the ZODB root within the block """
+        prev = self.root
+        self._swapped.root = root
+        try:
+            yield root
+        finally:
+            self._swapped.root = prev
+
+
 db = ZODB()
 
 """ JSONRPC """
@@ -25,6 +152,20 @@ login_manager = LoginManager()
 csrf = SeaSurf()
 
 
+""" JSON """
+
+
+class JSONEncoder(_JSONEncoder):
+
+    """ Encodes mappings that are not dicts, such as Composition, as
+    objects """
+
+    def default(self, o):
+        if isinstance(o, Mapping):
+            return dict(o)
+        return super(JSONEncoder, self).default(o)
+
+
 def setup_login_manager(app):
     login_manager.login_view = 'users.login'
     login_manager.refresh_view = 'users.login'
@@ -117,6 +258,9 @@ def create_app(subdomain='', config=None):
     """ ZODB """
     db.init_app(app)
 
+    """ JSON """
+    app.json_encoder = JSONEncoder
+
     """ JSONRPC """
     jsonrpc.init_app(app)
 
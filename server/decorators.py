@@ -1,10 +1,12 @@
-import transaction
 import traceback
 from functools import wraps
-from flask import g, current_app, request, jsonify, abort
+from flask import (g, current_app, request, jsonify, abort,
+                   has_request_context)
 from flask.ext.login import current_user
 from formencode import variabledecode, Invalid as InvalidSchema
 from server.utils import api_error, RateLimit
+from server import db
+from server.transactions import get_runner
 
 
 def api(f):
@@ -109,23 +111,32 @@ def require_login(f):
     return wrapped
 
 
-def commit(f):
+def commit(name):
     """ Commits to zodb after the decorated function has been
-    called
+    called. Conflicting transactions are retried by the app's
+    TransactionRunner, and counted under name, which should be the RPC
+    method name, e.g. @commit('battle.move'). Used bare, as @commit, they are
+    counted under the function's name.
+
+    A retry calls the function again, so it must not have effects outside
+    of the transaction; defer those to an after commit hook, as run_job does.
     """
+    if callable(name):
+        return _commit(name, name.__name__)
+    return lambda f: _commit(f, name)
+
+
+def _commit(f, name):
     @wraps(f)
     def wrapped(*args, **kwargs):
+        if has_request_context():
+            # Opening the request's connection begins its transaction, which
+            # must happen before the runner looks at the transaction
+            db.connection
         try:
-            r = f(*args, **kwargs)
+            return get_runner().run(name, f, *args, **kwargs)
         except Exception as e:
             print traceback.format_exc()
             print 'RPC function error:', str(e)
             raise
-        try:
-            transaction.commit()
-        except Exception as e:
-            print traceback.format_exc()
-            print 'Commit error:', str(e)
-            raise
-        return r
     return wrapped
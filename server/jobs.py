@@ -0,0 +1,91 @@
+""" Runs long jobs, such as building a world, outside of the request that
+started them. Jobs start once the request's transaction has committed, so
+they see its changes, and don't start if it is aborted. JOB_RUNNER in the
+app config picks how they run:
+
+    'process' -- a forked worker process, which opens its own connections
+                 to the storage, with a cache in memory. Needs a shared
+                 storage such as ZEO.
+    'thread'  -- a worker thread in this process.
+    'inline'  -- a worker thread that the committing request waits for.
+"""
+import logging
+import transaction
+from threading import Thread
+from multiprocessing import Process
+from flask import current_app
+
+
+RUNNERS = ('process', 'thread', 'inline')
+
+
+class Job(object):
+
+    """ A call of f(*args, **kwargs) in a request context of its own. If it
+    raises, on_error(error, *args, **kwargs) is called in a new transaction.
+    """
+
+    def __init__(self, app, f, args, kwargs, on_error=None):
+        self.app = app
+        self.f = f
+        self.args = args
+        self.kwargs = kwargs
+        self.on_error = on_error
+        self.worker = None
+
+    def start(self, committed=True):
+        """ Starts the worker, unless the transaction that scheduled the job
+        failed to commit. Used as an after commit hook. """
+        if not committed:
+            return
+        runner = self.app.config.get('JOB_RUNNER', 'process')
+        if runner == 'process':
+            self.worker = Process(target=self.run, args=(True,))
+        else:
+            self.worker = Thread(target=self.run)
+        self.worker.daemon = True
+        self.worker.start()
+        if runner == 'inline':
+            self.worker.join()
+
+    def join(self, timeout=None):
+        if self.worker is not None:
+            self.worker.join(timeout)
+
+    def run(self, forked=False):
+        if forked:
+            # The storage connections of the parent can't be shared, nor can
+            # its persistent ZEO cache file, which the parent holds locked
+            self.app.extensions['zodb'].__dict__.pop('db', None)
+            self.app.config['ZEO_CLIENT'] = None
+        with self.app.test_request_context():
+            try:
+                self.f(*self.args, **self.kwargs)
+            except Exception as e:
+                transaction.abort()
+                logger = logging.getLogger(__name__)
+                logger.exception('Job {0} failed'.format(self.f.__name__))
+                if self.on_error is not None:
+                    self._handle_error(e)
+
+    def _handle_error(self, error):
+        try:
+            self.on_error(error, *self.args, **self.kwargs)
+            transaction.commit()
+        except Exception:
+            transaction.abort()
+            logging.getLogger(__name__).exception('Job error handler failed')
+
+
+def run_job(f, *args, **kwargs):
+    """ Calls f(*args, **kwargs) outside of the current request, once the
+    current transaction commits. An on_error keyword argument is passed to
+    the Job rather than to f. Returns the Job. """
+    on_error = kwargs.pop('on_error', None)
+    app = current_app._get_current_object()
+    runner = app.config.get('JOB_RUNNER', 'process')
+    if runner not in RUNNERS:
+        raise ValueError('Unknown JOB_RUNNER {0}'.format(runner))
+    job = Job(app, f, args, kwargs, on_error=on_error)
+    transaction.get().addAfterCommitHook(job.start)
+    return job
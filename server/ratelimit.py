@@ -0,0 +1,213 @@
+"""
+Stores for the hit counters of server.utils.RateLimit. Each store counts
+hits per key, and forgets a key once its time to live has passed.
+
+The store an app uses is picked by its RATE_LIMIT_STORE config value:
+
+    memory       counters in this process. Enough for a single worker.
+    uwsgi        counters in a uWSGI cache shared by every worker of the
+                 server. uwsgi must be started with a cache for it, e.g.
+                 --cache2 name=ratelimit,items=10000,bitmap=1
+    redis        counters in the redis server of the REDIS_* config values
+    local_redis  a RedisStore over LocalRedis, an in-process stand-in for a
+                 redis server
+"""
+import time
+from threading import Lock
+from flask import current_app
+
+
+class MemoryStore(object):
+
+    """ Counters in a dict. Expired keys are swept out every sweep_interval
+    seconds. """
+
+    sweep_interval = 60
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.lock = Lock()
+        self.data = {}
+        self.next_sweep = clock() + self.sweep_interval
+
+    def incr(self, key, ttl):
+        """ Adds a hit to key, which expires ttl seconds after its first hit.
+        Returns the hits counted for key. """
+        now = self.clock()
+        with self.lock:
+            if now >= self.next_sweep:
+                self._sweep(now)
+            entry = self._get(key, now)
+            if entry is None:
+                entry = self.data[key] = [0, now + ttl]
+            entry[0] += 1
+            return entry[0]
+
+    def get(self, key):
+        """ Returns the hits counted for key """
+        with self.lock:
+            entry = self._get(key, self.clock())
+        if entry is None:
+            return 0
+        return entry[0]
+
+    def _get(self, key, now):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] <= now:
+            del self.data[key]
+            entry = None
+        return entry
+
+    def _sweep(self, now):
+        self.data = {k: v for k, v in self.data.iteritems() if v[1] > now}
+        self.next_sweep = now + self.sweep_interval
+
+    def __len__(self):
+        return len(self.data)
+
+
+class UwsgiStore(object):
+
+    """ Counters in a uWSGI cache, shared by the workers of a uWSGI server.
+    The cache is created by uwsgi's --cache2 option. """
+
+    def __init__(self, cache='ratelimit', uwsgi=None):
+        if uwsgi is None:
+            # Only importable inside a uWSGI worker
+            import uwsgi
+        self.uwsgi = uwsgi
+        self.cache = cache
+
+    def incr(self, key, ttl):
+        self.uwsgi.cache_inc(key, 1, ttl, self.cache)
+        return self.get(key)
+
+    def get(self, key):
+        return self.uwsgi.cache_num(key, self.cache) or 0
+
+
+class RedisStore(object):
+
+    """ Counters in a redis server, shared by any number of servers.
+    client is a redis.StrictRedis, or anything with its incr, expire, get
+    and pipeline commands, such as a LocalRedis """
+
+    def __init__(self, client):
+        self.client = client
+
+    def incr(self, key, ttl):
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, ttl)
+        return pipe.execute()[0]
+
+    def get(self, key):
+        return int(self.client.get(key) or 0)
+
+
+class LocalRedis(object):
+
+    """ In-process stand-in for the redis commands used by RedisStore """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.lock = Lock()
+        # maps key -> [value, expiry or None]
+        self.data = {}
+
+    def incr(self, key, amount=1):
+        with self.lock:
+            entry = self._get(key)
+            if entry is None:
+                entry = self.data[key] = [0, None]
+            entry[0] += amount
+            return entry[0]
+
+    def expire(self, key, seconds):
+        with self.lock:
+            entry = self._get(key)
+            if entry is None:
+                return False
+            entry[1] = self.clock() + seconds
+            return True
+
+    def get(self, key):
+        with self.lock:
+            entry = self._get(key)
+        if entry is not None:
+            return str(entry[0])
+
+    def pipeline(self):
+        return LocalRedisPipeline(self)
+
+    def _get(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None:
+            if entry[1] <= self.clock():
+                del self.data[key]
+                entry = None
+        return entry
+
+    def __len__(self):
+        return len(self.data)
+
+
+class LocalRedisPipeline(object):
+
+    """ Queues LocalRedis commands, and runs them on execute() """
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        return [c(*args, **kwargs) for c, args, kwargs in commands]
+
+
+def _redis_store(config):
+    import redis
+    return RedisStore(redis.StrictRedis(host=config['REDIS_HOST'],
+                                        port=config['REDIS_PORT'],
+                                        db=config['REDIS_DATABASE'],
+                                        password=config.get('REDIS_PASSWORD')))
+
+
+STORES = dict(memory=lambda config: MemoryStore(),
+              uwsgi=lambda config: UwsgiStore(),
+              redis=_redis_store,
+              local_redis=lambda config: RedisStore(LocalRedis()))
+
+_lock = Lock()
+
+
+def create_store(config):
+    """ Creates the store named by the RATE_LIMIT_STORE config value """
+    kind = config.get('RATE_LIMIT_STORE', 'memory')
+    try:
+        factory = STORES[kind]
+    except KeyError:
+        raise ValueError('Unknown RATE_LIMIT_STORE {0}'.format(kind))
+    return factory(config)
+
+
+def get_store(app=None):
+    """ Returns the rate limit store of app, or of the current app """
+    if app is None:
+        app = current_app._get_current_object()
+    store = app.extensions.get('rate_limit_store')
+    if store is None:
+        with _lock:
+            store = app.extensions.get('rate_limit_store')
+            if store is None:
+                store = create_store(app.config)
+                app.extensions['rate_limit_store'] = store
+    return store
@@ -17,7 +17,7 @@ def get_field(world_id, loc, **kwargs):
 
 @jsonrpc.method('battle.pass(int, list, int) -> dict', validate=True)
 @require_login
-@commit
+@commit('battle.pass')
 def pass_turn(world_id, field_loc, unit_id):
     # Field coord, Unit, type, target
     field = get_field(world_id, field_loc)
@@ -28,7 +28,7 @@ def pass_turn(world_id, field_loc, unit_id):
 
 @jsonrpc.method('battle.move(int, list, int, list) -> dict', validate=True)
 @require_login
-@commit
+@commit('battle.move')
 def move(world_id, field_loc, unit_id, target):
     field = get_field(world_id, field_loc)
     unit = get_unit(unit_id)
@@ -38,7 +38,7 @@ def move(world_id, field_loc, unit_id, target):
 
 @jsonrpc.method('battle.attack(int, list, int, list) -> dict', validate=True)
 @require_login
-@commit
+@commit('battle.attack')
 def attack(world_id, field_loc, unit_id, target):
     field = get_field(world_id, field_loc)
     unit = get_unit(unit_id)
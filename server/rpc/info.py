@@ -2,6 +2,7 @@ from flask import Blueprint
 from flask.ext.login import current_user
 from server import jsonrpc
 from server.decorators import require_login
+from server.transactions import get_runner
 from server.rpc.common import (get_field, get_unit, get_stronghold, get_world,
                                get_battle_by_id, get_battle)
 
@@ -64,3 +65,10 @@ def unit_info(unit_id):
 def stronghold_info(world_id, field_loc):
     stronghold = get_stronghold(world_id, field_loc)
     return dict(stronghold=stronghold.api_view())
+
+
+@jsonrpc.method('info.transactions() -> dict', validate=True)
+@require_login
+def transactions_info():
+    """ Calls, commits, conflicts, retries and failures of each RPC """
+    return dict(transactions=get_runner().stats.snapshot())
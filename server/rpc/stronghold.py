@@ -10,7 +10,7 @@ stronghold = Blueprint('stronghold', __name__, url_prefix='/api/stronghold')
 
 @jsonrpc.method('stronghold.place_unit(int, list) -> dict', validate=True)
 @require_login
-@commit
+@commit('stronghold.place_unit')
 def place_unit(unit_id, grid_location):
     unit = get_unit(unit_id)
     squad = unit.container
@@ -26,7 +26,7 @@ def place_unit(unit_id, grid_location):
 @jsonrpc.method('stronghold.name_unit(int, list, int, str) -> dict',
                 validate=True)
 @require_login
-@commit
+@commit('stronghold.name_unit')
 def name_unit(world_id, field_location, unit_id, name):
     stronghold = get_stronghold(world_id, field_location)
     unit = stronghold.name_unit(unit_id, name)
@@ -36,7 +36,7 @@ def name_unit(world_id, field_location, unit_id, name):
 @jsonrpc.method('stronghold.equip_scient(int, list, int, int) -> dict',
                 validate=True)
 @require_login
-@commit
+@commit('stronghold.equip_scient')
 def equip_scient(world_id, field_location, unit_id, weapon_num):
     stronghold = get_stronghold(world_id, field_location)
     unit = stronghold.equip_scient(unit_id, weapon_num)
@@ -46,7 +46,7 @@ def equip_scient(world_id, field_location, unit_id, weapon_num):
 @jsonrpc.method('stronghold.unequip_scient(int, list, int) -> dict',
                 validate=True)
 @require_login
-@commit
+@commit('stronghold.unequip_scient')
 def unequip_scient(world_id, field_location, unit_id):
     stronghold = get_stronghold(world_id, field_location)
     weapon = stronghold.unequip_scient(unit_id)
@@ -56,7 +56,7 @@ def unequip_scient(world_id, field_location, unit_id):
 @jsonrpc.method('stronghold.imbue_unit(int, list, dict, int) -> dict',
                 validate=True)
 @require_login
-@commit
+@commit('stronghold.imbue_unit')
 def imbue_unit(world_id, field_location, comp, unit_id):
     stronghold = get_stronghold(world_id, field_location)
     unit = stronghold.imbue_unit(comp, unit_id)
@@ -66,7 +66,7 @@ def imbue_unit(world_id, field_location, comp, unit_id):
 @jsonrpc.method('stronghold.split_weapon(int, list, dict, int) -> dict',
                 validate=True)
 @require_login
-@commit
+@commit('stronghold.split_weapon')
 def split_weapon(world_id, field_location, comp, weapon_num):
     stronghold = get_stronghold(world_id, field_location)
     weapon = stronghold.split_weapon(comp, weapon_num)
@@ -76,7 +76,7 @@ def split_weapon(world_id, field_location, comp, weapon_num):
 @jsonrpc.method('stronghold.imbue_weapon(int, list, dict, int) -> dict',
                 validate=True)
 @require_login
-@commit
+@commit('stronghold.imbue_weapon')
 def imbue_weapon(world_id, field_location, comp, weapon_num):
     stronghold = get_stronghold(world_id, field_location)
     weapon = stronghold.imbue_weapon(comp, weapon_num)
@@ -86,7 +86,7 @@ def imbue_weapon(world_id, field_location, comp, weapon_num):
 @jsonrpc.method('stronghold.form_squad(int, list, list) -> dict',
                 validate=True)
 @require_login
-@commit
+@commit('stronghold.form_squad')
 def form_squad(world_id, field_location, unit_ids):
     stronghold = get_stronghold(world_id, field_location)
     squad = stronghold.form_squad(unit_ids)
@@ -96,7 +96,7 @@ def form_squad(world_id, field_location, unit_ids):
 @jsonrpc.method('stronghold.name_squad(int, list, int, str) -> dict',
                 validate=True)
 @require_login
-@commit
+@commit('stronghold.name_squad')
 def name_squad(world_id, field_location, squad_num, name):
     stronghold = get_stronghold(world_id, field_location)
     squad = stronghold.name_squad(squad_num, name)
@@ -105,7 +105,7 @@ def name_squad(world_id, field_location, squad_num, name):
 
 @jsonrpc.method('stronghold.remove_squad(int, list, int)', validate=True)
 @require_login
-@commit
+@commit('stronghold.remove_squad')
 def remove_squad(world_id, field_location, squad_num):
     stronghold = get_stronghold(world_id, field_location)
     stronghold.remove_squad(squad_num)
@@ -114,7 +114,7 @@ def remove_squad(world_id, field_location, squad_num):
 
 @jsonrpc.method('stronghold.move_squad(int, list, int, str)', validate=True)
 @require_login
-@commit
+@commit('stronghold.move_squad')
 def move_squad(world_id, field_location, squad_num, direction):
     stronghold = get_stronghold(world_id, field_location)
     stronghold.move_squad_out(squad_num, direction)
@@ -3,6 +3,7 @@ from flask.ext.login import current_user
 from equanimity.vestibule import Vestibule
 from server import jsonrpc
 from server.decorators import require_login, commit
+from server.jobs import run_job
 from server.rpc.common import get_thing
 from server import db
 
@@ -32,7 +33,7 @@ def _get_vestibule(uid, is_member=None, no_world=True):
 
 @jsonrpc.method('vestibule.create() -> dict', validate=True)
 @require_login
-@commit
+@commit('vestibule.create')
 def create_vestibule():
     v = Vestibule()
     p = current_user._get_current_object()
@@ -44,7 +45,7 @@ def create_vestibule():
 
 @jsonrpc.method('vestibule.join(int) -> dict', validate=True)
 @require_login
-@commit
+@commit('vestibule.join')
 def join_vestibule(vestibule_id):
     v = _get_vestibule(vestibule_id, is_member=False)
     v.players.add(current_user._get_current_object())
@@ -53,7 +54,7 @@ def join_vestibule(vestibule_id):
 
 @jsonrpc.method('vestibule.leave(int) -> dict', validate=True)
 @require_login
-@commit
+@commit('vestibule.leave')
 def leave_vestibule(vestibule_id):
     v = _get_vestibule(vestibule_id, is_member=True)
     v.players.remove(current_user._get_current_object())
@@ -62,7 +63,7 @@ def leave_vestibule(vestibule_id):
 
 @jsonrpc.method('vestibule.start(int) -> dict', validate=True)
 @require_login
-@commit
+@commit('vestibule.start')
 def start_vestibule(vestibule_id):
     v = _get_vestibule(vestibule_id, is_member=True)
     # Only the leader can create the vestibule
@@ -70,8 +71,28 @@ def start_vestibule(vestibule_id):
     p = current_user._get_current_object()
     if leader != p:
         raise ValueError('You cannot start this vestibule')
-    w = v.start()
-    return dict(world=dict(uid=w.uid))
+    # The world's fields are built in the background; poll vestibule.status
+    # until it is ready
+    # It starts once this request commits, so a retried request doesn't
+    # start a second build
+    w = v.begin_build()
+    run_job(_build_world, v.uid, on_error=_build_failed)
+    return dict(world=dict(uid=w.uid), status=v.status())
+
+
+def _build_world(vestibule_id):
+    Vestibule.get(vestibule_id).build()
+
+
+def _build_failed(error, vestibule_id):
+    Vestibule.get(vestibule_id).fail(error)
+
+
+@jsonrpc.method('vestibule.status(int) -> dict', validate=True)
+@require_login
+def vestibule_status(vestibule_id):
+    v = _get_vestibule(vestibule_id, no_world=False)
+    return dict(status=v.status())
 
 
 @jsonrpc.method('vestibule.get(int) -> dict', validate=True)
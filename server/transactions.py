@@ -0,0 +1,152 @@
+""" Runs functions in transactions, calling them again when the transaction
+conflicts with a concurrent one. Set up from the app config:
+
+    TRANSACTION_RETRIES      retries of a call before its conflict is raised
+    TRANSACTION_BACKOFF      seconds to wait before the first retry, doubled
+                             for each further retry, and jittered
+    TRANSACTION_MAX_BACKOFF  longest wait before a retry
+    TRANSACTION_RETRY_RATIO  retries allowed per call, once the reserve of
+                             TRANSACTION_RETRY_RESERVE retries is spent
+"""
+import time
+import random
+import transaction
+from threading import Lock
+from collections import defaultdict
+from flask import current_app, has_app_context
+from ZODB.POSException import ConflictError
+
+
+COUNTERS = ('calls', 'commits', 'conflicts', 'retries', 'failures',
+            'budget_exhausted')
+
+
+class RetryBudget(object):
+
+    """ Limits retries to a share of the calls made, so that a burst of
+    conflicts can't multiply the load. Every call adds ratio to the balance,
+    up to reserve, and every retry takes one from it. """
+
+    def __init__(self, ratio=0.2, reserve=20):
+        self.ratio = ratio
+        self.reserve = reserve
+        self.balance = float(reserve)
+        self.lock = Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.balance = min(self.reserve, self.balance + self.ratio)
+
+    def withdraw(self):
+        """ Returns True if a retry is allowed """
+        with self.lock:
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+
+
+class TransactionStats(object):
+
+    """ Counts calls, commits, conflicts, retries and failures per name """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.counters = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+    def record(self, name, counter):
+        with self.lock:
+            self.counters[name][counter] += 1
+
+    def snapshot(self):
+        """ Returns a copy of the counters, by name """
+        with self.lock:
+            return {k: dict(v) for k, v in self.counters.iteritems()}
+
+
+class TransactionRunner(object):
+
+    def __init__(self, retries=3, backoff=0.01, max_backoff=0.5,
+                 budget=None, stats=None, sleep=time.sleep):
+        if budget is None:
+            budget = RetryBudget()
+        if stats is None:
+            stats = TransactionStats()
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget
+        self.stats = stats
+        self.sleep = sleep
+
+    def delay(self, attempt):
+        """ Returns the seconds to wait before retry number attempt (from 0):
+        between half and all of an exponential backoff """
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def run(self, name, f, *args, **kwargs):
+        """ Calls f(*args, **kwargs) and commits. On a ConflictError, or a
+        ReadConflictError, aborts and tries again after a backoff, while the
+        retries and the budget allow it. Counts under name.
+
+        f is only called again if its attempt left nothing behind: a call
+        that committed or began a transaction of its own isn't retried. """
+        self.stats.record(name, 'calls')
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            txn = transaction.get()
+            try:
+                r = f(*args, **kwargs)
+                transaction.commit()
+            except ConflictError:
+                own = transaction.get() is txn
+                transaction.abort()
+                self.stats.record(name, 'conflicts')
+                if attempt >= self.retries or not own:
+                    self.stats.record(name, 'failures')
+                    raise
+                if not self.budget.withdraw():
+                    self.stats.record(name, 'budget_exhausted')
+                    self.stats.record(name, 'failures')
+                    raise
+                self.stats.record(name, 'retries')
+                self.sleep(self.delay(attempt))
+                attempt += 1
+            else:
+                self.stats.record(name, 'commits')
+                return r
+
+
+def create_runner(config):
+    """ Creates a TransactionRunner from the TRANSACTION_* config values """
+    budget = RetryBudget(ratio=config.get('TRANSACTION_RETRY_RATIO', 0.2),
+                         reserve=config.get('TRANSACTION_RETRY_RESERVE', 20))
+    return TransactionRunner(
+        retries=config.get('TRANSACTION_RETRIES', 3),
+        backoff=config.get('TRANSACTION_BACKOFF', 0.01),
+        max_backoff=config.get('TRANSACTION_MAX_BACKOFF', 0.5),
+        budget=budget)
+
+
+# Used outside of an app, e.g. by scripts and tests
+default_runner = TransactionRunner()
+
+_lock = Lock()
+
+
+def get_runner(app=None):
+    """ Returns the runner of app, or of the current app if any """
+    if app is None:
+        if not has_app_context():
+            return default_runner
+        app = current_app._get_current_object()
+    runner = app.extensions.get('transaction_runner')
+    if runner is None:
+        with _lock:
+            runner = app.extensions.get('transaction_runner')
+            if runner is None:
+                runner = create_runner(app.config)
+                app.extensions['transaction_runner'] = runner
+    return runner
@@ -1,9 +1,7 @@
 import time
-import transaction
-from threading import Lock
 from urlparse import urlparse, urlunparse
 from collections import Mapping
-from server import db
+from server.ratelimit import get_store
 
 
 def construct_full_url(url):
@@ -39,18 +37,26 @@ def api_error(err):
 
 class RateLimit(object):
     # http://flask.pocoo.org/snippets/70/
+    # Counts hits in a sliding window of per seconds: all of the hits in the
+    # current fixed window, plus the previous window's hits weighted by how
+    # much of it is still inside the sliding window.
     expiration_window = 10
 
-    lock = Lock()
-
-    def __init__(self, key_prefix, limit, per):
-        self.reset = (int(time.time()) // per) * per + per
+    def __init__(self, key_prefix, limit, per, store=None):
+        if store is None:
+            store = get_store()
+        t = time.time()
+        window = (int(t) // per) * per
+        self.reset = window + per
         self.key = key_prefix + str(self.reset)
         self.limit = limit
         self.per = per
-        with self.lock:
-            self.current = db['rate_limit'][self.key].get_next_id()
-            transaction.commit()
+        # Each window's count is still read during the next window
+        ttl = 2 * per + self.expiration_window
+        current = store.incr(self.key, ttl)
+        previous = store.get(key_prefix + str(window))
+        weight = 1 - (t - window) / float(per)
+        self.current = current + int(previous * weight)
 
     remaining = property(lambda x: x.limit - x.current)
     over_limit = property(lambda x: x.current >= x.limit)
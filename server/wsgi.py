@@ -1,6 +1,6 @@
 import sys
 import logging
-from server import create_app
+from server import create_app, db
 
 # log to wsgi files
 logging.basicConfig(stream=sys.stderr)
@@ -8,3 +8,16 @@ logging.basicConfig(stream=sys.stderr)
 sys.stdout = sys.stderr
 
 application = create_app(config='dev')
+
+
+# Each worker warms its database caches when it starts, rather than in its
+# first request. Under uwsgi that is after the fork, as the storage
+# connections can't be shared with the master.
+try:
+    from uwsgidecorators import postfork
+except ImportError:
+    db.warm_up(application)
+else:
+    @postfork
+    def warm_up():
+        db.warm_up(application)
@@ -1,4 +1,6 @@
 import os
+import shutil
+import tempfile
 import transaction
 import pickle
 from itertools import izip, tee
@@ -7,6 +9,8 @@ from mock import Mock
 from flask import url_for, json
 from voluptuous import Schema as JSONSchema, Invalid as InvalidJSONSchema
 from formencode import variabledecode
+from ZODB.DB import DB
+from ZODB.FileStorage import FileStorage
 from server import db, create_app
 from equanimity.const import E
 from equanimity.units import Scient
@@ -31,6 +35,52 @@ def pairwise(iterable):
     return izip(a, b)
 
 
+class TwoConnections(object):
+
+    """ Two connections to a FileStorage, which resolves conflicting writes
+    with _p_resolveConflict """
+
+    def __init__(self):
+        self.path = tempfile.mkdtemp()
+        self.db = DB(FileStorage(os.path.join(self.path, 'Data.fs')))
+        self.tms = [transaction.TransactionManager() for i in xrange(2)]
+        self.conns = [self.db.open(transaction_manager=tm)
+                      for tm in self.tms]
+
+    def store(self, obj, **extra):
+        """ Stores obj, and returns its copy in each connection. extra is
+        stored alongside it. """
+        root = self.conns[0].root()
+        root['obj'] = obj
+        root.update(extra)
+        self.tms[0].commit()
+        return self.sync()
+
+    def sync(self):
+        """ Starts new transactions, and returns obj's copy in each
+        connection """
+        for tm in self.tms:
+            tm.begin()
+        return [c.root()['obj'] for c in self.conns]
+
+    def commit(self):
+        """ Commits the first connection, then the second """
+        for tm in self.tms:
+            tm.commit()
+
+    def load(self):
+        """ Returns the last committed obj """
+        self.tms[0].begin()
+        return self.conns[0].root()['obj']
+
+    def close(self):
+        for tm, conn in zip(self.tms, self.conns):
+            tm.abort()
+            conn.close()
+        self.db.close()
+        shutil.rmtree(self.path)
+
+
 class BaseTest(TestCase):
 
     def assertExceptionContains(self, exc, submsg, f, *args, **kwargs):
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from equanimity.const import ELEMENTS, WEP_LIST
+from equanimity.simulator import memory_store
+from equanimity.balance import (COLUMNS, ColumnStore, max_squad, run_sweep,
+                                make_squad_factory, sweep_meta)
+from server import db
+
+
+class BalanceTest(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.kwargs = dict(size=2, grid_radius=3, max_actions=100)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _sweep(self, battles, path=None, **kwargs):
+        kwargs.setdefault('processes', 1)
+        kwargs.setdefault('chunk_size', 3)
+        kwargs.update(self.kwargs)
+        if path is None:
+            path = self.path
+        return run_sweep(path, battles, **kwargs)
+
+    def _rows(self, store):
+        return zip(*[store.column(name) for name, code in COLUMNS])
+
+    def test_max_squad(self):
+        with db.use(memory_store()):
+            squad = max_squad(min_value=32, max_value=32)
+        self.assertEqual(len(squad), 4)
+        self.assertEqual(sorted(u.element for u in squad), list(ELEMENTS))
+        for unit in squad:
+            self.assertIsNot(unit.weapon, None)
+            self.assertEqual(unit.weapon.element, unit.element)
+
+    def test_make_squad_factory_invalid(self):
+        self.assertRaises(ValueError, make_squad_factory, 'xxx')
+        self.assertRaises(ValueError, sweep_meta, defender='xxx')
+
+    def test_sweep(self):
+        store = self._sweep(7)
+        self.assertEqual(store.rows, 7)
+        self.assertEqual(list(store.column('seed')), range(7))
+        for side in ('atk', 'def'):
+            elements = sum(sum(store.column('{0}_{1}'.format(side, e.lower())))
+                           for e in ELEMENTS)
+            weapons = sum(sum(store.column('{0}_{1}'.format(side, w.lower())))
+                          for w in WEP_LIST)
+            self.assertEqual(elements, 14)
+            self.assertEqual(weapons, 14)
+
+    def test_resume(self):
+        expect = self._rows(self._sweep(8, path=os.path.join(self.path, 'a')))
+        path = os.path.join(self.path, 'b')
+        self.assertEqual(self._sweep(5, path=path).rows, 5)
+        store = self._sweep(8, path=path)
+        self.assertEqual(self._rows(store), expect)
+        # Nothing left to do
+        self.assertEqual(self._rows(self._sweep(8, path=path)), expect)
+
+    def test_resume_partial_row(self):
+        self._sweep(4)
+        with open(os.path.join(self.path, 'actions.col'), 'ab') as f:
+            f.write('\0')
+        self.assertEqual(ColumnStore(self.path).rows, 4)
+        with open(os.path.join(self.path, 'winner.col'), 'r+b') as f:
+            f.truncate(3)
+        self.assertEqual(ColumnStore(self.path).rows, 3)
+        self.assertEqual(self._sweep(4).rows, 4)
+
+    def test_resume_different_parameters(self):
+        self._sweep(2)
+        self.assertRaises(ValueError, self._sweep, 4, attacker='max')
+
+    def test_parallel(self):
+        serial = self._rows(self._sweep(6, path=os.path.join(self.path, 'a')))
+        store = self._sweep(6, path=os.path.join(self.path, 'b'),
+                            processes=2, chunk_size=2)
+        self.assertEqual(self._rows(store), serial)
+
+    def test_summarize(self):
+        store = self._sweep(6)
+        rates = store.summarize(bracket=1000)
+        self.assertEqual(sorted(rates['element']), sorted(ELEMENTS))
+        self.assertEqual(sorted(rates['weapon']), sorted(WEP_LIST))
+        self.assertEqual(sum(b for w, b in rates['element'].values()), 24)
+        self.assertEqual(sum(b for w, b in rates['value'].values()), 12)
+        atk_wins, battles = rates['side']['atk']
+        def_wins, battles = rates['side']['def']
+        self.assertEqual(battles, 6)
+        self.assertLessEqual(atk_wins + def_wins, 6)
+        wins = sum(w for w, b in rates['value'].values())
+        self.assertEqual(wins, atk_wins + def_wins)
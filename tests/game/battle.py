@@ -15,7 +15,7 @@ from equanimity.player import Player
 from equanimity.unit_container import Squad, rand_squad
 from equanimity.battle import (now, Action, Message, ChangeList, BattleChanges,
                                InitialState, Log, State, Battle, BattleError,
-                               ActionQueue)
+                               ActionQueue, StateLog)
 
 
 class ActionTest(TestCase):
@@ -205,6 +205,62 @@ class LogTestAdvanced(BattleTestBase):
         self.assertEqual(self.battle.log.last_message(), res)
 
 
+class StateLogTest(TestCase):
+
+    def _state(self, num, hps, queued=None):
+        return AttributeDict(
+            num=num, pass_count=num % 3, hp_count=0, old_defsquad_hp=7,
+            game_over=False, whose_action=num % 2, hps=dict(hps),
+            locs={uid: Hex(uid, 0) for uid in hps}, queued=queued or {})
+
+    def test_append_and_get(self):
+        log = StateLog()
+        hps = {1: 100, 2: 100, 3: 100}
+        expect = {}
+        for num in xrange(1, 41):
+            if 1 + num % 3 in hps:
+                hps[1 + num % 3] -= 1
+            if num == 20:
+                del hps[3]
+            state = self._state(num, hps, queued={2: [[num, 2]]})
+            log.append(state)
+            expect[num] = dict(state)
+        self.assertEqual(len(log), 40)
+        for num in xrange(1, 41):
+            self.assertEqual(log.get(num), expect[num])
+        # Only the changed values are stored between keyframes
+        entry = log.entries[2]
+        self.assertFalse(entry['keyframe'])
+        self.assertEqual(entry['changed']['hps'], {3: 99})
+        self.assertNotIn('locs', entry['changed'])
+        self.assertEqual(log.entries[20]['removed'], {'hps': [3], 'locs': [3]})
+        keyframes = [n for n, e in log.entries.iteritems() if e['keyframe']]
+        self.assertEqual(keyframes, [1, 17, 33])
+
+    def test_get_between_entries(self):
+        log = StateLog()
+        self.assertIs(log.get(1), None)
+        log.append(self._state(2, {1: 10}))
+        log.append(self._state(5, {1: 8}))
+        self.assertIs(log.get(1), None)
+        self.assertEqual(log.get(4)['num'], 2)
+        self.assertEqual(log.get(4)['hps'], {1: 10})
+        self.assertEqual(log.get(100)['hps'], {1: 8})
+
+    def test_append_without_cache(self):
+        log = StateLog()
+        log.append(self._state(1, {1: 10}))
+        log.append(self._state(2, {1: 9}))
+        log._v_last = None
+        log.append(self._state(3, {1: 8}))
+        self.assertFalse(log.entries[3]['keyframe'])
+        self.assertEqual(log.get(3)['hps'], {1: 8})
+        # Rewriting an action number stores a keyframe
+        log.append(self._state(3, {1: 5}))
+        self.assertTrue(log.entries[3]['keyframe'])
+        self.assertEqual(log.get(3)['hps'], {1: 5})
+
+
 class StateTest(BattleModuleTestBase):
 
     def setUp(self):
@@ -593,6 +649,43 @@ class BattleProcessActionTest(BattleTestBase):
         self.assertActionResult(ret, 7, 'pass', 'Action Passed.',
                                 unit=self.unit(7).uid)
 
+    def test_fill_timed_out_actions_idle(self):
+        self._place_squads()
+        start = self.battle.log.start_time
+        self.battle.log.start_time = start - PLY_TIME * 500
+        self.battle._fill_timed_out_actions()
+        # Timeouts count as passes, so the battle ends after 8 of them
+        self.assertEqual(len(self.battle.log.actions), 8)
+        self.assertEqual(len(self.battle.log.messages), 1)
+        self.assertEqual(len(self.battle.log.states), 1)
+        self.assertEqual(self.battle.state.num, 8)
+        self.assertGameOver(self.defender, 'Both sides passed')
+        # Nothing more is filled in once the battle is over
+        self.battle._fill_timed_out_actions()
+        self.assertEqual(len(self.battle.log.actions), 8)
+
+    def test_fill_timed_out_actions_future(self):
+        # The last action time can be ahead of the clock, e.g. if it moved
+        # backwards
+        start = self.battle.log.start_time
+        self.battle.log.start_time = start + PLY_TIME * 3
+        self.battle._fill_timed_out_actions()
+        self.assertEqual(len(self.battle.log.actions), 0)
+        self.assertEqual(len(self.battle.log.messages), 0)
+        self.assertEqual(self.battle.state.num, 1)
+
+    def test_state_at(self):
+        self.assertIs(self.battle.state_at(1), None)
+        for num in xrange(1, 4):
+            act = Action(type='pass', unit=self.unit(num))
+            self.battle.process_action(act)
+        state = self.battle.state_at(2)
+        self.assertEqual(state.num, 2)
+        self.assertEqual(state.pass_count, 2)
+        player = ActionQueue.get_player_for_action(self.battle.battlefield, 2)
+        self.assertEqual(state.whose_action, player.uid)
+        self.assertEqual(self.battle.state_at(10).num, 3)
+
     def test_using_different_units(self):
         # get a ValueError by using two different units in a row
         act = Action(type='move', num=2, unit=self.unit(2))
@@ -751,6 +844,31 @@ class ActionQueueTest(BattleTestBase):
         self.assertEqual(self.aq.get_unit_for_action(b, 13 + turn * 5), expect)
         self.assertEqual(self.aq.get_unit_for_action(b, 14 + turn * 5), expect)
 
+    def test_unit_queue_cached(self):
+        b = self.battle.battlefield
+        u = self.aq._get_unit_queue(b)
+        self.assertIs(self.aq._get_unit_queue(b), u)
+        self.assertEqual(b.turn_order, (0, u))
+        self._place_squads()
+        b.battle = Mock(_p_changed=False)
+        b.bury(u[0])
+        self.assertIs(b.turn_order, None)
+        self.assertEqual(b.turn_order_version, 1)
+        # Other connections reload the battle, dropping their turn order
+        self.assertTrue(b.battle._p_changed)
+        self.assertEqual(self.aq._get_unit_queue(b), u[1:])
+        self.assertEqual(self.aq.get_unit_for_action(b, 1), u[1])
+
+    def test_unit_queue_version(self):
+        b = self.battle.battlefield
+        self.assertIs(b.battle, self.battle)
+        u = self.aq._get_unit_queue(b)
+        # A turn order cached at an older version is rebuilt
+        b.turn_order = (0, u[1:])
+        b.turn_order_version = 1
+        self.assertEqual(self.aq._get_unit_queue(b), u)
+        self.assertEqual(b.turn_order, (1, u))
+
     def assertQueueOrder(self, require_all=False):
         units = self.aq._get_unit_queue(self.battle.battlefield)
         # Verify order by induction
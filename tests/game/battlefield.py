@@ -1,4 +1,4 @@
-from mock import MagicMock
+from mock import MagicMock, patch
 from equanimity.grid import Grid, Hex
 from equanimity.units import Scient, Nescient
 from equanimity.unit_container import Squad
@@ -331,6 +331,27 @@ class BattlefieldTest(FlaskTestDBWorld):
         t.location = Hex(-100, -100)
         self.assertRaises(ValueError, bf.dmg, s, t)
 
+    def test_dmg_many(self):
+        bf = self.create_battlefield()
+        s = Scient(E, create_comp(earth=128))
+        s.equip(Wand(E, create_comp(earth=128)))
+        s.chosen_location = Hex(0, 0)
+        bf.place_object(s)
+        defdrs = []
+        for loc, e in [((0, 1), F), ((1, 0), E), ((1, 1), I)]:
+            t = Scient(e, create_comp(**{e.lower(): 100}))
+            t.chosen_location = Hex(*loc)
+            bf.place_object(t)
+            defdrs.append(t)
+        expect = [bf.dmg(s, d) for d in defdrs]
+        self.assertEqual(expect[:2], [1544, -1144])
+        self.assertEqual(bf.dmg_many(s, defdrs), expect)
+        with patch('equanimity.battlefield.numpy', None):
+            self.assertEqual(bf.dmg_many(s, defdrs), expect)
+        self.assertEqual(bf.dmg_many(s, []), [])
+        defdrs[0].location = Hex(-100, -100)
+        self.assertRaises(ValueError, bf.dmg_many, s, defdrs)
+
     def test_calc_aoe(self):
         bf = self.create_battlefield()
         s = Scient(E, create_comp(earth=128))
@@ -440,3 +461,11 @@ class BattlefieldTest(FlaskTestDBWorld):
         self.assertEqual(bf.apply_queued(), [[t, 384]])
         self.assertEqual(bf.get_dmg_queue(), {t: [], s: []})
         self.assertEqual(bf.apply_queued(), [])
+
+    def test_apply_queued_buries(self):
+        bf, s, t = self.test_get_dmg_queue()
+        t.hp = 1
+        self.assertEqual(bf.apply_queued(), [[t, 1]])
+        self.assertEqual(bf.get_dmg_queue(), {s: []})
+        self.assertEqual(bf.graveyard, [t])
+        self.assertEqual(bf.apply_queued(), [])
@@ -1,7 +1,7 @@
 from mock import patch, Mock, MagicMock, call
 from unittest import TestCase
 from datetime import timedelta, datetime
-from equanimity.clock import WorldClock, FieldClock
+from equanimity.clock import WorldClock, FieldClock, FieldSchedule
 from equanimity.const import CLOCK, ELEMENTS, E, F, FIELD_PRODUCE, FIELD_YIELD
 from equanimity.helpers import AttributeDict
 from ..base import BaseTest, FlaskTestDBWorld
@@ -61,7 +61,7 @@ class WorldClockTest(BaseTest):
         mock_get_state.return_value = ret
         w.tick(f)
         mock_change_season.assert_called_once_with(f)
-        mock_change_day.assert_called_once_with(f)
+        mock_change_day.assert_called_once_with(f, 2)
         self.assertEqual(ret, w._current)
 
     @patch.object(WorldClock, 'elapsed')
@@ -94,7 +94,86 @@ class WorldClockTestDB(FlaskTestDBWorld):
         self.w = WorldClock()
 
     @patch('equanimity.field.FieldClock.change_day')
-    def test_change_day(self, mock_change):
+    @patch.object(WorldClock, '_get_interval_value')
+    def test_change_day(self, mock_interval, mock_change):
+        mock_interval.return_value = 2
+        fields = self.world.fields
+        self.w.schedule_field((0, 1))
+        self.w.schedule_field((9, 9))
+        self.w.change_day(fields)
+        mock_change.assert_called_once_with(fields[(0, 1)])
+        self.assertEqual(len(self.w.schedule), 0)
+        # Nothing left to do
+        self.w.change_day(fields)
+        mock_change.assert_called_once_with(fields[(0, 1)])
+
+    def _set_day(self, mock_elapsed, day):
+        elapsed = (day - 1) * int(CLOCK['day'].total_seconds())
+        mock_elapsed.__get__ = Mock(return_value=elapsed)
+
+    @patch.object(WorldClock, 'elapsed')
+    @patch.object(WorldClock, 'change_season')
+    @patch.object(WorldClock, 'change_day')
+    def test_catch_up(self, mock_day, mock_season, mock_elapsed):
+        fields = self.world.fields
+        self._set_day(mock_elapsed, 251)
+        self.assertEqual(self.w.behind, 250)
+        steps = list(self.w.catch_up(fields, max_days=None, batch_days=100))
+        self.assertEqual(steps, [(100, 150), (200, 50), (250, 0)])
+        mock_day.assert_has_calls([call(fields, d) for d in xrange(2, 252)])
+        self.assertEqual(mock_day.call_count, 250)
+        # Seasons start on days 121 and 241
+        self.assertEqual(mock_season.call_count, 2)
+        self.assertEqual(self.w._current, self.w.get_current_state())
+        self.assertEqual(self.w.behind, 0)
+        self.assertEqual(list(self.w.catch_up(fields)), [(0, 0)])
+
+    @patch.object(WorldClock, 'elapsed')
+    @patch.object(WorldClock, 'change_day')
+    def test_catch_up_max_days(self, mock_day, mock_elapsed):
+        fields = self.world.fields
+        self._set_day(mock_elapsed, 251)
+        self.w.tick(fields, max_days=100)
+        self.assertEqual(mock_day.call_count, 100)
+        self.assertEqual(self.w._current['day'], 101)
+        self.assertEqual(self.w.behind, 150)
+        # The rest is left for the next call
+        steps = list(self.w.catch_up(fields, max_days=200, batch_days=None))
+        self.assertEqual(steps, [(150, 0)])
+        mock_day.assert_called_with(fields, 251)
+
+    @patch.object(WorldClock, 'elapsed')
+    @patch('equanimity.field.FieldClock.change_day')
+    def test_catch_up_schedule(self, mock_change, mock_elapsed):
+        days = []
+        mock_change.side_effect = lambda f: days.append(
+            (self.w._current['day'], f.world_coord))
+        self.w.schedule_field((0, 1))
+        self.w.schedule.add((0, 0), 5)
+        self.w.schedule.add((1, 1), 20)
+        self._set_day(mock_elapsed, 10)
+        self.w.tick(self.world.fields)
+        self.assertEqual(days, [(2, (0, 1)), (5, (0, 0))])
+        self.assertEqual(len(self.w.schedule), 1)
+
+    def test_get_state_at_day(self):
+        self.assertEqual(self.w._get_state_at_day(1), self.w._current)
+        state = self.w._get_state_at_day(121)
+        self.assertEqual(state['day'], 121)
+        self.assertEqual(state['season'], 2)
+        self.assertEqual(state['week'], 21)
+
+    @patch('equanimity.field.FieldClock.change_day')
+    def test_change_day_not_due(self, mock_change):
+        self.w.schedule_field((0, 1))
+        self.w.change_day(self.world.fields)
+        mock_change.assert_not_called()
+        self.assertIn((0, 1), self.w.schedule)
+
+    @patch('equanimity.field.FieldClock.change_day')
+    def test_change_day_unscheduled(self, mock_change):
+        # Clocks stored without a schedule process every field
+        self.w.schedule = None
         fields = self.world.fields
         self.w.change_day(fields)
         mock_change.assert_has_calls([call(f) for f in fields.values()])
@@ -106,6 +185,35 @@ class WorldClockTestDB(FlaskTestDBWorld):
         mock_change.assert_has_calls([call() for f in fields.values()])
 
 
+class FieldScheduleTest(TestCase):
+
+    def test_add(self):
+        s = FieldSchedule()
+        s.add((0, 1), 3)
+        self.assertIn((0, 1), s)
+        self.assertEqual(s.get((0, 1)), 3)
+        # Keeps the earliest day
+        s.add((0, 1), 5)
+        self.assertEqual(s.get((0, 1)), 3)
+        s.add((0, 1), 2)
+        self.assertEqual(s.get((0, 1)), 2)
+        self.assertEqual(len(s), 1)
+        self.assertIs(s.get((1, 1)), None)
+
+    def test_pop_due(self):
+        s = FieldSchedule()
+        s.add((1, 1), 3)
+        s.add((0, 1), 2)
+        s.add((0, 0), 3)
+        s.add((2, 2), 4)
+        self.assertEqual(s.pop_due(1), [])
+        self.assertEqual(s.pop_due(3), [(0, 1), (0, 0), (1, 1)])
+        self.assertEqual(len(s), 1)
+        self.assertNotIn((0, 1), s)
+        self.assertEqual(s.pop_due(10), [(2, 2)])
+        self.assertEqual(s.pop_due(10), [])
+
+
 class FieldClockTest(TestCase):
 
     def test_create(self):
@@ -135,6 +243,15 @@ class FieldClockTest(TestCase):
         f.change_day(field)
         mock_process.assert_called_once_with()
 
+    def test_change_day_reschedule(self):
+        f = FieldClock()
+        field = MagicMock(in_battle=False, queue=AttributeDict(queue={}))
+        f.change_day(field)
+        field.schedule.assert_not_called()
+        field.queue.queue[0] = 1
+        f.change_day(field)
+        field.schedule.assert_called_once_with()
+
     def test_change_day_in_battle(self):
         mock_process = Mock()
         f = FieldClock()
@@ -1,5 +1,18 @@
+import copy_reg
+import transaction
 from unittest import TestCase
-from equanimity.db import AutoID
+from mock import patch
+from ZODB.DB import DB
+from ZODB.MappingStorage import MappingStorage
+from ZODB.POSException import ConflictError
+from collections import OrderedDict
+from BTrees.OOBTree import OOBTree
+from persistent.mapping import PersistentMapping
+from ZODB.ConflictResolution import PersistentReference
+from equanimity.db import (AutoID, IDLease, merge_values, merge_dicts,
+                           resolve_state, warm_cache, find_global,
+                           class_factory)
+from equanimity.stone import Composition
 
 
 class AutoIDTest(TestCase):
@@ -20,3 +33,221 @@ class AutoIDTest(TestCase):
         aid.get_next_id()
         aid.get_next_id()
         self.assertEqual(str(aid), '<AutoID test [2]>')
+
+    def test_reserve(self):
+        aid = AutoID('test')
+        aid.get_next_id()
+        self.assertEqual(aid.reserve(10), 2)
+        self.assertEqual(aid.uid, 11)
+        self.assertEqual(aid.get_next_id(), 12)
+
+
+class IDLeaseTest(TestCase):
+
+    def setUp(self):
+        self.db = DB(MappingStorage())
+        self.db.id_block_size = 3
+        self.tm = transaction.TransactionManager()
+        self.conn = self.db.open(transaction_manager=self.tm)
+        self.conn.root()['aid'] = AutoID('test')
+        self.tm.commit()
+        self.aid = self.conn.root()['aid']
+        IDLease._leases.clear()
+
+    def tearDown(self):
+        self.tm.abort()
+        self.conn.close()
+        self.db.close()
+        IDLease._leases.clear()
+
+    def _stored_uid(self):
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        try:
+            return conn.root()['aid'].uid
+        finally:
+            conn.close()
+
+    def test_get_next_id(self):
+        ids = [self.aid.get_next_id() for i in xrange(4)]
+        self.assertEqual(ids, [1, 2, 3, 4])
+        self.assertEqual(self._stored_uid(), 6)
+        # The caller's transaction has nothing to write
+        self.assertFalse(self.aid._p_changed)
+
+    def test_other_process(self):
+        self.assertEqual(self.aid.get_next_id(), 1)
+        # Another process reserves its own block
+        IDLease._leases.clear()
+        self.assertEqual(self.aid.get_next_id(), 4)
+        self.assertEqual(self._stored_uid(), 6)
+
+    def test_conflict(self):
+        reserve = AutoID.reserve
+        calls = []
+
+        def conflict(aid, count):
+            calls.append(count)
+            if len(calls) == 1:
+                raise ConflictError()
+            return reserve(aid, count)
+
+        with patch.object(AutoID, 'reserve', conflict):
+            self.assertEqual(self.aid.get_next_id(), 1)
+        self.assertEqual(calls, [3, 3])
+        with patch.object(AutoID, 'reserve', side_effect=ConflictError()):
+            IDLease._leases.clear()
+            self.assertRaises(ConflictError, self.aid.get_next_id)
+
+    def test_unsaved(self):
+        aid = AutoID('test')
+        self.assertEqual(aid.get_next_id(), 1)
+        self.assertEqual(aid.uid, 1)
+
+    def test_block_size_one(self):
+        self.db.id_block_size = 1
+        self.assertEqual(self.aid.get_next_id(), 1)
+        self.assertTrue(self.aid._p_changed)
+        self.assertEqual(self._stored_uid(), 0)
+
+
+class MergeTest(TestCase):
+
+    def test_merge_values(self):
+        self.assertEqual(merge_values(1, 2, 1), 2)
+        self.assertEqual(merge_values(1, 1, 3), 3)
+        self.assertEqual(merge_values(1, 3, 3), 3)
+        self.assertRaises(ConflictError, merge_values, 1, 2, 3)
+
+    def test_merge_values_references(self):
+        a = PersistentReference('\0' * 8)
+        b = PersistentReference('\1' * 8)
+        self.assertIs(merge_values(a, b, a), b)
+        self.assertIs(merge_values(a, a, b), b)
+        self.assertRaises(ConflictError, merge_values, None, a, b)
+
+    def test_merge_dicts(self):
+        old = OrderedDict([(1, 'a'), (2, 'b'), (3, 'c')])
+        committed = OrderedDict([(2, 'b'), (3, 'x'), (4, 'd')])
+        new = OrderedDict([(1, 'a'), (3, 'c'), (5, 'e')])
+        merged = merge_dicts(old, committed, new)
+        self.assertIsInstance(merged, OrderedDict)
+        self.assertEqual(merged.items(), [(3, 'x'), (4, 'd'), (5, 'e')])
+
+    def test_merge_dicts_conflict(self):
+        old = {1: 'a'}
+        # Both changed a key
+        self.assertRaises(ConflictError, merge_dicts, old, {1: 'b'},
+                          {1: 'c'})
+        # Both added a key
+        self.assertRaises(ConflictError, merge_dicts, old,
+                          {1: 'a', 2: 'b'}, {1: 'a', 2: 'c'})
+        # One changed a key the other removed
+        self.assertRaises(ConflictError, merge_dicts, old, {}, {1: 'c'})
+
+    def test_resolve_state(self):
+        old = dict(items={}, index=0, name='x')
+        committed = dict(items={0: 'a'}, index=1, name='x')
+        new = dict(items={1: 'b'}, index=2, name='y', extra=1)
+        merged = resolve_state(old, committed, new, dicts=('items',),
+                               resolvers=dict(index=lambda o, c, n: c + n))
+        self.assertEqual(merged, dict(items={0: 'a', 1: 'b'}, index=3,
+                                      name='y', extra=1))
+        self.assertRaises(ConflictError, resolve_state, old, committed, new)
+
+
+class WarmCacheTest(TestCase):
+
+    def setUp(self):
+        self.database = DB(MappingStorage())
+        conn = self.database.open()
+        root = conn.root()
+        root['worlds'] = OOBTree()
+        for i in xrange(3):
+            world = root['worlds'][i] = PersistentMapping()
+            world['fields'] = [PersistentMapping(), PersistentMapping()]
+        root['grid'] = PersistentMapping()
+        root['units'] = OOBTree()
+        root['units'][1] = PersistentMapping()
+        transaction.commit()
+        conn.close()
+        self.database.cacheMinimize()
+        self.conn = self.database.open()
+
+    def tearDown(self):
+        self.conn.close()
+        self.database.close()
+
+    def _loaded(self, obj):
+        return obj._p_changed is not None
+
+    def test_warm_cache(self):
+        root = self.conn.root()
+        # The worlds tree, 3 worlds and their 6 fields are loaded. Missing
+        # roots are skipped.
+        self.assertEqual(warm_cache(self.conn, ('worlds', 'players')), 10)
+        world = root['worlds'][2]
+        self.assertTrue(self._loaded(world))
+        self.assertTrue(self._loaded(world['fields'][1]))
+        self.assertFalse(self._loaded(root['grid']))
+        self.assertFalse(self._loaded(root['units']))
+
+    def test_warm_cache_limit(self):
+        root = self.conn.root()
+        self.assertEqual(warm_cache(self.conn, ('worlds', 'grid'), limit=3),
+                         3)
+        # Breadth first
+        self.assertTrue(self._loaded(root['grid']))
+        self.assertTrue(self._loaded(root['worlds'][0]))
+        self.assertFalse(self._loaded(root['worlds'][1]))
+
+
+class _DictComposition(object):
+
+    """ Pickles as a Composition did when it was a dict """
+
+    def __init__(self, values):
+        self.values = values
+
+    def __reduce__(self):
+        return (copy_reg._reconstructor, (Composition, dict, self.values))
+
+
+class ClassFactoryTest(TestCase):
+
+    def setUp(self):
+        self.db = DB(MappingStorage())
+
+    def tearDown(self):
+        self.db.close()
+
+    def _store_and_load(self, value):
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        conn.root()['x'] = PersistentMapping(value=value)
+        tm.commit()
+        conn.close()
+        # Loaded again from the storage
+        self.db.cacheMinimize()
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        try:
+            return conn.root()['x']['value']
+        finally:
+            conn.close()
+
+    def test_legacy_composition(self):
+        self.db.classFactory = class_factory
+        values = dict(Earth=1, Fire=2, Ice=3, Wind=4)
+        c = self._store_and_load(_DictComposition(values))
+        self.assertIs(type(c), Composition)
+        self.assertEqual(c, Composition.create(values))
+
+    def test_legacy_composition_default_factory(self):
+        values = dict(Earth=1, Fire=2, Ice=3, Wind=4)
+        self.assertRaises(TypeError, self._store_and_load,
+                          _DictComposition(values))
+
+    def test_find_global(self):
+        self.assertIs(find_global('equanimity.stone', 'Composition'),
+                      Composition)
@@ -1,4 +1,6 @@
 from mock import MagicMock, Mock, patch, call
+from persistent.mapping import PersistentMapping
+from ZODB.POSException import ConflictError
 from unittest import TestCase
 from voluptuous import Schema, Any
 from operator import attrgetter
@@ -12,7 +14,8 @@ from equanimity.world import World
 from equanimity.stone import Stone
 from equanimity.const import FIELD_PRODUCE, FIELD_YIELD, FIELD_BATTLE, E, I
 from equanimity.helpers import AttributeDict
-from ..base import FlaskTestDB, FlaskTestDBWorld, create_comp
+from ..base import (FlaskTestDB, FlaskTestDBWorld, TwoConnections,
+                    create_comp)
 
 
 def _setup_full_queue():
@@ -52,6 +55,40 @@ class FieldQueueTestSimple(TestCase):
         mock_unqueue.assert_called_once_with()
 
 
+class FieldQueueConflictTest(TestCase):
+
+    def setUp(self):
+        self.conns = TwoConnections()
+        self.a, self.b = self.conns.store(FieldQueue())
+
+    def tearDown(self):
+        self.conns.close()
+
+    def _queue(self, q, slot, name):
+        # What FieldQueue.add does, minus the checks
+        q.queue[slot] = PersistentMapping(name=name)
+        q._p_changed = 1
+
+    def test_resolve(self):
+        self._queue(self.a, (0, 1), 'a')
+        self._queue(self.b, (1, 0), 'b')
+        self.conns.commit()
+        q = self.conns.load()
+        self.assertEqual(q.queue.keys(), [(0, 1), (1, 0)])
+        self.a, self.b = self.conns.sync()
+        self.a.queue.popitem(last=False)
+        self.a._p_changed = 1
+        self._queue(self.b, (1, 1), 'c')
+        self.conns.commit()
+        q = self.conns.load()
+        self.assertEqual([s['name'] for s in q.queue.values()], ['b', 'c'])
+
+    def test_same_slot(self):
+        self._queue(self.a, (0, 1), 'a')
+        self._queue(self.b, (0, 1), 'b')
+        self.assertRaises(ConflictError, self.conns.commit)
+
+
 class FieldQueueTestDB(FlaskTestDB):
 
     def test_add(self):
@@ -60,6 +97,7 @@ class FieldQueueTestDB(FlaskTestDB):
         f.add(field, s)
         mock_queue_at.assert_called_once_with(field)
         self.assertEqual(f.queue[Hex(0, 1)], s)
+        self.assertIn(field.world_coord, field.world.clock.schedule)
 
     def test_add_no_stronghold(self):
         field, f = _setup_full_queue()
@@ -88,6 +126,23 @@ class FieldWorldTest(FlaskTestDBWorld):
     def setUp(self):
         super(FieldWorldTest, self).setUp(square_grid=False, grid_radius=3)
 
+    def test_schedule(self):
+        f = self.world.fields[Hex(0, 0)]
+        schedule = self.world.clock.schedule
+        f.schedule()
+        self.assertEqual(schedule.get(f.world_coord),
+                         self.world.clock._current['day'] + 1)
+        # Fields outside of a world are not scheduled
+        Field(AttributeDict(uid=1), (0, 0), I).schedule()
+
+    @patch('equanimity.silo.Silo.imbue_list')
+    def test_battle_end_schedules(self, mock_imbue):
+        f = self.world.fields[Hex(0, 0)]
+        f.stronghold.populate(size=1)
+        defsquad = f.stronghold.squads[0]
+        f.battle_end_callback(rand_squad(size=1), defsquad, defsquad, [], [])
+        self.assertIn(f.world_coord, self.world.clock.schedule)
+
     def test_get_adjacent(self):
         f = self.world.fields[Hex(0, 0)]
         g = f.get_adjacent('Northeast')
@@ -147,16 +202,17 @@ class FieldTest(FlaskTestDB):
         self.f.battle = AttributeDict(state=AttributeDict(game_over=False))
         self.assertEqual(self.f.state, FIELD_BATTLE)
 
-    @patch('equanimity.player.get_world')
-    def test_set_owner(self, mock_get_world):
-        fields = {self.f.world_coord: self.f}
-        mock_get_world.return_value = AttributeDict(fields=fields)
+    def test_set_owner(self):
+        w = World(create_fields=False)
+        self.f = Field(w, (0, 0), I, owner=self.player)
+        self.s = self.f.stronghold
+        w.set_fields({self.f.world_coord: self.f})
         wp = self.f.owner
-        self.assertIn(self.f.world_coord, wp.get_fields(0))
+        self.assertIn(self.f.world_coord, wp.get_fields(w))
         p = Player('x', 'x@gmail.com', 'xxx')
         self.f.owner = p
-        self.assertIn(self.f.world_coord, p.get_fields(0))
-        self.assertNotIn(self.f.world_coord, wp.get_fields(0))
+        self.assertIn(self.f.world_coord, p.get_fields(w))
+        self.assertNotIn(self.f.world_coord, wp.get_fields(w))
         # make sure the free and squads and their units are updated
         self.s.silo.imbue(create_comp(earth=100))
         s = self.s.form_scient(E, create_comp(earth=1))
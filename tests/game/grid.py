@@ -1,7 +1,10 @@
 from unittest import TestCase
+from mock import Mock
 from bidict import inverted, bidict
-from equanimity.grid import Grid, Hex, Tile, HexCube
-from equanimity.const import E
+import cPickle
+from equanimity.grid import Grid, Hex, Tile, HexCube, GridIndex
+from equanimity.const import E, ELEMENTS
+from equanimity.helpers import use_random
 from equanimity.stone import Stone
 from equanimity.units import Scient
 from ..base import create_comp, FlaskTestDB
@@ -172,6 +175,29 @@ class HexGridTest(FlaskTestDB):
         # as the comp's values are not near limits (which will distort things)
         self.assertTrue(abs(h.comp[E] - s.comp[E]) < 8)
 
+    def test_create_with_comp_tiles(self):
+        s = Stone(create_comp(earth=128, fire=40))
+        h = Grid(comp=s, radius=8)
+        # Tiles are left empty, as they always have been
+        for t in h.iter_tiles():
+            self.assertEqual(t.comp, create_comp())
+
+    def test_create_with_comp_no_random(self):
+        source = Mock()
+        with use_random(source):
+            Grid(comp=Stone(create_comp(earth=128)), radius=3)
+        self.assertEqual(source.method_calls, [])
+
+    def test_create_with_comp_state(self):
+        g = Grid(comp=Stone(create_comp(earth=128)), radius=2)
+        self.assertEqual(g.__getstate__()['_comps'],
+                         bytearray(len(ELEMENTS) * g.size))
+        g.get((0, 1))[E] = 7
+        f = cPickle.loads(cPickle.dumps(g, 2))
+        self.assertEqual(f, g)
+        self.assertEqual(f.get((0, 1)).comp[E], 7)
+        self.assertEqual(f.get((1, 0)).comp, create_comp())
+
     def test_create_with_tiles(self):
         g = Grid(radius=2)
         tiles = {}
@@ -181,6 +207,69 @@ class HexGridTest(FlaskTestDB):
         self.assertEqual(h.size, 19)
         self.assertEqual(tiles, h.tiles)
 
+    def test_create_with_tiles_contents(self):
+        g = Grid(radius=1)
+        s = Scient(E, create_comp(earth=128))
+        tiles = {}
+        for i, j in g.iter_coords():
+            tiles.setdefault(i, {})[j] = Tile(comp=create_comp(fire=3))
+        tiles[0][0].set_contents(s)
+        h = Grid(radius=1, tiles=tiles)
+        self.assertIs(h.get((0, 0)), tiles[0][0])
+        self.assertEqual(h.get((0, 0)).contents, s)
+        self.assertEqual(list(h.occupied_coords()), [(0, 0)])
+        self.assertEqual(h.get((1, 0)).comp, create_comp(fire=3))
+
+    def test_tiles_write_through(self):
+        h = Grid(radius=2)
+        t = h.get((1, -1))
+        self.assertIs(t, h[1][-1])
+        t[E] = 12
+        t.contents = 'x'
+        # Drop the cached tile views; state lives in the grid's arrays
+        h._v_tiles = h._v_tile_map = None
+        t = h.get((1, -1))
+        self.assertEqual(t.comp[E], 12)
+        self.assertEqual(t.contents, 'x')
+        self.assertEqual(t.location, Hex(1, -1))
+        self.assertEqual(list(h.occupied_coords()), [(1, -1)])
+
+    def test_pickle(self):
+        h = Grid(radius=2)
+        h.get((0, 1))[E] = 7
+        g = cPickle.loads(cPickle.dumps(h, 2))
+        self.assertEqual(g.get((0, 1)).comp[E], 7)
+        self.assertEqual(g, h)
+
+    def test_unpickle_legacy_tiles(self):
+        h = Grid(radius=2)
+        state = h.__getstate__()
+        for k in ('_comps', '_contents', '_occupied'):
+            del state[k]
+        # Tiles as saved before the grid arrays
+        tiles = state['tiles'] = {}
+        for q, r in h.iter_coords():
+            tile = Tile((q, r), comp=create_comp(earth=q + 2))
+            for k in ('_grid', '_index', '_contents'):
+                del tile.__dict__[k]
+            tile.__dict__['contents'] = 'x' if (q, r) == (1, -1) else None
+            tiles.setdefault(q, {})[r] = tile
+        g = Grid.__new__(Grid)
+        g.__setstate__(state)
+        self.assertNotIn('tiles', g.__dict__)
+        self.assertEqual(g.get((0, 0)).comp, create_comp(earth=2))
+        self.assertEqual(g.get((-2, 1)).comp, create_comp(earth=0))
+        self.assertEqual(g.get((1, -1)).contents, 'x')
+        self.assertEqual(list(g.occupied_coords()), [(1, -1)])
+        self.assertEqual(g[1][-1].location, Hex(1, -1))
+
+    def test_layout_shared(self):
+        self.assertIs(Grid(radius=3).layout, Grid(radius=3).layout)
+        layout = GridIndex.get(3)
+        self.assertEqual(layout.size, Grid.compute_size(3))
+        for i, c in enumerate(layout.coords):
+            self.assertEqual(layout.index[c], i)
+
     def test_create_with_radius(self):
         h = Grid(radius=6)
         self.assertEqual(h.radius, 6)
@@ -258,6 +347,23 @@ class HexGridTest(FlaskTestDB):
         expected -= set((Hex(0, 0),))
         self.assertEqual(tiles, expected)
 
+    def test_tiles_in_range_exclude(self):
+        h = Grid()
+        for loc in [(0, 0), (3, -5), (-8, 8)]:
+            expected = h.tiles_in_range(loc, 8) - h.tiles_in_range(loc, 4)
+            got = h.tiles_in_range(loc, 8, exclude=4)
+            self.assertEqual(got, expected)
+            for c in got:
+                self.assertTrue(4 < h.layout.distance(loc, c) <= 8)
+        self.assertIs(h.tiles_in_range((0, 0), 3),
+                      Grid().tiles_in_range((0, 0), 3))
+
+    def test_tiles_in_range_out_of_bounds(self):
+        h = Grid(radius=2)
+        self.assertEqual(h.tiles_in_range((4, 0), 2), set([(2, 0)]))
+        self.assertEqual(h.tiles_in_range((4, 0), 3),
+                         set([(2, 0), (2, -1), (1, 0), (1, 1)]))
+
     def test_len(self):
         h = Grid(radius=2)
         self.assertEqual(len(h), h.size)
@@ -268,9 +374,11 @@ class HexGridTest(FlaskTestDB):
 
     def test_setitem_getitem(self):
         h = Grid(radius=2)
-        h[0] = 'x'
-        self.assertEqual(h.tiles[0], 'x')
-        self.assertEqual(h[0], 'x')
+        # Rows of tiles are views onto the grid's arrays, and can't be
+        # replaced
+        self.assertRaises(UserWarning, h.__setitem__, 0, {})
+        self.assertIs(h[0], h.tiles[0])
+        self.assertEqual(sorted(h[0]), range(-2, 3))
 
     def test_contains(self):
         h = Grid(radius=2)
@@ -300,6 +408,20 @@ class HexGridTest(FlaskTestDB):
             t.set_contents(Scient(E, create_comp(earth=128)))
         self.assertTrue(h.full())
 
+    def test_occupancy(self):
+        h = Grid(radius=1)
+        s = Scient(E, create_comp(earth=128))
+        h.get((0, 0)).set_contents(s)
+        self.assertEqual(list(h.occupied_coords()), [(0, 0)])
+        self.assertEqual(len(list(h.unoccupied_coords())), h.size - 1)
+        h.get((0, 0)).move_contents_to(h.get((1, -1)))
+        self.assertEqual(list(h.occupied_coords()), [(1, -1)])
+        self.assertEqual(h.occupied_in([(0, 0), (1, -1), (5, 5)]),
+                         [(1, -1)])
+        h.get((1, -1)).flush()
+        self.assertEqual(list(h.occupied_coords()), [])
+        self.assertEqual(h.occupied_in(h.iter_coords()), [])
+
     def test_get_triangulating_vectors(self):
         h = Grid()
         for i in range(6):
@@ -1,7 +1,8 @@
+import random
 from mock import MagicMock
 from unittest import TestCase
 from equanimity.helpers import (validate_length, atomic, AttributeDict,
-                                PersistentKwargs)
+                                PersistentKwargs, LRUCache, rng, use_random)
 from ..base import BaseTest
 
 
@@ -26,6 +27,57 @@ class TestHelpers(BaseTest):
         f.assert_called_once_with(7)
 
 
+class UseRandomTest(TestCase):
+
+    def test_use_random(self):
+        self.assertIs(rng(), random)
+        source = random.Random(1)
+        with use_random(source):
+            self.assertIs(rng(), source)
+            inner = random.Random(2)
+            with use_random(inner):
+                self.assertIs(rng(), inner)
+            self.assertIs(rng(), source)
+        self.assertIs(rng(), random)
+
+
+class LRUCacheTest(TestCase):
+
+    def test_create_invalid(self):
+        self.assertRaises(ValueError, LRUCache, maxsize=0)
+
+    def test_get(self):
+        c = LRUCache(maxsize=2)
+        self.assertIs(c.get('a'), None)
+        self.assertEqual(c.get('a', 7), 7)
+        c['a'] = 1
+        self.assertEqual(c.get('a'), 1)
+        self.assertEqual((c.hits, c.misses), (1, 2))
+
+    def test_evicts_least_recently_used(self):
+        c = LRUCache(maxsize=2)
+        c['a'] = 1
+        c['b'] = 2
+        c.get('a')
+        c['c'] = 3
+        self.assertEqual(len(c), 2)
+        self.assertIn('a', c)
+        self.assertNotIn('b', c)
+        self.assertIn('c', c)
+        c['a'] = 4
+        c['d'] = 5
+        self.assertEqual(c.get('a'), 4)
+        self.assertNotIn('c', c)
+
+    def test_clear(self):
+        c = LRUCache()
+        c['a'] = 1
+        c.get('a')
+        c.clear()
+        self.assertEqual(len(c), 0)
+        self.assertEqual((c.hits, c.misses), (0, 0))
+
+
 class AttributeDictTest(TestCase):
 
     def test_attribute_dict(self):
@@ -1,11 +1,13 @@
 from mock import patch
+from ZODB.POSException import ConflictError
 from equanimity.units import Scient
 from equanimity.unit_container import Squad
 from equanimity.player import Player, WorldPlayer, PlayerGroup
 from equanimity.const import WORLD_UID, E
 from equanimity.grid import Hex
 from equanimity.helpers import AttributeDict
-from ..base import FlaskTestDB, FlaskTestDBWorld, create_comp
+from ..base import (FlaskTestDB, FlaskTestDBWorld, TwoConnections,
+                    create_comp)
 
 
 class PlayerTest(FlaskTestDB):
@@ -218,3 +220,49 @@ class PlayerGroupTest(FlaskTestDB):
         self.pg.add(wp)
         self.assertEqual(self.pg._leader, wp)
         self.assertIs(self.pg.get_leader(allow_world=False), None)
+
+
+class PlayerGroupConflictTest(FlaskTestDB):
+
+    def setUp(self):
+        super(PlayerGroupConflictTest, self).setUp()
+        self.conns = TwoConnections()
+        players = [Player('x{0}'.format(i), 'x{0}'.format(i), 'x')
+                   for i in xrange(3)]
+        self.uids = [p.uid for p in players]
+        self.a, self.b = self.conns.store(PlayerGroup(), players=players)
+
+    def tearDown(self):
+        self.conns.close()
+        super(PlayerGroupConflictTest, self).tearDown()
+
+    def _players(self, i):
+        return self.conns.conns[i].root()['players']
+
+    def test_resolve(self):
+        x, y, z = self.uids
+        self.a.add(self._players(0)[0])
+        self.b.add(self._players(1)[1])
+        self.conns.commit()
+        g = self.conns.load()
+        self.assertEqual([p.uid for p in g], [x, y])
+        # The first committed is the leader
+        self.assertEqual(g.get_leader().uid, x)
+        self.a, self.b = self.conns.sync()
+        self.a.remove(self.a.players[x])
+        self.b.add(self._players(1)[2])
+        self.conns.commit()
+        g = self.conns.load()
+        self.assertEqual([p.uid for p in g], [y, z])
+        self.assertIs(g._leader, None)
+        self.assertEqual(g.get_leader().uid, y)
+
+    def test_conflict(self):
+        x, y, z = self.uids
+        self.a.add_all(self._players(0)[:2])
+        self.conns.tms[0].commit()
+        self.a, self.b = self.conns.sync()
+        # The leader is removed in one, and changed in the other
+        self.a.remove(self.a.players[x])
+        self.b.set_leader(y)
+        self.assertRaises(ConflictError, self.conns.commit)
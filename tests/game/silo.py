@@ -44,3 +44,43 @@ class SiloTest(TestCase):
         self.assertEqual(s.value, sum(nums) * 4)
         for e in s:
             self.assertEqual(s[e], sum(nums))
+
+    def test_get_many(self):
+        s = Silo()
+        s.imbue(Composition(10))
+        stones = s.get_many([Composition(2), Composition(3)])
+        self.assertEqual([t.comp for t in stones],
+                         [Composition(2), Composition(3)])
+        self.assertEqual(s.comp, Composition(5))
+
+    def test_get_many_transmute(self):
+        s = Silo()
+        s.imbue(Composition(10))
+        c = Composition.create(1, 11, 1, 1)
+        stones = s.get_many([c, Composition(1)])
+        self.assertEqual(len(stones), 2)
+        self.assertEqual(stones[1].comp, Composition(1))
+        spent = sum(t.value for t in stones)
+        self.assertEqual(s.value, 40 - spent)
+
+    def test_get_many_all_or_nothing(self):
+        s = Silo()
+        s.imbue(Composition(10))
+        comps = [Composition(4), Composition(4), Composition(4)]
+        self.assertRaises(ValueError, s.get_many, comps)
+        self.assertEqual(s.comp, Composition(10))
+
+    def test_get_many_empty(self):
+        s = Silo()
+        s.imbue(Composition(10))
+        self.assertEqual(s.get_many([]), [])
+        self.assertEqual(s.comp, Composition(10))
+
+    def test_reserve(self):
+        s = Silo()
+        s.imbue(Composition(10))
+        c = Composition.create(1, 11, 1, 1)
+        costs = s.reserve([c, Composition(1)])
+        self.assertEqual(s.comp, Composition(10))
+        self.assertEqual([t.comp for t in s.get_many([c, Composition(1)])],
+                         costs)
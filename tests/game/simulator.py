@@ -0,0 +1,105 @@
+import random
+from unittest import TestCase
+from threading import Thread
+from functools import partial
+from equanimity.db import AutoID
+from equanimity.world import root_factories
+from equanimity.unit_container import rand_squad
+from equanimity.simulator import (memory_store, Simulator, RandomPolicy,
+                                  ScriptedPolicy)
+from server import db
+
+
+class CountFrom(AutoID):
+
+    def __init__(self, name=''):
+        super(CountFrom, self).__init__(name=name)
+        self.uid = 100
+
+
+class MemoryStoreTest(TestCase):
+
+    def test_create(self):
+        root = memory_store()
+        self.assertEqual(sorted(root), sorted(root_factories()))
+        self.assertEqual(root['unit_uid'].get_next_id(), 1)
+
+    def test_id_factory(self):
+        root = memory_store(id_factory=CountFrom)
+        self.assertEqual(root['unit_uid'].get_next_id(), 101)
+        self.assertEqual(root['unit_uid'].name, 'unit')
+
+    def test_use(self):
+        root = memory_store()
+        with db.use(root):
+            self.assertIs(db['units'], root['units'])
+            inner = memory_store()
+            with db.use(inner):
+                self.assertIs(db['units'], inner['units'])
+            self.assertIs(db['units'], root['units'])
+        self.assertIs(db.root, None)
+
+    def test_use_thread_local(self):
+        root = memory_store()
+        seen = []
+        with db.use(root):
+            thread = Thread(target=lambda: seen.append(db.root))
+            thread.start()
+            thread.join()
+        self.assertEqual(seen, [None])
+
+
+class SimulatorTest(TestCase):
+
+    def setUp(self):
+        squad = partial(rand_squad, size=3, equip=True)
+        self.sim = Simulator(attacker=squad, defender=squad, grid_radius=4,
+                             max_actions=200)
+
+    def test_deterministic(self):
+        a = list(self.sim.run(xrange(3)))
+        b = list(self.sim.run(xrange(3)))
+        self.assertEqual(a, b)
+        self.assertEqual(self.sim.run_battle(1), a[1])
+
+    def test_global_random_untouched(self):
+        random.seed(5)
+        expect = [random.random() for i in xrange(3)]
+        random.seed(5)
+        self.sim.run_battle(1)
+        self.assertEqual([random.random() for i in xrange(3)], expect)
+
+    def test_result(self):
+        r = self.sim.run_battle(7)
+        self.assertEqual(r.seed, 7)
+        self.assertIn(r.winner, ('attacker', 'defender', None))
+        self.assertGreater(r.actions, 0)
+        self.assertLessEqual(r.actions, 200)
+        self.assertEqual(len(r.hps), 6)
+        self.assertEqual(r.attacker['size'], 3)
+        self.assertEqual(len(r.defender['weapons']), 3)
+
+    def test_scripted_passes(self):
+        self.sim.attacker_policy = partial(ScriptedPolicy, [])
+        self.sim.defender_policy = partial(ScriptedPolicy, [])
+        r = self.sim.run_battle(3)
+        self.assertEqual(r.winner, 'defender')
+        self.assertEqual(r.condition, 'Both sides passed')
+        self.assertEqual(r.actions, 8)
+
+    def test_max_actions(self):
+        self.sim.max_actions = 2
+        r = self.sim.run_battle(3)
+        self.assertIs(r.winner, None)
+        self.assertEqual(r.actions, 2)
+
+    def test_id_factory(self):
+        self.sim.id_factory = CountFrom
+        r = self.sim.run_battle(3)
+        self.sim.id_factory = AutoID
+        self.assertEqual(self.sim.run_battle(3), r)
+
+    def test_wander(self):
+        self.sim.attacker_policy = partial(RandomPolicy, advance=False)
+        r = self.sim.run_battle(3)
+        self.assertEqual(r, self.sim.run_battle(3))
@@ -1,9 +1,19 @@
+import pickle
+import cPickle
+from StringIO import StringIO
 from unittest import TestCase
-from equanimity.stone import Stone, Composition
+from collections import Mapping
+from equanimity.stone import (Stone, Composition, DEFAULT_LIMIT,
+                              frozen_comp)
 from equanimity.const import ELEMENTS, E
+from equanimity.db import find_global
 from ..base import create_comp
 
 
+class _Dict(dict):
+    pass
+
+
 class CompositionTest(TestCase):
 
     def assertValidComposition(self, c, val):
@@ -83,6 +93,77 @@ class CompositionTest(TestCase):
         # It should make a new one as well
         self.assertNotEqual(id(c), id(d))
 
+    def test_dict_access(self):
+        c = Composition.create(1, 2, 3, 4)
+        self.assertFalse(hasattr(c, '__dict__'))
+        self.assertIsInstance(c, Mapping)
+        self.assertEqual(dict(c), dict(Earth=1, Fire=2, Ice=3, Wind=4))
+        self.assertEqual(c, dict(Earth=1, Fire=2, Ice=3, Wind=4))
+        self.assertNotEqual(c, dict(Earth=1))
+        self.assertEqual(sorted(c), sorted(ELEMENTS))
+        self.assertEqual(len(c), 4)
+        self.assertIn(E, c)
+        self.assertNotIn('Dog', c)
+        self.assertIs(c.get('Dog'), None)
+        self.assertRaises(KeyError, c.__getitem__, 'Dog')
+        self.assertRaises(KeyError, c.__setitem__, 'Dog', 1)
+        self.assertRaises(TypeError, c.__delitem__, E)
+        c[E] = 7
+        c.update(Fire=8)
+        self.assertEqual(c.tup(), (7, 8, 3, 4))
+
+    def test_pickle(self):
+        c = Composition.create(1, 2, 3, 4)
+        for proto in xrange(3):
+            self.assertEqual(pickle.loads(pickle.dumps(c, proto)), c)
+
+    def test_unpickle_dict(self):
+        # Compositions used to be dicts. ZODB3 pickled them with protocol 1,
+        # as copy_reg._reconstructor(Composition, dict, values)
+        old = [
+            ("ccopy_reg\n_reconstructor\np0\n(cequanimity.stone\n"
+             "Composition\np1\nc__builtin__\ndict\np2\n(dp3\nS'Fire'\n"
+             "p4\nI2\nsS'Earth'\np5\nI1\nsS'Ice'\np6\nI3\nsS'Wind'\n"
+             "p7\nI4\nstp8\nRp9\n."),
+            ('ccopy_reg\n_reconstructor\nq\x00(cequanimity.stone\n'
+             'Composition\nq\x01c__builtin__\ndict\nq\x02}q\x03(U\x04'
+             'Fireq\x04K\x02U\x05Earthq\x05K\x01U\x03Iceq\x06K\x03U'
+             '\x04Windq\x07K\x04utq\x08Rq\t.'),
+            ('\x80\x02cequanimity.stone\nComposition\nq\x00)\x81q\x01('
+             'U\x04Fireq\x02K\x02U\x05Earthq\x03K\x01U\x04Windq\x04K'
+             '\x04U\x03Iceq\x05K\x03u}q\x06b.'),
+        ]
+        expect = Composition.create(1, 2, 3, 4)
+        for data in old:
+            # Loaded as a ZODB connection does, see equanimity.db
+            unpickler = cPickle.Unpickler(StringIO(data))
+            unpickler.find_global = find_global
+            c = unpickler.load()
+            self.assertIs(type(c), Composition)
+            self.assertEqual(c, expect)
+        # Without it, only the protocol 2 pickle loads
+        self.assertRaises(TypeError, pickle.loads, old[1])
+        self.assertEqual(pickle.loads(old[2]), expect)
+
+    def test_unpickle_other_dict_subclass(self):
+        data = pickle.dumps(_Dict(x=1), 1)
+        unpickler = cPickle.Unpickler(StringIO(data))
+        unpickler.find_global = find_global
+        d = unpickler.load()
+        self.assertIs(type(d), _Dict)
+        self.assertEqual(d, dict(x=1))
+
+    def test_arithmetic(self):
+        a = Composition.create(1, 2, 3, 4)
+        b = Composition.create(4, 3, 2, 1)
+        self.assertEqual(a + b, Composition(5))
+        self.assertEqual((a - b).tup(), (-3, -1, 1, 3))
+        self.assertEqual((a - b).clamp().tup(), (0, 0, 1, 3))
+        self.assertEqual(a.clamp(2).tup(), (1, 2, 2, 2))
+        self.assertEqual(a.clamp(b).tup(), (1, 2, 2, 1))
+        self.assertEqual(a.opp(E), 4)
+        self.assertEqual(sorted(a.orth(E)), [2, 3])
+
 
 class StoneTest(TestCase):
 
@@ -165,10 +246,45 @@ class StoneTest(TestCase):
         self.assertEqual(s['Earth'], 10)
 
     def test_setitem_bad(self):
-        s = Stone(create_comp(earth=255))
-        s.limit['Ice'] = 10
+        limit = Composition(255)
+        limit['Ice'] = 10
+        s = Stone(create_comp(earth=255), limit=limit)
         self.assertRaises(AttributeError, s.__setitem__, 'Ice', 20)
 
+    def test_default_limit_shared(self):
+        s = Stone()
+        self.assertIs(s.limit, DEFAULT_LIMIT)
+        self.assertIs(s.copy().limit, DEFAULT_LIMIT)
+        self.assertRaises(TypeError, s.limit.__setitem__, 'Ice', 10)
+        self.assertRaises(TypeError, s.limit.set_opp, E, 10)
+        self.assertEqual(s.limit, Composition(255))
+        self.assertIsNot(Stone(limit=Composition(255)).limit, DEFAULT_LIMIT)
+        self.assertIn('DEFAULT_LIMIT', pickle.dumps(DEFAULT_LIMIT, 2))
+
+    def test_pickle_default_limit(self):
+        s = Stone(create_comp(earth=3))
+        data = pickle.dumps(s, 2)
+        self.assertNotIn('limit', data)
+        t = pickle.loads(data)
+        self.assertIs(t.limit, DEFAULT_LIMIT)
+        self.assertEqual(t.comp, s.comp)
+
+    def test_unpickle_copied_default_limit(self):
+        s = Stone(create_comp(earth=3), limit=Composition(255))
+        self.assertIs(pickle.loads(pickle.dumps(s, 2)).limit, DEFAULT_LIMIT)
+        s = Stone(create_comp(earth=3), limit=Composition(200))
+        self.assertEqual(pickle.loads(pickle.dumps(s, 2)).limit,
+                         Composition(200))
+
+    def test_frozen_comp(self):
+        a = frozen_comp((1, 2, 3, 4))
+        self.assertIs(frozen_comp(dict(a)), a)
+        self.assertIs(pickle.loads(pickle.dumps(a, 2)), a)
+        self.assertEqual(hash(a), hash(frozen_comp([1, 2, 3, 4])))
+        b = Composition.create(a)
+        b[E] = 5
+        self.assertEqual(a[E], 1)
+
     def test_len(self):
         s = Stone(create_comp())
         self.assertEqual(len(s), 4)
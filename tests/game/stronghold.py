@@ -1,12 +1,17 @@
+from unittest import TestCase
 from mock import patch, Mock, MagicMock
+from persistent.mapping import PersistentMapping
+from ZODB.POSException import ConflictError
 from voluptuous import Schema
 from equanimity.grid import Hex
-from equanimity.const import E, F, I
+from equanimity.clock import now
+from equanimity.const import E, F, I, CLOCK, WEP_LIST
 from equanimity.stronghold import Stronghold, SparseList, SparseStrongholdList
 from equanimity.unit_container import Squad
 from equanimity.units import Scient
 from equanimity.player import WorldPlayer, Player
-from ..base import FlaskTestDB, FlaskTestDBWorld, create_comp
+from ..base import (FlaskTestDB, FlaskTestDBWorld, TwoConnections,
+                    create_comp)
 
 
 class SparseListTest(FlaskTestDB):
@@ -91,6 +96,33 @@ class SparseListTest(FlaskTestDB):
         self.assertRaises(KeyError, self.s.__getitem__, 7)
 
 
+class SparseListConflictTest(TestCase):
+
+    def setUp(self):
+        self.conns = TwoConnections()
+        s = SparseList()
+        s.append(PersistentMapping(name='a'))
+        s.append(PersistentMapping(name='b'))
+        self.a, self.b = self.conns.store(s)
+
+    def tearDown(self):
+        self.conns.close()
+
+    def test_resolve(self):
+        del self.a[0]
+        self.b.append(PersistentMapping(name='c'))
+        self.conns.commit()
+        s = self.conns.load()
+        self.assertEqual(sorted(s.items), [1, 2])
+        self.assertEqual([x['name'] for x in s], ['b', 'c'])
+        self.assertEqual(s.index, 2)
+
+    def test_same_position(self):
+        self.a.append(PersistentMapping(name='c'))
+        self.b.append(PersistentMapping(name='d'))
+        self.assertRaises(ConflictError, self.conns.commit)
+
+
 class SparseStrongholdListTest(FlaskTestDBWorld):
 
     def setUp(self):
@@ -286,6 +318,33 @@ class StrongholdTest(FlaskTestDBWorld):
         self.assertEqual(self.s.units[scient.uid], scient)
         self.assertEqual(self.s.free[scient.uid], scient)
 
+    def test_feed_units(self):
+        a = self.s.form_scient(E, create_comp(earth=10))
+        b = self.s.form_scient(E, create_comp(earth=20))
+        c = self.s.form_scient(E, create_comp(earth=5))
+        value = self.s.silo.value
+        hungry = now() - CLOCK['day'] * 61
+        for unit in (a, b):
+            unit.fed_on = hungry
+        fed_on = c.fed_on
+        self.s.feed_units()
+        self.assertEqual(self.s.silo.value, value - 30)
+        self.assertGreater(a.fed_on, hungry)
+        self.assertGreater(b.fed_on, hungry)
+        self.assertEqual(c.fed_on, fed_on)
+
+    def test_feed_units_not_enough(self):
+        a = self.s.form_scient(E, create_comp(earth=30))
+        b = self.s.form_scient(E, create_comp(earth=30))
+        self.s.silo.split(create_comp(earth=self.s.silo.value - 40))
+        hungry = now() - CLOCK['day'] * 61
+        for unit in (a, b):
+            unit.fed_on = hungry
+        self.assertRaises(ValueError, self.s.feed_units)
+        self.assertEqual(self.s.silo.value, 40)
+        self.assertEqual(a.fed_on, hungry)
+        self.assertEqual(b.fed_on, hungry)
+
     @patch.object(Stronghold, 'max_occupancy')
     def test_form_scient_max_occupancy(self, mock_max):
         mock_max.__get__ = Mock(return_value=0)
@@ -399,8 +458,11 @@ class StrongholdTest(FlaskTestDBWorld):
         unit = self.s.form_scient(E, create_comp(earth=10))
         sq = self.s.form_squad(unit_ids=(unit.uid,), name='sq')
         self.assertIn(sq, self.s.squads)
+        self.assertNotIn(self.f.world_coord, self.w.clock.schedule)
         sqq = self.s.remove_squad(sq.stronghold_pos)
         self.assertEqual(sq, sqq)
+        # Empty, so the field is checked at the next day change
+        self.assertIn(self.f.world_coord, self.w.clock.schedule)
 
     def test_get_defenders(self):
         self.s._setup_default_defenders()
@@ -602,6 +664,15 @@ class StrongholdTest(FlaskTestDBWorld):
         self.assertExceptionContains(ValueError, 'is not related',
                                      self.s._remove_unit_from, Squad(), s.uid)
 
+    def test_setup_default_defenders_silo(self):
+        value = self.s.silo.value
+        sq = self.s._setup_default_defenders()
+        self.assertEqual(self.s.silo.value, value)
+        self.assertEqual(len(sq), len(WEP_LIST))
+        for unit in sq:
+            self.assertIsNot(unit.fed_on, None)
+            self.assertEqual(unit.name, 'Ms. ' + unit.weapon.type)
+
     def test_setup_default_defeneders_twice(self):
         self.s._setup_default_defenders()
         self.assertExceptionContains(ValueError, 'already set up',
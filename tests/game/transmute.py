@@ -1,14 +1,16 @@
+import random
 from mock import patch
 from unittest import TestCase
-from equanimity.const import E, F, I, W
+from equanimity.const import E, F, I, W, ELEMENTS
 from equanimity.stone import Composition
-from equanimity.transmuter import Transmuter
+from equanimity.transmuter import Transmuter, ElementSolver
 
 
 class TransmuterTest(TestCase):
 
     def setUp(self):
         super(TransmuterTest, self).setUp()
+        Transmuter.cache.clear()
         self.setup_transmuter(Composition.create(1, 2, 2, 2),
                               Composition.create(2, 1, 0, 0))
 
@@ -136,3 +138,74 @@ class TransmuterTest(TestCase):
         self.assertRaises(ValueError, self.t.get_cost)
         self.assertTrue(self.t.failed)
         self.assertIs(self.t.solution, None)
+
+    def test_clamp(self):
+        silo = {E: 100, F: 100, I: 100, W: 1}
+        need = {E: 3, F: 2}
+        self.assertEqual(self.t._clamp(silo, need),
+                         {E: 8, F: 9, I: 18, W: 1})
+
+    def test_get_cost_cached(self):
+        self.setup_transmuter(Composition.create(1, 2, 50, 50),
+                              Composition.create(2, 1, 0, 0))
+        cost = self.t.get_cost()
+        # Same problem, with more of the elements than could be spent
+        self.setup_transmuter(Composition.create(1, 2, 200, 200),
+                              Composition.create(2, 1, 0, 0))
+        with patch.object(ElementSolver, 'solve') as mock_solve:
+            self.assertEqual(self.t.get_cost().comp, cost.comp)
+            mock_solve.assert_not_called()
+        self.assertEqual(self.t.solution, dict(cost.comp))
+        self.assertEqual(Transmuter.cache.hits, 1)
+
+    def test_get_cost_failure_cached(self):
+        self.setup_transmuter(Composition.create(0, 0, 0, 3),
+                              Composition.create(1, 0, 0, 0))
+        self.assertRaises(ValueError, self.t.get_cost)
+        self.setup_transmuter(Composition.create(0, 0, 0, 3),
+                              Composition.create(1, 0, 0, 0))
+        with patch.object(ElementSolver, 'solve') as mock_solve:
+            self.assertRaises(ValueError, self.t.get_cost)
+            mock_solve.assert_not_called()
+        self.assertTrue(self.t.failed)
+
+
+class ElementSolverTest(TestCase):
+
+    def _solvers(self, silo, need):
+        t = Transmuter(silo, need)
+        a, b = t._prepare_comps(t.silo, t.need)
+        a = t._clamp(a, b)
+        v, s = t._generate_variables(a, b)
+        return ElementSolver(a, b, v, s).solve(), t._solve_constraints(a, b)
+
+    def test_solve(self):
+        sol, _ = self._solvers(Composition.create(1, 2, 2, 2),
+                               Composition.create(2, 1, 0, 0))
+        expect_sol = dict(siloW=2, siloI=2, needE=1, siloF=1,
+                          siloFE=0, siloIE=2, siloWE=0)
+        self.assertEqual(sol, expect_sol)
+
+    def test_solve_none(self):
+        sol, _ = self._solvers(Composition.create(0, 0, 0, 3),
+                               Composition.create(1, 0, 0, 0))
+        self.assertIs(sol, None)
+
+    def test_same_as_constraint_solver(self):
+        rand = random.Random(7)
+        for i in xrange(150):
+            elements = list(ELEMENTS)
+            rand.shuffle(elements)
+            n = rand.randint(1, 3)
+            high = rand.choice([4, 10, 20])
+            silo = Composition(0)
+            need = Composition(0)
+            for e in elements[:n]:
+                silo[e] = rand.randint(1, high)
+            for e in elements[n:]:
+                need[e] = rand.randint(0, high // 2 + 1)
+            if not sum(need.values()):
+                continue
+            direct, generic = self._solvers(silo, need)
+            self.assertEqual(direct, generic,
+                             'Differs for {0}, {1}'.format(silo, need))
@@ -1,6 +1,7 @@
 from mock import patch
 from voluptuous import Schema
-from equanimity.vestibule import Vestibule
+from equanimity.vestibule import Vestibule, OPEN, BUILDING, READY, FAILED
+from equanimity.world import World
 from equanimity.player import Player
 from equanimity.helpers import AttributeDict
 from ..base import FlaskTestDB
@@ -61,3 +62,61 @@ class VestibuleTest(FlaskTestDB):
         self.assertEqual(w.uid, v.uid)
         mock_world_persist.assert_called_once_with()
         mock_world_start.assert_called_once_with()
+
+    def _vestibule(self):
+        v = Vestibule()
+        v.persist()
+        for name in ('xxx', 'yyy'):
+            p = Player(name, name + '@gmail.com', 'sdadwadawda')
+            p.persist()
+            v.players.add(p)
+        return v
+
+    def test_build(self):
+        v = self._vestibule()
+        self.assertEqual(v.status()['state'], OPEN)
+        w = v.begin_build()
+        self.assertEqual(v.state, BUILDING)
+        self.assertEqual(v.world, w.uid)
+        self.assertFalse(w.fields)
+        self.assertRaises(ValueError, v.begin_build)
+        v.build(batch_size=3)
+        status = v.status()
+        self.assertEqual(status['state'], READY)
+        self.assertEqual(status['done'], status['total'])
+        self.assertIs(status['error'], None)
+        self.assertEqual(len(w.fields), len(list(w.grid.iter_coords())))
+        for p in v.players:
+            self.assertTrue(any(f.owner == p for f in w.fields.values()))
+        for f in w.fields.values():
+            self.assertTrue(f.stronghold.garrisoned)
+
+    def test_build_steps(self):
+        w = World.create(create_fields=False)
+        p = Player('xxx', 'yyy@gmail.com', 'sdadwadawda')
+        p.persist()
+        w.players.add(p)
+        steps = list(w.build(batch_size=3))
+        size = len(w.fields)
+        self.assertEqual(steps, [(3, 9), (4, 9), (5, 9), (8, 9), (9, 9)])
+        self.assertEqual(size, 4)
+        owned = w.get_owned_fields(p)
+        owned.update(w.get_owned_fields(w.player))
+        self.assertEqual(owned, dict(w.fields))
+
+    @patch('equanimity.world.World._distribute_fields_to_players')
+    def test_build_failed(self, mock_distribute):
+        mock_distribute.side_effect = ValueError('xxx')
+        v = self._vestibule()
+        v.begin_build()
+        v.build()
+        self.assertEqual(v.state, FAILED)
+        self.assertEqual(v.status()['error'], 'xxx')
+
+    def test_fail(self):
+        v = self._vestibule()
+        v.begin_build()
+        v.fail(ValueError('xxx'))
+        status = v.status()
+        self.assertEqual(status['state'], FAILED)
+        self.assertEqual(status['error'], 'xxx')
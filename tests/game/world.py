@@ -1,5 +1,7 @@
-from mock import patch, call
+from mock import patch, call, Mock
+from BTrees.OOBTree import OOTreeSet
 from equanimity.world import World
+from equanimity.clock import WorldClock
 from equanimity.player import Player
 from equanimity.const import ELEMENTS, ORTH, OPP, I
 from ..base import FlaskTestDB
@@ -47,6 +49,82 @@ class WorldTest(FlaskTestDB):
         w.players.add(p)
         w.award_field(p, loc)
         self.assertEqual(p, w.fields[loc].owner)
+        self.assertEqual(w.get_owned_fields(p), {loc: w.fields[loc]})
+        self.assertNotIn(loc, w.get_owned_fields(w.player))
+
+    def test_get_owned_fields(self):
+        w = World()
+        p = Player('xxx', 'xxx@example.com', 'xxxpassword')
+        self.assertEqual(w.get_owned_fields(p), {})
+        self.assertEqual(w.get_owned_fields(w.player), dict(w.fields))
+        f = w.fields[(0, 0)]
+        f.owner = p
+        self.assertEqual(w.get_owned_fields(p), {(0, 0): f})
+        f.owner = w.player
+        self.assertEqual(w.get_owned_fields(p), {})
+        self.assertNotIn(p.uid, w._owned_fields)
+        self.assertEqual(w.get_owned_fields(w.player), dict(w.fields))
+
+    def test_get_owned_fields_ignores_other_fields(self):
+        from equanimity.field import Field
+        w = World()
+        p = Player('xxx', 'xxx@example.com', 'xxxpassword')
+        Field(w, (0, 0), I, owner=p)
+        self.assertEqual(w.get_owned_fields(p), {})
+
+    def test_get_owned_fields_ignores_missing_fields(self):
+        from equanimity.field import Field
+        w = World(create_fields=False)
+        p = Player('xxx', 'xxx@example.com', 'xxxpassword')
+        f = Field(w, (0, 0), I, owner=p)
+        f.owner = w.player
+        f.owner = p
+        self.assertEqual(w.get_owned_fields(p), {})
+        self.assertEqual(w.get_owned_fields(w.player), {})
+
+    def test_get_owned_fields_rebuilds_index(self):
+        w = World()
+        p = Player('xxx', 'xxx@example.com', 'xxxpassword')
+        w.fields[(0, 0)].owner = p
+        del w._owned_fields
+        self.assertEqual(w.get_owned_fields(p), {(0, 0): w.fields[(0, 0)]})
+        w.fields[(0, 0)].owner = w.player
+        self.assertEqual(w.get_owned_fields(p), {})
+
+    def test_get_visible_fields(self):
+        w = World()
+        p = Player('xxx', 'xxx@example.com', 'xxxpassword')
+        self.assertEqual(w.get_visible_fields(p), frozenset())
+        w.fields[(0, 0)].owner = p
+        v = w.get_visible_fields(p)
+        expect = set([(0, 0)]) | w.grid.get_adjacent((0, 0))
+        self.assertEqual(v, expect)
+        # Cached until ownership changes
+        self.assertIs(w.get_visible_fields(p), v)
+        w.fields[(0, 0)].owner = w.player
+        self.assertEqual(w.get_visible_fields(p), frozenset())
+
+    def test_get_visible_fields_version(self):
+        w = World()
+        p = Player('xxx', 'xxx@example.com', 'xxxpassword')
+        w.get_visible_fields(p)
+        # Another connection changing ownership bumps the shared version
+        w._ownership_version.change(1)
+        w.fields[(0, 0)]._owner = p
+        w._owned_fields[p.uid] = OOTreeSet([(0, 0)])
+        self.assertIn((0, 0), w.get_visible_fields(p))
+
+    @patch('equanimity.world.transaction')
+    @patch('equanimity.clock.WorldClock.change_day')
+    def test_tick(self, mock_change, mock_transaction):
+        w = World()
+        with patch.object(WorldClock, 'elapsed') as mock_elapsed:
+            mock_elapsed.__get__ = Mock(return_value=240 * 9)
+            self.assertEqual(w.tick(max_days=5, batch_days=2), 4)
+            self.assertEqual(mock_change.call_count, 5)
+            self.assertEqual(mock_transaction.commit.call_count, 3)
+            self.assertEqual(w.tick(), 0)
+            self.assertEqual(mock_change.call_count, 9)
 
     def test_persist(self):
         w = World()
@@ -5,6 +5,7 @@ from equanimity.weapons import Bow
 from equanimity.player import Player
 from equanimity.grid import Hex
 from equanimity.const import E
+from server.transactions import get_runner
 from ..base import create_comp
 from rpc_base import RPCTestBase
 
@@ -65,6 +66,8 @@ class BattleTest(BattleTestBase):
         self.battle.start()
         r = getattr(self.proxy, 'pass')(self.world.uid, self.loc, t.uid)
         self.assertNoError(r)
+        stats = get_runner(self.app).stats.snapshot()
+        self.assertEqual(stats['battle.pass']['commits'], 1)
 
     def test_move(self):
         s, t, atksquad, defsquad = self._create_units()
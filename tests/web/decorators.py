@@ -1,11 +1,13 @@
 from unittest import TestCase
-from mock import patch
+from mock import patch, Mock, call
+from ZODB.POSException import ConflictError, ReadConflictError
 from os import urandom
 from StringIO import StringIO
 from flask import Blueprint, url_for
 from equanimity.world import init_db
 from server import db, create_app
 from server.decorators import script, api, ratelimit, commit
+from server.transactions import default_runner
 from users import UserTestBase
 from ..base import FlaskTest
 
@@ -120,11 +122,69 @@ class RateLimitDecoratorTest(TestCase):
         self.assertIn('hit the rate limit', r.data)
 
 
+def _rpc(**kwargs):
+    f = Mock(**kwargs)
+    f.__name__ = 'rpc'
+    return f
+
+
 class CommitTest(TestCase):
 
-    @patch('server.decorators.transaction.commit')
+    @patch('server.transactions.transaction.commit')
     def test_commit(self, mock_commit):
         f = lambda: 7
         g = commit(f)
         self.assertEqual(g(), 7)
         mock_commit.assert_called_once_with()
+
+    @patch('server.transactions.default_runner.sleep')
+    @patch('server.transactions.transaction')
+    def test_commit_retry(self, mock_transaction, mock_sleep):
+        mock_transaction.commit.side_effect = [ConflictError(), None]
+        f = _rpc(return_value=7)
+        self.assertEqual(commit(f)(1, x=2), 7)
+        self.assertEqual(f.call_args_list, [call(1, x=2)] * 2)
+        mock_transaction.abort.assert_called_once_with()
+        self.assertEqual(mock_sleep.call_count, 1)
+
+    @patch('server.transactions.default_runner.sleep')
+    @patch('server.transactions.transaction')
+    def test_commit_retry_read_conflict(self, mock_transaction, mock_sleep):
+        f = _rpc(side_effect=[ReadConflictError(), 7])
+        self.assertEqual(commit(f)(), 7)
+        self.assertEqual(f.call_count, 2)
+        mock_transaction.commit.assert_called_once_with()
+
+    @patch('server.transactions.default_runner.sleep')
+    @patch('server.transactions.transaction')
+    def test_commit_retries_exhausted(self, mock_transaction, mock_sleep):
+        mock_transaction.commit.side_effect = ConflictError()
+        f = _rpc(return_value=7)
+        self.assertRaises(ConflictError, commit(f))
+        retries = default_runner.retries
+        self.assertEqual(f.call_count, retries + 1)
+        self.assertEqual(mock_transaction.abort.call_count, retries + 1)
+        self.assertEqual(mock_sleep.call_count, retries)
+
+    @patch('server.transactions.transaction')
+    def test_commit_error(self, mock_transaction):
+        f = _rpc(side_effect=ValueError())
+        self.assertRaises(ValueError, commit(f))
+        self.assertEqual(f.call_count, 1)
+        mock_transaction.commit.assert_not_called()
+
+    @patch('server.transactions.transaction')
+    def test_commit_name(self, mock_transaction):
+        f = _rpc(return_value=7)
+        stats = default_runner.stats
+        calls = stats.snapshot().get('battle.move', {}).get('calls', 0)
+        self.assertEqual(commit('battle.move')(f)(), 7)
+        self.assertEqual(stats.snapshot()['battle.move']['calls'], calls + 1)
+
+    @patch('server.transactions.transaction')
+    def test_commit_unnamed(self, mock_transaction):
+        f = _rpc(return_value=7)
+        stats = default_runner.stats
+        calls = stats.snapshot().get('rpc', {}).get('calls', 0)
+        commit(f)()
+        self.assertEqual(stats.snapshot()['rpc']['calls'], calls + 1)
@@ -1,4 +1,5 @@
 from voluptuous import Schema, Any
+from server.transactions import get_runner
 from battle import BattleTestBase
 
 
@@ -12,7 +13,7 @@ class InfoTest(BattleTestBase):
 
     def _setup_schemas(self):
         self.clock_schema = Schema(dict(clock=dict(dob=int, elapsed=int,
-                                                   state=dict)))
+                                                   behind=int, state=dict)))
         self._field_clock_schema = dict(season=unicode)
         self._queue_schema = dict(uid=int, slot=[int, int])
         self._field_schema = dict(
@@ -60,6 +61,7 @@ class InfoTest(BattleTestBase):
             free=[self._unit_schema], squads=[self._squad_schema],
             defenders=self._squad_schema
         )))
+        self.transactions_schema = Schema(dict(transactions=dict))
 
     def _coerce(self, expect):
         """ Convert expected api_view data to the types that will be received
@@ -128,6 +130,12 @@ class InfoTest(BattleTestBase):
         expect = self._coerce(unit.api_view())
         self.assertEqual(expect, data['unit'])
 
+    def test_transactions_info(self):
+        stats = get_runner(self.app).stats
+        stats.record('battle.move', 'conflicts')
+        data = self._test('transactions')
+        self.assertEqual(data['transactions']['battle.move']['conflicts'], 1)
+
     def test_stronghold_info(self):
         self._start_battle()
         data = self._test('stronghold', self.world.uid, self.loc)
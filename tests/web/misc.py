@@ -1,7 +1,15 @@
 import os
 from unittest import TestCase
-from server import create_app, attach_loggers
+import transaction
+from flask import current_app
+from mock import patch, Mock
+from server import create_app, attach_loggers, storage_uri, zeo_client_name
+from server import db
+from server.jobs import Job, run_job
 from server.utils import construct_full_url, api_error, RateLimit
+from server.ratelimit import MemoryStore
+from equanimity.world import World, init_db
+from equanimity.db import class_factory
 from ..base import FlaskTestDB
 
 
@@ -44,6 +52,62 @@ class AppInitTest(TestCase):
         app = create_app(subdomain='dog', config='test')
         self.assertTrue(app.config['SERVER_NAME'].startswith('dog'))
 
+    def test_id_block_size(self):
+        app = create_app(config='test')
+        self.assertEqual(app.extensions['zodb'].db.id_block_size, 1)
+        app = create_app(config='test')
+        app.config['AUTO_ID_BLOCK_SIZE'] = 50
+        self.assertEqual(app.extensions['zodb'].db.id_block_size, 50)
+
+    def test_db_config(self):
+        app = create_app(config='test')
+        app.config.update(ZODB_POOL_SIZE=3, ZODB_CACHE_SIZE=500)
+        database = app.extensions['zodb'].db
+        self.assertEqual(database.getPoolSize(), 3)
+        self.assertEqual(database.getCacheSize(), 500)
+        self.assertIs(database.classFactory, class_factory)
+
+    def test_db_warm(self):
+        app = create_app(config='test')
+        app.config['ZODB_WARM_ROOTS'] = ('worlds',)
+        with patch.object(db, 'warm') as mock_warm:
+            # Not on opening, which may happen in a job or a request
+            database = app.extensions['zodb'].db
+            mock_warm.assert_not_called()
+            db.warm_up(app)
+        mock_warm.assert_called_once_with(database, ('worlds',),
+                                          app.config['ZODB_WARM_LIMIT'])
+        app.config['ZODB_WARM_ROOTS'] = None
+        self.assertEqual(db.warm_up(app), 0)
+        with app.test_request_context():
+            init_db()
+            db['worlds'][1] = World(create_fields=False)
+            transaction.commit()
+        self.assertEqual(db.warm(database, ('worlds', 'players'), limit=2),
+                         2)
+
+    def test_storage_uri(self):
+        config = dict(ZODB_STORAGE='zeo://localhost:9100?cache_size=1MB',
+                      ZEO_CACHE_SIZE='64MB', ZEO_CLIENT='eq',
+                      ZODB_POOL_SIZE=3, ZODB_CACHE_SIZE=None)
+        uri = storage_uri(config)
+        base, query = uri.split('?')
+        self.assertEqual(base, 'zeo://localhost:9100')
+        self.assertEqual(sorted(query.split('&')),
+                         ['cache_size=1MB', 'client=eq',
+                          'connection_pool_size=3'])
+        config['ZODB_STORAGE'] = 'memory://'
+        self.assertEqual(storage_uri(config),
+                         'memory://?connection_pool_size=3')
+        config['ZODB_POOL_SIZE'] = None
+        self.assertEqual(storage_uri(config), 'memory://')
+
+    def test_zeo_client_name(self):
+        self.assertEqual(zeo_client_name('eq'), 'eq')
+        uwsgi = Mock(worker_id=Mock(return_value=2))
+        with patch.dict('sys.modules', uwsgi=uwsgi):
+            self.assertEqual(zeo_client_name('eq'), 'eq-2')
+
     def test_logger_setup_no_debug(self):
         # There's nothing to really test besides to make sure the code
         # doesn't crash.  This only affects the logging levels set
@@ -100,3 +164,98 @@ class RateLimitTest(FlaskTestDB):
         r.current = 10
         self.assertTrue(r.over_limit)
         self.assertEqual(r.remaining, 0)
+
+    @patch('server.utils.time.time')
+    def test_rate_limit_sliding_window(self, mock_time):
+        store = MemoryStore()
+        mock_time.return_value = 1000
+        for i in xrange(4):
+            RateLimit(self.key, 10, 100, store=store)
+        # A quarter of the way into the next window, three quarters of the
+        # previous window's hits still count
+        mock_time.return_value = 1125
+        r = RateLimit(self.key, 10, 100, store=store)
+        self.assertEqual(r.reset, 1200)
+        self.assertEqual(r.current, 4)
+        mock_time.return_value = 1175
+        r = RateLimit(self.key, 10, 100, store=store)
+        self.assertEqual(r.current, 3)
+        # Nothing counts from two windows back
+        mock_time.return_value = 1200
+        r = RateLimit(self.key, 10, 100, store=store)
+        self.assertEqual(r.current, 3)
+
+
+class JobsTest(FlaskTestDB):
+
+    def _job(self, out):
+        out.append(sorted(db['vestibules'].keys()))
+
+    def _failing_job(self, *args):
+        raise ValueError('xxx')
+
+    def _on_error(self, error, out):
+        out.append(str(error))
+        db['vestibules'][8] = 'y'
+
+    def test_inline(self):
+        db['vestibules'][7] = 'x'
+        out = []
+        job = run_job(self._job, out)
+        # Not started before the transaction commits
+        self.assertIs(job.worker, None)
+        transaction.commit()
+        self.assertEqual(out, [[7]])
+
+    def test_thread(self):
+        self.app.config['JOB_RUNNER'] = 'thread'
+        db['vestibules'][7] = 'x'
+        out = []
+        job = run_job(self._job, out)
+        transaction.commit()
+        job.join()
+        # The job sees what was committed before it started
+        self.assertEqual(out, [[7]])
+
+    def test_aborted(self):
+        out = []
+        job = run_job(self._job, out)
+        transaction.abort()
+        transaction.commit()
+        self.assertIs(job.worker, None)
+        self.assertEqual(out, [])
+
+    @patch('server.jobs.logging')
+    def test_error(self, mock_logging):
+        out = []
+        run_job(self._failing_job, out, on_error=self._on_error)
+        transaction.commit()
+        self.assertEqual(out, ['xxx'])
+        transaction.begin()
+        self.assertEqual(db['vestibules'][8], 'y')
+
+    @patch('server.jobs.logging')
+    def test_error_handler_error(self, mock_logging):
+        out = []
+        run_job(self._failing_job, out, on_error=self._failing_job)
+        transaction.commit()
+        self.assertEqual(out, [])
+        logger = mock_logging.getLogger.return_value
+        self.assertEqual(logger.exception.call_count, 2)
+
+    def test_forked(self):
+        app = create_app(config='test')
+        app.config['ZEO_CLIENT'] = 'eq'
+        parent_db = app.extensions['zodb'].db
+        out = []
+
+        def f():
+            out.append((current_app.config['ZEO_CLIENT'],
+                        app.extensions['zodb'].db is parent_db))
+
+        Job(app, f, (), {}).run(forked=True)
+        self.assertEqual(out, [(None, False)])
+
+    def test_unknown_runner(self):
+        self.app.config['JOB_RUNNER'] = 'xxx'
+        self.assertRaises(ValueError, run_job, self._job, [])
@@ -0,0 +1,113 @@
+from unittest import TestCase
+from mock import Mock
+from server import create_app
+from server.ratelimit import (MemoryStore, UwsgiStore, RedisStore, LocalRedis,
+                              create_store, get_store)
+
+
+class Clock(object):
+
+    def __init__(self, t=1000.0):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+
+class MemoryStoreTest(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.store = MemoryStore(clock=self.clock)
+
+    def test_incr(self):
+        self.assertEqual(self.store.get('a'), 0)
+        self.assertEqual(self.store.incr('a', 10), 1)
+        self.assertEqual(self.store.incr('a', 10), 2)
+        self.assertEqual(self.store.incr('b', 10), 1)
+        self.assertEqual(self.store.get('a'), 2)
+
+    def test_expire(self):
+        self.store.incr('a', 10)
+        self.clock.t += 9
+        self.assertEqual(self.store.incr('a', 10), 2)
+        self.clock.t += 1
+        self.assertEqual(self.store.get('a'), 0)
+        self.assertEqual(self.store.incr('a', 10), 1)
+
+    def test_sweep(self):
+        self.store.incr('a', 10)
+        self.store.incr('b', 100)
+        self.assertEqual(len(self.store), 2)
+        self.clock.t += self.store.sweep_interval
+        self.store.incr('c', 10)
+        self.assertEqual(sorted(self.store.data), ['b', 'c'])
+
+
+class UwsgiStoreTest(TestCase):
+
+    def test_incr(self):
+        uwsgi = Mock()
+        uwsgi.cache_num.return_value = 3
+        store = UwsgiStore(cache='xxx', uwsgi=uwsgi)
+        self.assertEqual(store.incr('a', 10), 3)
+        uwsgi.cache_inc.assert_called_once_with('a', 1, 10, 'xxx')
+        uwsgi.cache_num.return_value = None
+        self.assertEqual(store.get('a'), 0)
+
+    def test_outside_uwsgi(self):
+        self.assertRaises(ImportError, UwsgiStore)
+
+
+class LocalRedisTest(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.redis = LocalRedis(clock=self.clock)
+
+    def test_commands(self):
+        self.assertIs(self.redis.get('a'), None)
+        self.assertFalse(self.redis.expire('a', 10))
+        self.assertEqual(self.redis.incr('a'), 1)
+        self.assertEqual(self.redis.incr('a', 2), 3)
+        self.assertEqual(self.redis.get('a'), '3')
+        self.assertTrue(self.redis.expire('a', 10))
+        self.clock.t += 10
+        self.assertIs(self.redis.get('a'), None)
+        self.assertEqual(len(self.redis), 0)
+
+    def test_pipeline(self):
+        pipe = self.redis.pipeline()
+        pipe.incr('a').incr('a')
+        pipe.expire('a', 5)
+        self.assertEqual(self.redis.get('a'), None)
+        self.assertEqual(pipe.execute(), [1, 2, True])
+        self.assertEqual(pipe.execute(), [])
+
+    def test_redis_store(self):
+        store = RedisStore(self.redis)
+        self.assertEqual(store.get('a'), 0)
+        self.assertEqual(store.incr('a', 10), 1)
+        self.assertEqual(store.incr('a', 10), 2)
+        self.assertEqual(store.get('a'), 2)
+        self.clock.t += 10
+        self.assertEqual(store.get('a'), 0)
+
+
+class GetStoreTest(TestCase):
+
+    def test_create_store(self):
+        self.assertIsInstance(create_store({}), MemoryStore)
+        store = create_store(dict(RATE_LIMIT_STORE='local_redis'))
+        self.assertIsInstance(store.client, LocalRedis)
+        self.assertRaises(ValueError, create_store,
+                          dict(RATE_LIMIT_STORE='xxx'))
+
+    def test_get_store(self):
+        app = create_app(config='test')
+        store = get_store(app)
+        self.assertIsInstance(store, MemoryStore)
+        self.assertIs(get_store(app), store)
+        with app.test_request_context():
+            self.assertIs(get_store(), store)
+        self.assertIsNot(get_store(create_app(config='test')), store)
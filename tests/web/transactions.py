@@ -0,0 +1,157 @@
+from unittest import TestCase
+from mock import Mock, patch
+from ZODB.POSException import ConflictError, ReadConflictError
+from server.transactions import (RetryBudget, TransactionStats,
+                                 TransactionRunner, create_runner, get_runner,
+                                 default_runner)
+from ..base import FlaskTest
+
+
+class RetryBudgetTest(TestCase):
+
+    def test_withdraw(self):
+        budget = RetryBudget(ratio=0.5, reserve=2)
+        self.assertTrue(budget.withdraw())
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        self.assertTrue(budget.withdraw())
+
+    def test_deposit_capped(self):
+        budget = RetryBudget(ratio=1, reserve=2)
+        for i in xrange(5):
+            budget.deposit()
+        self.assertEqual(budget.balance, 2)
+
+
+class TransactionStatsTest(TestCase):
+
+    def test_record(self):
+        stats = TransactionStats()
+        stats.record('x', 'calls')
+        stats.record('x', 'calls')
+        stats.record('y', 'retries')
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot['x']['calls'], 2)
+        self.assertEqual(snapshot['x']['retries'], 0)
+        self.assertEqual(snapshot['y']['retries'], 1)
+        # A copy
+        snapshot['x']['calls'] = 7
+        self.assertEqual(stats.snapshot()['x']['calls'], 2)
+
+
+@patch('server.transactions.transaction')
+class TransactionRunnerTest(TestCase):
+
+    def setUp(self):
+        super(TransactionRunnerTest, self).setUp()
+        self.sleep = Mock()
+        self.runner = TransactionRunner(retries=3, backoff=0.1,
+                                        max_backoff=0.3, sleep=self.sleep)
+
+    def _stats(self, name='x'):
+        return self.runner.stats.snapshot()[name]
+
+    def test_run(self, mock_transaction):
+        f = Mock(return_value=7)
+        self.assertEqual(self.runner.run('x', f, 1, y=2), 7)
+        f.assert_called_once_with(1, y=2)
+        mock_transaction.commit.assert_called_once_with()
+        stats = self._stats()
+        self.assertEqual(stats['calls'], 1)
+        self.assertEqual(stats['commits'], 1)
+        self.assertEqual(stats['conflicts'], 0)
+
+    def test_run_retry(self, mock_transaction):
+        mock_transaction.commit.side_effect = [ConflictError(), None]
+        f = Mock(side_effect=[ReadConflictError(), 7, 7])
+        self.assertEqual(self.runner.run('x', f), 7)
+        self.assertEqual(f.call_count, 3)
+        self.assertEqual(mock_transaction.abort.call_count, 2)
+        self.assertEqual(self.sleep.call_count, 2)
+        stats = self._stats()
+        self.assertEqual(stats['calls'], 1)
+        self.assertEqual(stats['commits'], 1)
+        self.assertEqual(stats['conflicts'], 2)
+        self.assertEqual(stats['retries'], 2)
+        self.assertEqual(stats['failures'], 0)
+
+    def test_run_retries_exhausted(self, mock_transaction):
+        mock_transaction.commit.side_effect = ConflictError()
+        f = Mock(return_value=7)
+        self.assertRaises(ConflictError, self.runner.run, 'x', f)
+        self.assertEqual(f.call_count, 4)
+        stats = self._stats()
+        self.assertEqual(stats['conflicts'], 4)
+        self.assertEqual(stats['retries'], 3)
+        self.assertEqual(stats['failures'], 1)
+        self.assertEqual(stats['commits'], 0)
+
+    def test_run_budget_exhausted(self, mock_transaction):
+        self.runner.budget = RetryBudget(ratio=0, reserve=1)
+        mock_transaction.commit.side_effect = ConflictError()
+        f = Mock(return_value=7)
+        self.assertRaises(ConflictError, self.runner.run, 'x', f)
+        self.assertEqual(f.call_count, 2)
+        stats = self._stats()
+        self.assertEqual(stats['retries'], 1)
+        self.assertEqual(stats['budget_exhausted'], 1)
+        self.assertEqual(stats['failures'], 1)
+
+    def test_run_own_commit_not_retried(self, mock_transaction):
+        # f committed part of its work, so calling it again would repeat it
+        mock_transaction.get.side_effect = [Mock(), Mock()]
+        mock_transaction.commit.side_effect = ConflictError()
+        f = Mock(return_value=7)
+        self.assertRaises(ConflictError, self.runner.run, 'x', f)
+        self.assertEqual(f.call_count, 1)
+        self.sleep.assert_not_called()
+        stats = self._stats()
+        self.assertEqual(stats['conflicts'], 1)
+        self.assertEqual(stats['retries'], 0)
+        self.assertEqual(stats['failures'], 1)
+
+    def test_run_error(self, mock_transaction):
+        f = Mock(side_effect=ValueError())
+        self.assertRaises(ValueError, self.runner.run, 'x', f)
+        mock_transaction.commit.assert_not_called()
+        self.assertEqual(self._stats()['conflicts'], 0)
+
+    def test_delay(self, mock_transaction):
+        for attempt, expect in enumerate([0.1, 0.2, 0.3, 0.3]):
+            for i in xrange(20):
+                delay = self.runner.delay(attempt)
+                self.assertGreaterEqual(delay, expect / 2)
+                self.assertLessEqual(delay, expect)
+
+
+class CreateRunnerTest(FlaskTest):
+
+    def test_create_runner(self):
+        runner = create_runner(dict(TRANSACTION_RETRIES=5,
+                                    TRANSACTION_BACKOFF=0.5,
+                                    TRANSACTION_MAX_BACKOFF=2,
+                                    TRANSACTION_RETRY_RATIO=0.1,
+                                    TRANSACTION_RETRY_RESERVE=3))
+        self.assertEqual(runner.retries, 5)
+        self.assertEqual(runner.backoff, 0.5)
+        self.assertEqual(runner.max_backoff, 2)
+        self.assertEqual(runner.budget.ratio, 0.1)
+        self.assertEqual(runner.budget.reserve, 3)
+
+    def test_get_runner(self):
+        runner = get_runner()
+        self.assertIsNot(runner, default_runner)
+        self.assertIs(get_runner(self.app), runner)
+        self.assertIs(self.app.extensions['transaction_runner'], runner)
+        self.assertEqual(runner.retries,
+                         self.app.config['TRANSACTION_RETRIES'])
+
+    def test_get_runner_no_app(self):
+        self._ctx.pop()
+        try:
+            self.assertIs(get_runner(), default_runner)
+        finally:
+            self._ctx.push()
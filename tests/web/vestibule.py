@@ -1,4 +1,5 @@
 from equanimity.vestibule import Vestibule
+from equanimity.world import World
 from server.rpc.vestibule import _get_vestibule
 from ..base import FlaskTestDB
 from users import UserTestMixin
@@ -97,6 +98,25 @@ class VestibuleTest(RPCTestBase):
         self.assertNoError(r)
         return v
 
+    def test_vestibule_status(self):
+        v = self.test_create_vestibule()
+        r = self.proxy.status(v['uid'])
+        self.assertNoError(r)
+        self.assertEqual(r['result']['status']['state'], 'open')
+        r = self.proxy.start(v['uid'])
+        self.assertNoError(r)
+        world = r['result']['world']['uid']
+        # The build starts once the request commits. Test worlds are built
+        # inline, before the request returns.
+        self.assertEqual(r['result']['status']['state'], 'building')
+        r = self.proxy.status(v['uid'])
+        self.assertNoError(r)
+        status = r['result']['status']
+        self.assertEqual(status['state'], 'ready')
+        self.assertEqual(status['world'], world)
+        self.assertEqual(status['done'], status['total'])
+        self.assertTrue(World.get(world).fields)
+
     def test_start_vestibule_already_started(self):
         v = self.test_start_vestibule()
         r = self.proxy.start(v['uid'])
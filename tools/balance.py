@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""Plays Monte Carlo balance sweeps over a process pool and reports win rates
+by element, weapon type and squad value. Interrupted sweeps resume from the
+rows already written to the output directory."""
+from common import hack_syspath
+hack_syspath(__file__)
+import argparse
+from time import time
+from equanimity.balance import run_sweep
+
+
+def get_args():
+    p = argparse.ArgumentParser()
+    p.add_argument('output', help='Directory to store the results in')
+    p.add_argument('-n', '--battles', type=int, default=10000,
+                   help='Total number of battles in the sweep')
+    p.add_argument('-p', '--processes', type=int, default=None,
+                   help='Worker processes (defaults to the CPU count)')
+    p.add_argument('--chunk-size', type=int, default=100,
+                   help='Battles handed to a worker at a time')
+    p.add_argument('--attacker', choices=('rand', 'max'), default='rand',
+                   help='Generator of the attacking squads')
+    p.add_argument('--defender', choices=('rand', 'max'), default='rand',
+                   help='Generator of the defending squads')
+    p.add_argument('--squad-size', type=int, default=4,
+                   help='Number of units in each rand squad')
+    p.add_argument('--max-value', type=int, default=255,
+                   help='Maximum value of a generated unit')
+    p.add_argument('--grid-radius', type=int, default=8,
+                   help='Radius of the battlefield grid')
+    p.add_argument('--max-actions', type=int, default=2000,
+                   help='Stop a battle after this many actions')
+    p.add_argument('--seed', type=int, default=0,
+                   help='Seed of the first battle')
+    p.add_argument('--bracket', type=int, default=64,
+                   help='Width of the squad value brackets')
+    return p.parse_args()
+
+
+def print_rates(title, rates):
+    print title
+    for key, (wins, battles) in sorted(rates.iteritems()):
+        rate = 0.
+        if battles:
+            rate = 100. * wins / battles
+        print '  {0:>8} {1:6.2f}% of {2}'.format(key, rate, battles)
+
+
+def balance(args):
+    start = time()
+    store = run_sweep(args.output, args.battles, processes=args.processes,
+                      chunk_size=args.chunk_size, attacker=args.attacker,
+                      defender=args.defender, size=args.squad_size,
+                      max_value=args.max_value, grid_radius=args.grid_radius,
+                      max_actions=args.max_actions, seed=args.seed)
+    print '{0} battles stored, {1:.2f}s'.format(store.rows, time() - start)
+    rates = store.summarize(bracket=args.bracket)
+    print_rates('Win rate by side', rates['side'])
+    print_rates('Win rate by element', rates['element'])
+    print_rates('Win rate by weapon', rates['weapon'])
+    print_rates('Win rate by squad value', rates['value'])
+
+
+if __name__ == '__main__':
+    balance(get_args())
@@ -3,6 +3,7 @@
 from common import hack_syspath
 hack_syspath(__file__)
 
+import time
 import transaction
 import random
 from argparse import ArgumentParser
@@ -40,7 +41,15 @@ def start_game(p, q):
     print 'Join vestibule'
     q.rpc('vestibule.join', id)
     print 'Start vestibule'
-    world = p.must_rpc('vestibule.start', id, timeout=60)
+    world = p.must_rpc('vestibule.start', id)
+    # The world is built in the background
+    status = world['result']['status']
+    while status['state'] == 'building':
+        print 'Building world {done}/{total}'.format(**status)
+        time.sleep(1)
+        status = p.must_rpc('vestibule.status', id)['result']['status']
+    if status['state'] != 'ready':
+        raise ValueError('World build failed: {0}'.format(status['error']))
     return world['result']['world']
 
 
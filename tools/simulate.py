@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""Plays headless battles and reports battles/sec and actions/sec."""
+from common import hack_syspath
+hack_syspath(__file__)
+import argparse
+from functools import partial
+from time import time
+from equanimity.simulator import Simulator, RandomPolicy
+from equanimity.unit_container import rand_squad
+
+
+def get_args():
+    p = argparse.ArgumentParser()
+    p.add_argument('-n', '--battles', type=int, default=100,
+                   help='Number of battles to play')
+    p.add_argument('--seed', type=int, default=0,
+                   help='Seed of the first battle')
+    p.add_argument('--squad-size', type=int, default=4,
+                   help='Number of units in each squad')
+    p.add_argument('--grid-radius', type=int, default=8,
+                   help='Radius of the battlefield grid')
+    p.add_argument('--max-actions', type=int, default=2000,
+                   help='Stop a battle after this many actions')
+    p.add_argument('--wander', action='store_true',
+                   help='Move randomly instead of towards the enemy')
+    p.add_argument('-v', '--verbose', action='store_true',
+                   help='Print the result of each battle')
+    return p.parse_args()
+
+
+def simulate(args):
+    squad = partial(rand_squad, size=args.squad_size, equip=True)
+    policy = partial(RandomPolicy, advance=not args.wander)
+    sim = Simulator(attacker=squad, defender=squad, attacker_policy=policy,
+                    defender_policy=policy, grid_radius=args.grid_radius,
+                    max_actions=args.max_actions)
+    seeds = xrange(args.seed, args.seed + args.battles)
+    actions = 0
+    start = time()
+    for result in sim.run(seeds):
+        actions += result.actions
+        if args.verbose:
+            print result.seed, result.winner, result.actions, result.condition
+    elapsed = time() - start
+    msg = '{0} battles, {1} actions in {2:.2f}s'
+    print msg.format(args.battles, actions, elapsed)
+    print '{0:.1f} battles/sec'.format(args.battles / elapsed)
+    print '{0:.1f} actions/sec'.format(actions / elapsed)
+
+
+if __name__ == '__main__':
+    simulate(get_args())